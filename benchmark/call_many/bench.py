@@ -0,0 +1,41 @@
+"""
+Compare Function.call_many with repeated calls to Function.__call__ on a
+small function, where the Python overhead of the call dominates.
+
+Usage: python bench.py [n_calls]
+
+"""
+from __future__ import print_function
+import sys
+import time
+
+import numpy
+
+import theano
+import theano.tensor as T
+
+
+def main(n_calls=100000):
+    x = T.dvector('x')
+    w = theano.shared(numpy.random.rand(10), name='w')
+    f = theano.function([x], T.tanh(T.dot(x, w)))
+    args = [(numpy.random.rand(10),) for i in range(n_calls)]
+
+    t0 = time.time()
+    expected = [f(*a) for a in args]
+    t_call = time.time() - t0
+
+    t0 = time.time()
+    results = f.call_many(args)
+    t_many = time.time() - t0
+
+    assert all(numpy.allclose(r, e) for r, e in zip(results, expected))
+    print('%d calls' % n_calls)
+    print('__call__:  %.3fs (%.2fus per call)' % (
+        t_call, 1e6 * t_call / n_calls))
+    print('call_many: %.3fs (%.2fus per call, %.2fx faster)' % (
+        t_many, 1e6 * t_many / n_calls, t_call / t_many))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,70 @@
+"""
+Time the MergeOptimizer on a large unrolled graph, with the hash-consing
+index of MergeFeature and with the previous scan of the clients of the
+first input of each node.
+
+Each step of the graph is built twice, so half of the nodes get merged.
+
+Usage: python bench.py [n_steps]
+
+"""
+from __future__ import print_function
+import sys
+import time
+
+import theano
+import theano.tensor as T
+from theano.gof.fg import FunctionGraph
+from theano.gof.opt import MergeFeature, MergeOptimizer
+
+
+class ScanMergeFeature(MergeFeature):
+    """
+    MergeFeature without the index, that scans the clients instead.
+
+    """
+    def index_key(self, node, inputs):
+        return None
+
+
+class ScanMergeOptimizer(MergeOptimizer):
+
+    def add_requirements(self, fgraph):
+        if not hasattr(fgraph, 'merge_feature'):
+            fgraph.attach_feature(ScanMergeFeature())
+
+
+def build(n_steps):
+    x = T.dvector('x')
+    w = T.dvector('w')
+    h = x
+    for i in range(n_steps):
+        # The first input of the nodes is often w, whose clients grow
+        # with the number of steps.
+        a = T.tanh(w * h + 1)
+        b = T.tanh(w * h + 1)
+        h = w + a + b
+    return FunctionGraph([x, w], [h])
+
+
+def run(optimizer, n_steps):
+    fgraph = build(n_steps)
+    n_nodes = len(fgraph.apply_nodes)
+    t0 = time.time()
+    optimizer.optimize(fgraph)
+    return n_nodes, len(fgraph.apply_nodes), time.time() - t0
+
+
+def main(n_steps=20000):
+    theano.config.compute_test_value = 'off'
+    n_before, n_index, t_index = run(MergeOptimizer(), n_steps)
+    _, n_scan, t_scan = run(ScanMergeOptimizer(), n_steps)
+
+    assert n_index == n_scan
+    print('%d steps, %d nodes merged into %d' % (n_steps, n_before, n_index))
+    print('scan:  %.3fs' % t_scan)
+    print('index: %.3fs (%.2fx faster)' % (t_index, t_scan / t_index))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
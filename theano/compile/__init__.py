@@ -27,3 +27,7 @@ from theano.compile.pfunc import pfunc, Param, rebuild_collect_shared
 from theano.compile.builders import *
 
 from theano.compile.function import function, function_dump
+
+from theano.compile.functionpool import FunctionPool
+
+from theano.compile.shapejit import ShapeJITFunction
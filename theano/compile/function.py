@@ -12,6 +12,7 @@ from six import string_types
 from theano.compile.io import In
 from theano.compile.function_module import orig_function
 from theano.compile.pfunc import pfunc
+from theano.compile.shapejit import ShapeJITFunction
 from numpy import any
 import warnings
 from theano import compat
@@ -64,7 +65,7 @@ def function_dump(filename, inputs, outputs=None, mode=None, updates=None,
 def function(inputs, outputs=None, mode=None, updates=None, givens=None,
              no_default_updates=False, accept_inplace=False, name=None,
              rebuild_strict=True, allow_input_downcast=None, profile=None,
-             on_unused_input=None):
+             on_unused_input=None, memoize=None, specialize_shapes=None):
     """
     Return a callable object that will calculate `outputs` from `inputs`.
 
@@ -114,12 +115,24 @@ def function(inputs, outputs=None, mode=None, updates=None, givens=None,
     on_unused_input
         What to do if a variable in the 'inputs' list is not used in the graph.
         Possible values are 'raise', 'warn', 'ignore' and None.
+    memoize : None or int
+        If not None, keep the outputs of the last `memoize` calls with
+        distinct input values, and return them when the function is called
+        again with the same values (see `Function.set_memoize`). Functions
+        with updates can not be memoized.
+    specialize_shapes : None, True or int
+        If not None, compile a version of the function for each new shape of
+        the tensor inputs, at most `specialize_shapes` of them (16 if True).
+        Shape computations are then constant folded and C code is generated
+        for these shapes. The function compiled for any shape remains used
+        for the other calls (see `ShapeJITFunction`).
 
     Returns
     -------
     Function instance
         A callable object that will compute the outputs (given the inputs) and
         update the implicit function arguments according to the `updates`.
+        A `ShapeJITFunction` if `specialize_shapes` is used.
 
     Notes
     -----
@@ -279,6 +292,20 @@ def function(inputs, outputs=None, mode=None, updates=None, givens=None,
                                    (hasattr(i, 'mutable') and i.mutable))):
             check_for_aliased_inputs = True
 
+    if specialize_shapes and not uses_tuple:
+        if output_keys is not None:
+            outputs = dict(zip(output_keys, outputs))
+        if specialize_shapes is True:
+            specialize_shapes = 16
+        return ShapeJITFunction(
+            inputs, outputs, specialize_shapes,
+            mode=mode, updates=updates, givens=givens,
+            no_default_updates=no_default_updates,
+            accept_inplace=accept_inplace, name=name,
+            rebuild_strict=rebuild_strict,
+            allow_input_downcast=allow_input_downcast, profile=profile,
+            on_unused_input=on_unused_input, memoize=memoize)
+
     if uses_tuple:
         # we must use old semantics in this case.
         if profile:
@@ -309,4 +336,6 @@ def function(inputs, outputs=None, mode=None, updates=None, givens=None,
     # We need to add the flag check_aliased inputs if we have any mutable or
     # borrowed used defined inputs
     fn._check_for_aliased_inputs = check_for_aliased_inputs
+    if memoize:
+        fn.set_memoize(memoize)
     return fn
@@ -5,10 +5,13 @@ Driver of graph construction, optimization, and linking.
 from __future__ import print_function
 
 import copy
+import hashlib
+import numbers
+import os
+import threading
 from six import string_types, iteritems, iterkeys
 from six.moves import xrange
 import six.moves.copyreg as copyreg
-import six.moves.cPickle as pickle
 from itertools import chain
 import time
 import warnings
@@ -17,13 +20,13 @@ import numpy
 import theano
 from theano import config, gof
 from functools import partial
-from theano.compat import izip
+from theano.compat import izip, OrderedDict
 from theano.gof import graph
 import theano.compile.mode
 from theano.compile.io import (
     In, SymbolicInput, SymbolicInputKit, SymbolicOutput)
 from theano.compile.ops import deep_copy_op, view_op
-from theano.gof.graph import is_same_graph
+from theano.compile import sharedvalue
 from theano.gof.op import ops_with_inner_function
 
 import logging
@@ -31,6 +34,9 @@ _logger = logging.getLogger('theano.compile.function_module')
 
 __docformat__ = "restructuredtext en"
 
+# The immutable values that Function.memoize uses as key as they are.
+_memo_scalar_types = (numbers.Number, numpy.generic, bytes) + string_types
+
 
 class UnusedInputError(Exception):
     """
@@ -359,9 +365,25 @@ class Function(object):
 
     """
 
+    memo = None
+    """
+    None, or an OrderedDict from a digest of the inputs to the outputs
+    computed for them, in least recently used order (see `set_memoize`).
+
+    """
+
+    reoptimized = None
+    """
+    None, or the Function compiled by `reoptimize`, whose implementation
+    replaces this one at the next call.
+
+    """
+
     def __init__(self, fn, input_storage, output_storage, indices, outputs,
                  defaults, unpack_single, return_none, output_keys, maker):
         self.fn = fn
+        # Protects the hand-off of `reoptimized` by the compilation thread.
+        self._reoptimized_lock = threading.Lock()
         self.input_storage = input_storage
         self.output_storage = output_storage
         self.indices = indices
@@ -375,6 +397,8 @@ class Function(object):
         self.name = None
         self.nodes_with_inner_function = []
         self.output_keys = output_keys
+        self.memo_size = 0
+        self._memo_version = None
 
         # We will be popping stuff off this `containers` object.  It is a copy.
         containers = list(self.input_storage)
@@ -533,6 +557,8 @@ class Function(object):
         for input in self.maker.expanded_inputs:
             if input.update is not None:
                 self.n_returned_outputs -= 1
+        self._has_updates = (self.n_returned_outputs !=
+                             len(self.output_storage))
 
         for node in self.maker.fgraph.apply_nodes:
             if node.op in ops_with_inner_function:
@@ -742,12 +768,31 @@ class Function(object):
 
         f_cpy.name = name
         f_cpy.maker.fgraph.name = name
+        if self.memo_size and not f_cpy._has_updates:
+            f_cpy.set_memoize(self.memo_size)
         return f_cpy
 
     def __call__(self, *args, **kwargs):
+        """
+        Compute the outputs of the function for the given inputs.
+
+        The keyword argument `output_subset` is a list of indices (or of
+        keys, for a function whose outputs are a dict) of the outputs to
+        compute and return; the updates are always computed. With a VM that
+        supports it (see `VM_Linker`'s allow_partial_eval), only the nodes
+        these outputs depend on are run.
+
+        """
+        if self.reoptimized is not None:
+            self._swap_reoptimized()
         profile = self.profile
         t0 = time.time()
 
+        output_subset = kwargs.pop('output_subset', None)
+        if output_subset is not None and self.output_keys is not None:
+            output_subset = [self.output_keys.index(key)
+                             for key in output_subset]
+
         # Reinitialize each container's 'provided' counter
         if self.trust_input:
             i = 0
@@ -846,35 +891,52 @@ class Function(object):
                         % getattr(self.inv_finder[c], 'variable',
                                   self.inv_finder[c]))
 
-        # Do the actual work
-        t0_fn = time.time()
-        try:
-            outputs = self.fn()
-        except Exception:
-            if hasattr(self.fn, 'position_of_error'):
-                # this is a new vm-provided function or c linker
-                # they need this because the exception manipulation
-                # done by raise_with_op is not implemented in C.
-                thunk = None
-                if hasattr(self.fn, 'thunks'):
-                    thunk = self.fn.thunks[self.fn.position_of_error]
-                gof.link.raise_with_op(
-                    node=self.fn.nodes[self.fn.position_of_error],
-                    thunk=thunk,
-                    storage_map=getattr(self.fn, 'storage_map', None))
-            else:
-                # old-style linkers raise their own exceptions
-                raise
-
-        dt_fn = time.time() - t0_fn
-        self.maker.mode.fn_time += dt_fn
-        if profile:
-            profile.vm_call_time += dt_fn
-
-        # Retrieve the values that were computed
-        if outputs is None:
-            outputs = [x.data for x in self.output_storage]
-        assert len(outputs) == len(self.output_storage)
+        memo_key = None
+        if self.memo is not None:
+            memo_key = self._memo_key()
+        if memo_key is not None and memo_key in self.memo:
+            # Move the entry to the end, as the most recently used.
+            outputs = self.memo.pop(memo_key)
+            self.memo[memo_key] = outputs
+            outputs = [copy.deepcopy(o) for o in outputs]
+            if profile:
+                profile.memo_hits += 1
+        else:
+            # Do the actual work
+            t0_fn = time.time()
+            try:
+                if (output_subset is not None and
+                        getattr(self.fn, 'partial_eval', False)):
+                    # The updates are the last outputs of the fgraph.
+                    outputs = self.fn(output_subset=list(output_subset) +
+                                      list(xrange(
+                                          len(self.maker.outputs),
+                                          len(self.maker.fgraph.outputs))))
+                    # The other outputs were not computed.
+                    memo_key = None
+                else:
+                    outputs = self.fn()
+            except Exception:
+                self._reraise_fn_error()
+
+            dt_fn = time.time() - t0_fn
+            self.maker.mode.fn_time += dt_fn
+            if profile:
+                profile.vm_call_time += dt_fn
+
+            # Retrieve the values that were computed
+            if outputs is None:
+                outputs = [x.data for x in self.output_storage]
+            assert len(outputs) == len(self.output_storage)
+
+            if memo_key is not None:
+                # Keep copies, as the caller may modify the outputs, or
+                # they may be overwritten by the next call if borrowed.
+                self.memo[memo_key] = [copy.deepcopy(o) for o in outputs]
+                if len(self.memo) > self.memo_size:
+                    self.memo.popitem(last=False)
+                if profile:
+                    profile.memo_misses += 1
 
         # Remove internal references to required inputs.
         # These cannot be re-used anyway.
@@ -901,6 +963,8 @@ class Function(object):
                     storage.data = outputs.pop()
         else:
             outputs = outputs[:self.n_returned_outputs]
+        if self._has_updates:
+            sharedvalue.shared_values_changed()
 
         # Put default values back in the storage
         for i, (required, refeed, value) in enumerate(self.defaults):
@@ -919,23 +983,290 @@ class Function(object):
         if profile:
             profile.fct_callcount += 1
             profile.fct_call_time += dt_call
+            if profile.trace_events is not None:
+                profile.trace_call(str(self.name or profile.message), t0,
+                                   t0 + dt_call)
             if hasattr(self.fn, 'update_profile'):
                 self.fn.update_profile(profile)
 
+        if output_subset is not None:
+            outputs = [outputs[i] for i in output_subset]
+
         if self.return_none:
             return None
-        elif self.unpack_single and len(outputs) == 1:
+        elif (self.unpack_single and len(outputs) == 1 and
+              output_subset is None):
             return outputs[0]
         else:
 
             if self.output_keys is not None:
 
+                if output_subset is not None:
+                    return dict((self.output_keys[i], output)
+                                for i, output in izip(output_subset, outputs))
+
                 assert len(self.output_keys) == len(outputs)
 
                 return dict(izip(self.output_keys, outputs))
 
             return outputs
 
+    def set_memoize(self, size):
+        """
+        Keep the outputs of the last `size` calls with distinct input
+        values, and return copies of them instead of computing them again
+        when the function is called with the same values. 0 disables it.
+
+        The values are identified by their dtype, shape and a digest of
+        their bytes; inputs that can not be digested (e.g. sparse matrices)
+        disable the cache for the call. The results are forgotten when the
+        value of a shared variable may have changed (see
+        `sharedvalue.shared_version`). Only `__call__` uses the cache.
+
+        Functions with updates or random number generator inputs can not
+        be memoized, as their outputs change from call to call.
+
+        """
+        if size:
+            from theano.tensor.raw_random import RandomStateType
+            if self._has_updates:
+                raise ValueError("Can not memoize a function with updates.")
+            if any(isinstance(i.variable.type, RandomStateType)
+                   for i in self.maker.inputs):
+                raise ValueError("Can not memoize a function that uses a "
+                                 "random state.")
+            self.memo = OrderedDict()
+        else:
+            self.memo = None
+        self.memo_size = size
+        self._memo_version = sharedvalue.shared_version
+
+    def _memo_key(self):
+        """
+        Return a key identifying the current values of the inputs, or None
+        if one of them can not be digested.
+
+        """
+        if self._memo_version != sharedvalue.shared_version:
+            if any(c.implicit for c in self.input_storage):
+                self.memo.clear()
+            self._memo_version = sharedvalue.shared_version
+        key = []
+        for c in self.input_storage:
+            if c.implicit:
+                continue
+            value = c.storage[0]
+            if isinstance(value, numpy.ndarray):
+                if value.dtype.hasobject:
+                    return None
+                key.append((value.dtype.str, value.shape, hashlib.md5(
+                    numpy.ascontiguousarray(value)).digest()))
+            elif isinstance(value, _memo_scalar_types):
+                key.append((type(value), value))
+            else:
+                # Other objects may be modified in place and are often
+                # hashed by identity.
+                return None
+        return tuple(key)
+
+    def _reraise_fn_error(self):
+        """
+        Re-raise the exception raised by self.fn, annotated with the node
+        that caused it.
+
+        """
+        if hasattr(self.fn, 'position_of_error'):
+            # this is a new vm-provided function or c linker
+            # they need this because the exception manipulation
+            # done by raise_with_op is not implemented in C.
+            thunk = None
+            if hasattr(self.fn, 'thunks'):
+                thunk = self.fn.thunks[self.fn.position_of_error]
+            gof.link.raise_with_op(
+                node=self.fn.nodes[self.fn.position_of_error],
+                thunk=thunk,
+                storage_map=getattr(self.fn, 'storage_map', None))
+        else:
+            # old-style linkers raise their own exceptions
+            raise
+
+    def call_many(self, args_list):
+        """
+        Call the function on each tuple of positional arguments of
+        `args_list`, and return the list of the results.
+
+        This gives the same results as ``[self(*args) for args in
+        args_list]``, but the bookkeeping that does not depend on the values
+        of the arguments is done once for all the calls:
+
+        - the number of arguments and the missing inputs are checked once;
+        - an argument that is a numpy array of the same class, dtype and
+          number of dimensions as the one given at the same position in the
+          first call (and with the right broadcastable dimensions) is used
+          without calling ``type.filter``;
+        - the inputs that may share memory are only looked for if the
+          function destroys some of its inputs;
+        - the profile is updated once.
+
+        Parameters
+        ----------
+        args_list
+            Iterable of tuples of positional arguments.
+
+        Returns
+        -------
+        list
+            The results of the calls, in the format returned by __call__.
+
+        """
+        if self.reoptimized is not None:
+            self._swap_reoptimized()
+        profile = self.profile
+        t0 = time.time()
+        results = []
+        n_args = None
+        check_aliased = (
+            not self.trust_input and
+            getattr(self, '_check_for_aliased_inputs', True) and
+            any(inp.mutable for inp in self.maker.inputs))
+        need_update = getattr(self.fn, 'need_update_inputs', True)
+        clear_outputs = getattr(self.fn, 'allow_gc', False)
+        if need_update:
+            updated = [(inp, storage) for inp, storage in
+                       reversed(list(zip(self.maker.expanded_inputs,
+                                         self.input_storage)))
+                       if inp.update is not None]
+        refeeds = [(i, value) for i, (required, refeed, value)
+                   in enumerate(self.defaults) if refeed]
+        vm_time = 0.0
+        n_calls = 0
+
+        try:
+            for args in args_list:
+                if n_args is None:
+                    # First call: check the arguments as __call__ does.
+                    n_args = len(args)
+                    if n_args > len(self.input_storage):
+                        raise TypeError("Too many parameter passed to theano "
+                                        "function")
+                    for i, c in enumerate(self.input_storage):
+                        if i >= n_args and c.required:
+                            raise TypeError(
+                                "Missing required input: %s" %
+                                getattr(self.inv_finder[c], 'variable',
+                                        self.inv_finder[c]))
+                        if i < n_args and c.implicit:
+                            raise TypeError(
+                                'Tried to provide value for implicit input: %s'
+                                % getattr(self.inv_finder[c], 'variable',
+                                          self.inv_finder[c]))
+                    fast_types = [None] * n_args
+                elif len(args) != n_args:
+                    raise TypeError("All the calls to call_many must have the "
+                                    "same number of arguments")
+
+                for i, arg in enumerate(args):
+                    s = self.input_storage[i]
+                    fast = fast_types[i]
+                    if (fast is not None and type(arg) is numpy.ndarray and
+                            arg.dtype == fast[0] and arg.ndim == fast[1] and
+                            arg.flags.aligned and
+                            all(arg.shape[j] == 1 for j in fast[2])):
+                        s.storage[0] = arg
+                    elif arg is None or self.trust_input:
+                        s.storage[0] = arg
+                    else:
+                        try:
+                            s.storage[0] = s.type.filter(
+                                arg, strict=s.strict,
+                                allow_downcast=s.allow_downcast)
+                        except Exception as e:
+                            function_name = "theano function"
+                            if self.name:
+                                function_name += (' with name "' +
+                                                  self.name + '" ')
+                            e.args = ("Bad input argument to " +
+                                      function_name +
+                                      " at index %d(0-based)" % i,) + e.args
+                            raise
+                        if (n_calls == 0 and s.storage[0] is arg and
+                                type(arg) is numpy.ndarray and
+                                hasattr(s.type, 'broadcastable')):
+                            # The filter accepted this array as it is, so it
+                            # will accept the next ones that look the same.
+                            fast_types[i] = (
+                                arg.dtype, arg.ndim,
+                                [j for j, b in enumerate(s.type.broadcastable)
+                                 if b])
+                if check_aliased:
+                    values = [c.storage[0] for c in self.input_storage]
+                    for i in xrange(1, len(values)):
+                        i_type = self.maker.inputs[i].variable.type
+                        if not hasattr(i_type, 'may_share_memory'):
+                            continue
+                        if any(self.maker.inputs[j].variable.type is i_type and
+                               i_type.may_share_memory(values[j], values[i])
+                               for j in xrange(i)):
+                            self.input_storage[i].storage[0] = copy.copy(
+                                values[i])
+
+                t0_fn = time.time()
+                try:
+                    outputs = self.fn()
+                except Exception:
+                    self._reraise_fn_error()
+                vm_time += time.time() - t0_fn
+                n_calls += 1
+
+                if outputs is None:
+                    outputs = [x.data for x in self.output_storage]
+                if clear_outputs:
+                    for o_container, o_variable in zip(
+                            self.output_storage, self.maker.fgraph.outputs):
+                        if o_variable.owner is not None:
+                            o_container.storage[0] = None
+                if need_update:
+                    for input, storage in updated:
+                        storage.data = outputs.pop()
+                else:
+                    outputs = outputs[:self.n_returned_outputs]
+                for i, value in refeeds:
+                    if isinstance(value, gof.Container):
+                        value = value.storage[0]
+                    self[i] = value
+
+                if self.return_none:
+                    results.append(None)
+                elif self.unpack_single and len(outputs) == 1:
+                    results.append(outputs[0])
+                elif self.output_keys is not None:
+                    results.append(dict(izip(self.output_keys, outputs)))
+                else:
+                    results.append(outputs)
+        finally:
+            # Remove internal references to required inputs.
+            for c in self.input_storage:
+                if c.required:
+                    c.storage[0] = None
+            # The calls done before an error may have updated shared
+            # variables.
+            if self._has_updates and n_calls:
+                sharedvalue.shared_values_changed()
+
+        dt_call = time.time() - t0
+        self.maker.mode.fn_time += vm_time
+        self.maker.mode.call_time += dt_call
+        if profile:
+            profile.vm_call_time += vm_time
+            profile.fct_callcount += n_calls
+            profile.fct_call_time += dt_call
+            if profile.trace_events is not None:
+                profile.trace_call(str(self.name or profile.message), t0,
+                                   t0 + dt_call)
+            if hasattr(self.fn, 'update_profile'):
+                self.fn.update_profile(profile)
+        return results
+
     value = property(
         lambda self: self._value,
         None,  # this property itself is not settable
@@ -946,6 +1277,87 @@ class Function(object):
         doc=("dictionary-like access to the containers associated with "
              "Variables"))
 
+    def reoptimize(self, mode=None, background=True):
+        """
+        Compile the graph of this function again, and use the result for
+        the next calls.
+
+        This is meant for a function compiled quickly with a time budget
+        (see `Mode`): a fully optimized version replaces it once ready. The
+        new version shares the input storage of this function, so the
+        values of its inputs and shared variables are kept.
+
+        Parameters
+        ----------
+        mode
+            The mode to use. By default, the mode of this function without
+            time budget.
+        background
+            If True, compile in a new thread and return it. The function
+            keeps using the current version until the compilation is
+            done. Otherwise, compile now and return None.
+
+        Notes
+        -----
+        Compiling in a thread changes some Theano flags while the graph is
+        optimized, as any compilation does, which other compilations made
+        at the same time in other threads also see.
+
+        """
+        maker = self.maker
+        if mode is None:
+            mode = maker.mode.clone()
+            mode.time_budget = 0
+        profile = maker.profile
+        if getattr(mode, 'profile', None) is not None:
+            profile = None
+        input_storage = list(self.input_storage)
+
+        def compile():
+            try:
+                new_maker = FunctionMaker(
+                    maker.inputs, maker.orig_outputs, mode,
+                    accept_inplace=maker.accept_inplace,
+                    function_builder=maker.function_builder,
+                    profile=profile, on_unused_input='ignore',
+                    output_keys=maker.output_keys)
+                new = new_maker.create(input_storage)
+                with self._reoptimized_lock:
+                    self.reoptimized = new
+            except Exception:
+                if not background:
+                    raise
+                _logger.warning('Failed to reoptimize the function %s, '
+                                'keeping the current version.', self.name,
+                                exc_info=True)
+
+        if not background:
+            compile()
+            self._swap_reoptimized()
+            return None
+        thread = threading.Thread(target=compile)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _swap_reoptimized(self):
+        """
+        Use the implementation of self.reoptimized from now on.
+
+        """
+        with self._reoptimized_lock:
+            new = self.reoptimized
+            self.reoptimized = None
+        if new is None:
+            # Another thread swapped it.
+            return
+        # The input containers are the same, only the computation and the
+        # output storage change.
+        self.fn = new.fn
+        self.output_storage = new.output_storage
+        self.maker = new.maker
+        self.nodes_with_inner_function = new.nodes_with_inner_function
+
     def free(self):
         """
         When allow_gc = False, clear the Variables in storage_map
@@ -1186,177 +1598,34 @@ class FunctionMaker(object):
             raise TypeError("Unknown output type: %s (%s)", type(output),
                             output)
 
+    @staticmethod
+    def _module_cache_stats():
+        """
+        Return a copy of the stats of the C module cache, without creating
+        the cache if it was not used yet.
+
+        """
+        cache = theano.gof.cmodule._module_cache
+        if cache is None:
+            return [0, 0, 0]
+        return list(cache.stats)
+
     def optimize_graph_with_cache(self, optimizer, inputs, outputs):
-        # This function is not finished
-        from theano.gof.compilelock import get_lock, release_lock
-        import os.path
-
-        graph_db_file = os.path.join(theano.config.compiledir,
-                                     'optimized_graphs.pkl')
-
-        # the inputs, outputs, and size of the graph to be optimized
-        inputs_new = [inp.variable for inp in inputs]
-        outputs_new = [out.variable for out in outputs]
-        size_new = len(self.fgraph.apply_nodes)
-        get_lock()
-        # Beginning of cache optimizations.
-        # Could be refactored in different functions.
-
-        def load_graph_db():
-            if os.path.isfile(graph_db_file):
-                print('graph_db already exists')
-            else:
-                # create graph_db
-                f = open(graph_db_file, 'wb')
-                print('create new graph_db in %s' % graph_db_file)
-                # file needs to be open and closed for every pickle
-                f.close()
-            # load the graph_db dictionary
-            try:
-                f = open(graph_db_file, 'rb')
-                # Temporary hack to allow
-                # theano.scan_module.tests.test_scan.T_Scan to
-                # finish. Should be changed in definitive version.
-                tmp = theano.config.unpickle_function
-                theano.config.unpickle_function = False
-                graph_db = pickle.load(f)
-
-                # hack end
-                f.close()
-                print('graph_db loaded and it is not empty')
-            except EOFError as e:
-                # the file has nothing in it
-                print(e)
-                print('graph_db loaded and it is empty')
-                graph_db = {}
-            finally:
-                theano.config.unpickle_function = tmp
-
-            return graph_db
-
-        def find_same_graph_in_db(graph_db):
-            # If found_graph_in_db is None, then need to optimize.
-            # Otherwise, return the graph found.
-            found_graph_in_db = None
-            # The sole purpose of this loop is to set 'need_optimize' by
-            # going through graph_db, looking for graph that has the same
-            # computation performed.
-            for graph_old, graph_optimized in iteritems(graph_db):
-                inputs_old = graph_old.inputs
-                outputs_old = graph_old.outputs
-                size_old = len(graph_old.apply_nodes)
-                # Some heuristics to check is the same graphs have
-                # already been optimized before.
-                if len(inputs_new) != len(inputs_old):
-                    # If the inputs are of different size,
-                    # two graphs are for sure different
-                    print('need to optimize, because input size is different')
-                    continue
-                elif len(outputs_new) != len(outputs_old):
-                    # If the inputs are of different size,
-                    # two graphs are for sure different
-                    print('need to optimize, because output size is different')
-                    continue
-                elif not all(input_new.type == input_old.type
-                             for input_new, input_old in
-                             zip(inputs_new, inputs_old)):
-                    print('need to optimize, because inputs are of different '
-                          'types')
-                    continue
-                elif not all(output_new.type == output_old.type
-                             for output_new, output_old in
-                             zip(outputs_new, outputs_old)):
-                    print('need to optimize, because outputs are of different '
-                          'types')
-                    continue
-                elif not size_old == size_new:
-                    print('need to optimize, because numbers of nodes in graph'
-                          ' are different')
-                    continue
-                else:
-                    flags = []
-                    for i, (output_new, output_old) in enumerate(
-                            zip(outputs_new, outputs_old)):
-                        print('loop through outputs node for both graphs')
-                        graph_old.variables = set(gof.graph.variables(
-                            graph_old.inputs, graph_old.outputs))
-
-                        # using clone allowed to avoid a lot of errors
-                        # deep copy seemed to had.
-                        f2 = graph_old.clone(check_integrity=False)
-                        t1 = output_new
-                        t2 = f2.outputs[i]
-
-                        # Used to remove "already used by another graph error
-                        def removeAllFgraph(remove):
-                            if hasattr(remove, 'fgraph'):
-                                del remove.fgraph
-                            if hasattr(remove, 'owner'):
-                                if remove.owner is None:
-                                    pass
-                                else:
-                                    if hasattr(remove.owner, 'fgraph'):
-                                        del remove.owner.fgraph
-                                    if hasattr(remove.owner, 'inputs'):
-                                        remove.owner.inputs = [removeAllFgraph(
-                                            i) for i in remove.owner.inputs]
-                                        for o in remove.owner.outputs:
-                                            if hasattr(o, 'fgraph'):
-                                                del o.fgraph
-                            return remove
-
-                        t2 = removeAllFgraph(t2)
-
-                        givens = dict(izip(gof.graph.inputs([t1]),
-                                           gof.graph.inputs([t2])))
-
-                        temp = dict(izip(gof.graph.inputs([t1]),
-                                         gof.graph.inputs([t2])))
-
-                        # hack to remove inconstent entry in givens
-                        # seems to work that but source of inconsistency
-                        # could be worth investigating.
-                        for key, value in iteritems(temp):
-                            if key.type != value.type:
-                                del givens[key]
-
-                        flag = is_same_graph(t1, t2, givens=givens)
-
-                        flags.append(flag)
-
-                    is_same = all(flags)
-                    if is_same:
-                        # found the match
-                        print('found a match, no need to optimize')
-                        found_graph_in_db = graph_optimized
-                        break
-            return found_graph_in_db
-
-        graph_db = load_graph_db()
-        print('loaded graph_db from %s, size=%d' % (graph_db_file,
-                                                    len(graph_db)))
-        found_graph = find_same_graph_in_db(graph_db)
-        if found_graph:
-            self.fgraph = found_graph
-            optimizer_profile = None
-        else:
-            # this is a brand new graph, optimize it, save it to graph_db
-            print('graph not found in graph_db, optimizing the graph')
-            self.fgraph.variables = set(gof.graph.variables(
-                self.fgraph.inputs, self.fgraph.outputs))
-            # check_integrity parameters was added to ignore
-            # "excess cached variables" errors. Works that way
-            # but once again the error couldbe worth
-            # investigating.
-            before_opt = self.fgraph.clone(check_integrity=False)
-            optimizer_profile = optimizer(self.fgraph)
-            graph_db.update({before_opt: self.fgraph})
-            f = open(graph_db_file, 'wb')
-            pickle.dump(graph_db, f, -1)
-            f.close()
-            print('new graph saved into graph_db')
-        release_lock()
-        return optimizer_profile
+        """
+        Optimize self.fgraph, reusing the result of a previous optimization
+        of a graph with the same structure if there is one.
+
+        Returns
+        -------
+        object
+            The profile returned by the optimizer, or None if the optimized
+            graph came from the cache.
+
+        """
+        from theano.compile.optcache import OptimizationCache
+        cache = OptimizationCache(os.path.join(theano.config.compiledir,
+                                               'optimized_graphs'))
+        return cache.optimize(optimizer, self.fgraph, inputs, outputs)
 
     def __init__(self, inputs, outputs,
                  mode=None, accept_inplace=False, function_builder=Function,
@@ -1401,6 +1670,11 @@ class FunctionMaker(object):
         # Wrap them in In or Out instances if needed.
         inputs = [self.wrap_in(i) for i in inputs]
         outputs = [self.wrap_out(o) for o in outputs]
+        if getattr(mode.linker, 'buffer_pool', False):
+            # The linker recycles the buffers and returns the outputs
+            # without copying them (see VM_Linker).
+            outputs = [SymbolicOutput(o.variable, borrow=True)
+                       for o in outputs]
         _inputs = gof.graph.inputs([o.variable for o in outputs] +
                                    [i.update for i in inputs
                                     if getattr(i, 'update', False)])
@@ -1418,9 +1692,12 @@ class FunctionMaker(object):
             need_opt = True
             # make the fgraph (copies the graph, creates NEW INPUT AND
             # OUTPUT VARIABLES)
+            start_clone = time.time()
             fgraph, additional_outputs = std_fgraph(inputs, outputs,
                                                     accept_inplace)
             fgraph.profile = profile
+            if profile:
+                profile.clone_time += time.time() - start_clone
         else:
             # fgraph is already an optimized one
             need_opt = False
@@ -1431,6 +1708,9 @@ class FunctionMaker(object):
 
         # Fetch the optimizer and linker
         optimizer, linker = mode.optimizer, copy.copy(mode.linker)
+        # True if the interruptible optimizations were stopped by the
+        # time budget (see Mode).
+        self.optimizer_interrupted = False
         if need_opt:
             compute_test_value_orig = theano.config.compute_test_value
             limit_orig = theano.config.traceback.limit
@@ -1441,9 +1721,23 @@ class FunctionMaker(object):
                     theano.config.compute_test_value_opt
                 theano.config.traceback.limit = 0
                 start_optimizer = time.time()
+                time_budget = getattr(mode, 'time_budget', None)
+                if time_budget is None:
+                    time_budget = theano.config.optimizer_time_budget
 
                 # now optimize the graph
-                if theano.config.cache_optimizations:
+                if time_budget:
+                    # Do not cache a graph that may not be fully optimized.
+                    fgraph.optimizer_deadline = start_optimizer + time_budget
+                    try:
+                        optimizer_profile = optimizer(fgraph)
+                    finally:
+                        del fgraph.optimizer_deadline
+                    self.optimizer_interrupted = getattr(
+                        fgraph, 'optimizer_interrupted', False)
+                    if self.optimizer_interrupted:
+                        del fgraph.optimizer_interrupted
+                elif theano.config.cache_optimizations:
                     optimizer_profile = self.optimize_graph_with_cache(
                         optimizer, inputs, outputs)
                 else:
@@ -1453,6 +1747,9 @@ class FunctionMaker(object):
                 opt_time = end_optimizer - start_optimizer
                 if profile:
                     profile.optimizer_time += opt_time
+                    profile.optimizer_phases.extend(
+                        theano.compile.profiling.optimizer_phases(
+                            optimizer, optimizer_profile, opt_time))
                     if theano.config.profile_optimizer:
                         profile.optimizer_profile = (optimizer,
                                                      optimizer_profile)
@@ -1624,6 +1921,10 @@ class FunctionMaker(object):
         # Get a function instance
         start_linker = time.time()
         start_import_time = theano.gof.cmodule.import_time
+        start_code_gen_time = theano.gof.cc.code_gen_time
+        start_cxx_time = theano.gof.cmodule.cxx_time
+        start_cxx_calls = theano.gof.cmodule.cxx_calls
+        start_cache_stats = self._module_cache_stats()
         limit_orig = theano.config.traceback.limit
         try:
             theano.config.traceback.limit = 0
@@ -1639,8 +1940,23 @@ class FunctionMaker(object):
         if self.profile:
             self.profile.linker_time += linker_time
             _fn.time_thunks = self.profile.flag_time_thunks
+            if self.profile.trace_events is not None:
+                _fn.trace = self.profile.trace_events
             import_time = theano.gof.cmodule.import_time - start_import_time
             self.profile.import_time += import_time
+            self.profile.code_gen_time += (theano.gof.cc.code_gen_time -
+                                           start_code_gen_time)
+            self.profile.cxx_time += (theano.gof.cmodule.cxx_time -
+                                      start_cxx_time)
+            self.profile.cxx_calls += (theano.gof.cmodule.cxx_calls -
+                                       start_cxx_calls)
+            cache_stats = self._module_cache_stats()
+            # stats is [in memory, loaded from disk, compiled].
+            self.profile.c_cache_hits += (
+                cache_stats[0] + cache_stats[1] -
+                start_cache_stats[0] - start_cache_stats[1])
+            self.profile.c_cache_misses += (cache_stats[2] -
+                                            start_cache_stats[2])
 
         fn = self.function_builder(_fn, _i, _o, self.indices, self.outputs,
                                    defaults, self.unpack_single,
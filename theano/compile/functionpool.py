@@ -0,0 +1,119 @@
+"""
+Pool of copies of a Theano function, to call it from several threads.
+
+"""
+from __future__ import print_function
+import threading
+import weakref
+from multiprocessing.pool import ThreadPool
+
+
+class FunctionPool(object):
+    """
+    Hand out one instance of a compiled function per thread.
+
+    A `Function` owns its input, output and intermediate storage, so it can
+    not be called by several threads at the same time. The pool gives each
+    thread its own copy (see `Function.copy`). The copies share the graph,
+    the compiled C modules and the shared variables of the original
+    function, but have their own storage.
+
+    The thunks that release the GIL (e.g. BLAS calls) of calls made from
+    different threads can run at the same time. The calls of a function
+    that updates shared variables are serialized, so that no update is
+    lost.
+
+    Parameters
+    ----------
+    fn
+        The compiled `Function`. It is used by the first thread that calls
+        the pool, and given to another thread once that one is gone.
+    n_workers
+        Number of threads that run the calls made with `submit`. They are
+        started on the first call to `submit`.
+
+    Examples
+    --------
+    >>> pool = FunctionPool(theano.function([x], y), n_workers=4)
+    >>> futures = [pool.submit(value) for value in values]
+    >>> results = [future.get() for future in futures]
+
+    """
+
+    def __init__(self, fn, n_workers=4):
+        self.fn = fn
+        self.n_workers = n_workers
+        self.instances = weakref.WeakKeyDictionary()
+        """
+        Maps the threads that called the pool to their instance. The
+        instance of a thread is released with it.
+
+        """
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._workers = None
+        if any(inp.update is not None for inp in fn.maker.inputs):
+            self._call_lock = threading.Lock()
+        else:
+            self._call_lock = None
+
+    def get(self):
+        """
+        Return the instance of the function of the calling thread.
+
+        """
+        fn = getattr(self._local, 'fn', None)
+        if fn is None:
+            with self._lock:
+                if any(inst is self.fn
+                       for inst in list(self.instances.values())):
+                    fn = self.fn.copy()
+                else:
+                    fn = self.fn
+                self.instances[threading.current_thread()] = fn
+            self._local.fn = fn
+        return fn
+
+    def __call__(self, *args, **kwargs):
+        """
+        Call the function in the calling thread.
+
+        """
+        fn = self.get()
+        if self._call_lock is None:
+            return fn(*args, **kwargs)
+        with self._call_lock:
+            return fn(*args, **kwargs)
+
+    def submit(self, *args, **kwargs):
+        """
+        Call the function in one of the worker threads of the pool.
+
+        Returns
+        -------
+        multiprocessing.pool.AsyncResult
+            Its ``get()`` method waits for the call to finish and returns its
+            result, or raises the exception it raised.
+
+        """
+        with self._lock:
+            if self._workers is None:
+                self._workers = ThreadPool(self.n_workers)
+        return self._workers.apply_async(self, args, kwargs)
+
+    def close(self):
+        """
+        Wait for the calls made with `submit` and stop the worker threads.
+
+        """
+        with self._lock:
+            workers, self._workers = self._workers, None
+        if workers is not None:
+            workers.close()
+            workers.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -10,7 +10,7 @@ import numpy
 import theano
 from theano import gof
 import theano.gof.vm
-from theano.configparser import config, AddConfigVar, StrParam
+from theano.configparser import config, AddConfigVar, StrParam, FloatParam
 from theano.compile.ops import _output_guard
 from six import string_types
 
@@ -32,6 +32,12 @@ AddConfigVar('optimizer_requiring',
               "these tags. Separate tags with ':'."),
              StrParam("", allow_override=False),
              in_c_key=False)
+AddConfigVar('optimizer_time_budget',
+             ("Number of seconds after which the optimization of a function "
+              "skips the optimizations that are not needed for a correct "
+              "graph. 0 means no limit. A Mode can override it."),
+             FloatParam(0, lambda i: i >= 0),
+             in_c_key=False)
 
 
 def check_equal(x, y):
@@ -196,7 +202,7 @@ optdb.register('merge1', gof.MergeOptimizer(),
                0, 'fast_run', 'fast_compile', 'merge')
 
 # rearranges elemwise expressions
-optdb.register('canonicalize', gof.EquilibriumDB(),
+optdb.register('canonicalize', gof.EquilibriumDB(interruptible=True),
                1, 'fast_run', 'fast_compile')
 
 optdb.register('merge1.2', gof.MergeOptimizer(),
@@ -206,6 +212,7 @@ optdb.register('Print1.21', PrintCurrentFunctionGraph('Post-canonicalize'),
                1.21,)  # 'fast_run', 'fast_compile')
 
 # replace unstable subgraphs
+# Not interruptible: without it, some results could be inf or nan.
 optdb.register('stabilize', gof.EquilibriumDB(),
                1.5, 'fast_run')
 
@@ -217,7 +224,7 @@ optdb.register('specialize', gof.EquilibriumDB(),
                2, 'fast_run', 'fast_compile_gpu')
 
 # misc special cases for speed that break canonicalization
-optdb.register('uncanonicalize', gof.EquilibriumDB(),
+optdb.register('uncanonicalize', gof.EquilibriumDB(interruptible=True),
                3, 'fast_run')
 
 # misc special cases for speed that are dependent on the device.
@@ -248,6 +255,14 @@ class Mode(object):
     linker : a structure of type Linker
         A Linker decides which implementations to use (C or Python, for example)
         and how to string them together to perform the computation.
+    time_budget : float or None
+        Number of seconds after which the optimization of a function stops
+        the interruptible passes of the optimizer (the EquilibriumDB
+        registered with interruptible=True, like canonicalize and
+        uncanonicalize). The other passes, like stabilize, specialize and
+        the inplace optimizations, still run. 0 means no limit, None means
+        config.optimizer_time_budget. See `Function.reoptimize` to get the
+        fully optimized version later.
 
     See Also
     --------
@@ -257,12 +272,13 @@ class Mode(object):
 
     """
 
-    def __init__(self, linker=None, optimizer='default'):
+    def __init__(self, linker=None, optimizer='default', time_budget=None):
         if linker is None:
             linker = config.linker
         if optimizer is 'default':
             optimizer = config.optimizer
         Mode.__setstate__(self, (linker, optimizer))
+        self.time_budget = time_budget
 
         # self.provided_optimizer - typically the `optimizer` arg.
         # But if the `optimizer` arg is keyword corresponding to a predefined
@@ -371,6 +387,7 @@ class Mode(object):
             optimizer = self.provided_optimizer
         new_mode = type(self)(linker=new_linker,
                               optimizer=optimizer)
+        new_mode.time_budget = getattr(self, 'time_budget', None)
         return new_mode
 
 
@@ -0,0 +1,372 @@
+"""
+Persistent cache of optimized graphs.
+
+When `config.cache_optimizations` is True, `FunctionMaker` looks up the graph
+it is about to optimize in this cache. Graphs are identified by a structural
+key that does not depend on variable names or identities, so rebuilding the
+same model in another process finds the graph optimized by the first one.
+
+Each entry is stored in its own file, named after its key, in the
+``optimized_graphs`` directory of the compiledir. Entries are written to a
+temporary file that is then renamed, so they can be read without holding the
+compilation lock. An append-only index records the size of each entry; when
+the total goes over `config.cache_optimizations_max_size`, the least recently
+used entries are removed.
+
+"""
+from __future__ import print_function
+
+import hashlib
+import logging
+import os
+import re
+import tempfile
+
+import six.moves.cPickle as pickle
+from six import BytesIO, StringIO, b
+
+import theano
+from theano import config, gof
+from theano.compat import decode
+from theano.gof import graph
+from theano.gof.cmodule import _rename
+from theano.gof.compilelock import lock_ctx
+from theano.gof.op import ops_with_inner_function
+
+_logger = logging.getLogger('theano.compile.optcache')
+
+# Increase this when the format of the entries or of the key changes.
+CACHE_VERSION = 1
+
+
+def _signature(obj, memo):
+    """
+    Return a string identifying the state of `obj` (an Op or a Type).
+
+    Two objects with the same pickled state compute the same thing. The
+    result is memoized by id, as the same Op instance is often used by many
+    nodes.
+
+    """
+    sig = memo.get(id(obj))
+    if sig is None:
+        sig = hashlib.md5(pickle.dumps(obj, -1)).hexdigest()
+        memo[id(obj)] = sig
+    return sig
+
+
+def optimizer_signature(optimizer):
+    """
+    Return a string describing the optimizations done by `optimizer`.
+
+    It is built from the optimizer summary, without the object ids that
+    change from one process to the next.
+
+    """
+    stream = StringIO()
+    optimizer.print_summary(stream)
+    summary = stream.getvalue()
+    summary = re.sub(r' id=\d+| at 0x[0-9a-fA-F]+| \(\d+\)', '', summary)
+    return hashlib.md5(b(summary)).hexdigest()
+
+
+def graph_key(fgraph, input_specs, output_specs, optimizer):
+    """
+    Return the key of `fgraph` in the optimization cache.
+
+    The key is a hash of the graph structure: the ops, the types and the
+    connections between the nodes, the value of the constants, the input
+    and output specifications and the optimizer. Variable names are not
+    taken into account.
+
+    Returns
+    -------
+    str or None
+        None if the graph can not be cached, e.g. because it contains an op
+        with an inner compiled function.
+
+    """
+    if not hasattr(optimizer, 'print_summary'):
+        return None
+    memo = {}
+    tokens = {}
+    lines = ['version %d' % CACHE_VERSION,
+             'theano %s' % theano.__version__,
+             'config %s' % theano.configparser.get_config_md5(),
+             'optimizer %s' % optimizer_signature(optimizer)]
+    for i, (spec, var) in enumerate(zip(input_specs, fgraph.inputs)):
+        tokens[var] = 'i%d' % i
+        lines.append('input %s %s %s' % (_signature(var.type, memo),
+                                         bool(spec.mutable),
+                                         bool(spec.borrow)))
+
+    # Number the nodes in depth-first order from the outputs, following
+    # their inputs in order. Unlike fgraph.toposort(), this order only
+    # depends on the structure of the graph.
+    try:
+        n_nodes = 0
+        stack = [(var, False) for var in reversed(fgraph.outputs)]
+        while stack:
+            var, expanded = stack.pop()
+            if var in tokens:
+                continue
+            node = var.owner
+            if node is None:
+                if not isinstance(var, graph.Constant):
+                    return None
+                tokens[var] = 'c' + hashlib.md5(pickle.dumps(
+                    (var.type, var.data), -1)).hexdigest()
+                continue
+            if not expanded:
+                stack.append((var, True))
+                stack.extend((inp, False) for inp in reversed(node.inputs))
+                continue
+            if type(node.op) in ops_with_inner_function:
+                return None
+            for i, out in enumerate(node.outputs):
+                tokens[out] = 'n%d.%d' % (n_nodes, i)
+            lines.append('node %s %s %s' % (
+                _signature(node.op, memo),
+                ','.join(tokens[inp] for inp in node.inputs),
+                ','.join(_signature(out.type, memo)
+                         for out in node.outputs)))
+            n_nodes += 1
+    except Exception as e:
+        _logger.debug('Graph not cached, it can not be pickled: %s', e)
+        return None
+
+    lines.append('outputs %s' % ','.join(tokens[out]
+                                         for out in fgraph.outputs))
+    lines.append('borrow %s' % ','.join(str(bool(spec.borrow))
+                                        for spec in output_specs))
+    lines.append('updates %s' % sorted(fgraph.update_mapping.items()))
+    return hashlib.md5(b('\n'.join(lines))).hexdigest()
+
+
+class OptimizationCache(object):
+    """
+    Directory of optimized graphs.
+
+    Parameters
+    ----------
+    dirname
+        Directory holding the entries. It is created if needed.
+
+    """
+
+    header = 'theano optimization cache index %d' % CACHE_VERSION
+
+    def __init__(self, dirname):
+        self.dirname = dirname
+        self.index_filename = os.path.join(dirname, 'index')
+
+    def entry_filename(self, key):
+        return os.path.join(self.dirname, key + '.pkl')
+
+    def load(self, key, fgraph):
+        """
+        Return the optimized outputs stored under `key`, built on the inputs
+        of `fgraph`, or None if there is no such entry.
+
+        """
+        filename = self.entry_filename(key)
+        try:
+            with open(filename, 'rb') as f:
+                unpickler = pickle.Unpickler(f)
+                unpickler.persistent_load = (
+                    lambda pid: fgraph.inputs[int(pid)])
+                version, entry_key, outputs = unpickler.load()
+        except IOError:
+            return None
+        except Exception as e:
+            _logger.warning('Ignoring the corrupted entry %s of the '
+                            'optimization cache: %s', filename, e)
+            return None
+        if (version != CACHE_VERSION or entry_key != key or
+                len(outputs) != len(fgraph.outputs) or
+                not all(new.type == old.type
+                        for new, old in zip(outputs, fgraph.outputs))):
+            return None
+        try:
+            # Mark the entry as recently used.
+            os.utime(filename, None)
+        except OSError:
+            pass
+        return outputs
+
+    def store(self, key, fgraph):
+        """
+        Save the outputs of the optimized `fgraph` under `key`.
+
+        Returns
+        -------
+        bool
+            Whether the entry was saved.
+
+        """
+        # Clone the optimized graph, except its inputs: they are saved as
+        # references to the inputs of the graph that loads the entry.
+        equiv = dict((inp, inp) for inp in fgraph.inputs)
+        equiv = graph.clone_get_equiv(fgraph.inputs, fgraph.outputs,
+                                      memo=equiv)
+        outputs = [equiv[out] for out in fgraph.outputs]
+        input_ids = dict((id(inp), str(i))
+                         for i, inp in enumerate(fgraph.inputs))
+        buf = BytesIO()
+        pickler = pickle.Pickler(buf, -1)
+        pickler.persistent_id = lambda obj: input_ids.get(id(obj))
+        try:
+            pickler.dump((CACHE_VERSION, key, outputs))
+        except Exception as e:
+            _logger.debug('Optimized graph not cached, it can not be '
+                          'pickled: %s', e)
+            return False
+        data = buf.getvalue()
+
+        if not os.path.isdir(self.dirname):
+            try:
+                os.makedirs(self.dirname)
+            except OSError:
+                # Another process may have created it.
+                assert os.path.isdir(self.dirname)
+        fd, tmp_filename = tempfile.mkstemp(prefix='tmp', suffix='.pkl',
+                                            dir=self.dirname)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+        with lock_ctx():
+            # An existing entry for the same key is equivalent.
+            _rename(tmp_filename, self.entry_filename(key))
+            with open(self.index_filename, 'ab') as f:
+                if f.tell() == 0:
+                    f.write(b(self.header + '\n'))
+                f.write(b('%s %d\n' % (key, len(data))))
+            max_size = config.cache_optimizations_max_size * 1024 * 1024
+            if max_size > 0 and self.size() > max_size:
+                self.clear_lru(max_size)
+        return True
+
+    def read_index(self):
+        """
+        Return a dict mapping the keys in the index to the entry sizes.
+
+        """
+        entries = {}
+        try:
+            with open(self.index_filename, 'rb') as f:
+                data = decode(f.read())
+        except IOError:
+            return entries
+        lines = data.split('\n')
+        if lines[0] != self.header:
+            return entries
+        # The last line is empty or incomplete.
+        for line in lines[1:-1]:
+            parts = line.split(' ')
+            if len(parts) == 2:
+                entries[parts[0]] = int(parts[1])
+        return entries
+
+    def size(self):
+        """
+        Return the total size in bytes of the entries in the index.
+
+        """
+        return sum(self.read_index().values())
+
+    def clear_lru(self, max_size):
+        """
+        Remove the least recently used entries until the cache takes at most
+        `max_size` bytes, and compact the index.
+
+        This must be called with the compilation lock held.
+
+        """
+        entries = []
+        for key, size in self.read_index().items():
+            try:
+                atime = os.stat(self.entry_filename(key)).st_mtime
+            except OSError:
+                continue
+            entries.append((atime, key, size))
+        entries.sort()
+        total = sum(size for _, _, size in entries)
+        while entries and total > max_size:
+            _, key, size = entries.pop(0)
+            try:
+                os.remove(self.entry_filename(key))
+            except OSError:
+                pass
+            total -= size
+        _logger.debug('Optimization cache shrunk to %d entries', len(entries))
+
+        fd, tmp_filename = tempfile.mkstemp(prefix='index.', dir=self.dirname)
+        try:
+            lines = [self.header]
+            lines.extend('%s %d' % (key, size) for _, key, size in entries)
+            os.write(fd, b('\n'.join(lines) + '\n'))
+        finally:
+            os.close(fd)
+        _rename(tmp_filename, self.index_filename, replace=True)
+
+    def optimize(self, optimizer, fgraph, input_specs, output_specs):
+        """
+        Optimize `fgraph` in place, reusing the result of a previous
+        optimization of the same graph if there is one.
+
+        Returns
+        -------
+        object
+            The profile returned by the optimizer, or None if the optimized
+            graph came from the cache.
+
+        """
+        key = graph_key(fgraph, input_specs, output_specs, optimizer)
+        if key is None:
+            return optimizer(fgraph)
+        outputs = self.load(key, fgraph)
+        if outputs is not None and self.replace_outputs(fgraph, outputs):
+            _logger.debug('Optimized graph %s found in the cache', key)
+            return None
+        _logger.debug('Optimized graph %s not in the cache', key)
+        optimizer_profile = optimizer(fgraph)
+        self.store(key, fgraph)
+        return optimizer_profile
+
+    @staticmethod
+    def replace_outputs(fgraph, outputs):
+        """
+        Replace the outputs of `fgraph` by `outputs`, built on its inputs.
+
+        The features needed by the inplace ops of `outputs` are attached, and
+        the new graph is validated as the optimizer would do.
+
+        Returns
+        -------
+        bool
+            False if the replacement was rejected, in which case `fgraph` is
+            left unchanged.
+
+        """
+        nodes = graph.io_toposort(fgraph.inputs, outputs)
+        if any(getattr(node.op, 'destroy_map', None) for node in nodes):
+            fgraph.attach_feature(gof.DestroyHandler())
+        fgraph.attach_feature(gof.toolbox.ReplaceValidate())
+        replacements = []
+        done = set()
+        for old, new in zip(fgraph.outputs, outputs):
+            if old is not new and old not in done:
+                replacements.append((old, new))
+                done.add(old)
+        chk = fgraph.checkpoint()
+        try:
+            fgraph.replace_all_validate(replacements,
+                                        reason='optimization_cache')
+        except Exception as e:
+            _logger.debug('Cached optimized graph rejected: %s', e)
+            return False
+        if not all(old is new for old, new in zip(fgraph.outputs, outputs)):
+            fgraph.revert(chk)
+            return False
+        return True
@@ -19,10 +19,12 @@ __contact__ = "theano-dev <theano-dev@googlegroups.com>"
 __docformat__ = "restructuredtext en"
 import atexit
 import copy
+import json
 import os
 import sys
+import threading
 import time
-from collections import defaultdict
+from collections import defaultdict, deque
 
 import numpy
 
@@ -76,6 +78,30 @@ AddConfigVar('profiling.destination',
              StrParam('stderr'),
              in_c_key=False)
 
+AddConfigVar('profiling.compile_stats',
+             """
+             If not empty, file where the compilation time breakdown of the
+             profiled functions is written at exit, in JSON
+             """,
+             StrParam(''),
+             in_c_key=False)
+
+AddConfigVar('profiling.trace_size',
+             """
+             Number of events (thunk and function calls) kept in the
+             timeline of each profiled function. 0 disables the timeline
+             """,
+             IntParam(0, lambda i: i >= 0),
+             in_c_key=False)
+
+AddConfigVar('profiling.trace_file',
+             """
+             If not empty, file where the timeline of the profiled functions
+             is written at exit, in the Chrome trace event format
+             """,
+             StrParam(''),
+             in_c_key=False)
+
 AddConfigVar('profiling.debugprint',
              """
              Do a debugprint of the profiled functions
@@ -98,6 +124,15 @@ def _atexit_print_fn():
     else:
         destination_file = open(config.profiling.destination, 'w')
 
+    if config.profiling.compile_stats:
+        with open(config.profiling.compile_stats, 'w') as f:
+            json.dump([ps.compile_stats() for ps in _atexit_print_list
+                       if ps.compile_time > 0], f, indent=1)
+
+    if config.profiling.trace_file:
+        with open(config.profiling.trace_file, 'w') as f:
+            write_chrome_trace(f, _atexit_print_list)
+
     for ps in _atexit_print_list:
         if ps.fct_callcount or ps.compile_time > 0:
             ps.summary(file=destination_file,
@@ -117,12 +152,18 @@ def _atexit_print_fn():
         for ps in to_sum[1:]:
             for attr in ["compile_time", "fct_call_time", "fct_callcount",
                          "vm_call_time", "optimizer_time", "linker_time",
-                         "validate_time", "import_time"]:
+                         "validate_time", "import_time", "clone_time",
+                         "code_gen_time", "cxx_time", "cxx_calls",
+                         "c_cache_hits", "c_cache_misses",
+                         "reallocated_buffers", "reallocated_bytes",
+                         "memo_hits", "memo_misses",
+                         "buffer_pool_hits", "buffer_pool_misses"]:
                 setattr(cum, attr, getattr(cum, attr) + getattr(ps, attr))
 
             # merge dictonary
             for attr in ["apply_time", "apply_callcount",
-                         "apply_cimpl", "variable_shape", "variable_strides"]:
+                         "apply_cimpl", "apply_swap", "variable_shape",
+                         "variable_strides"]:
                 cum_attr = getattr(cum, attr)
                 for key, val in iteritems(getattr(ps, attr)):
                     assert key not in cum_attr
@@ -141,6 +182,89 @@ def _atexit_print_fn():
                     n_apply_to_print=config.profiling.n_apply)
 
 
+def optimizer_phases(optimizer, optimizer_profile, optimizer_time):
+    """
+    Return a list of (name, time) for the optimizers run by `optimizer`.
+
+    The SeqOptimizer and EquilibriumOptimizer are replaced by the
+    optimizers they ran, recursively, whose name is prefixed by the name of
+    their parents, e.g. ``canonicalize/local_fill_sink``. The time an
+    EquilibriumOptimizer spent outside of its optimizers (e.g. in
+    io_toposort) is reported under ``<name>/other``. The optimizers of an
+    EquilibriumOptimizer are sorted by decreasing time, and the ones that
+    were never run (e.g. pruned ones) are not listed. Other optimizers,
+    and those whose profile has an unknown layout, are reported as a whole.
+
+    Parameters
+    ----------
+    optimizer
+        The optimizer of a mode, usually a SeqOptimizer built from optdb.
+    optimizer_profile
+        What `optimizer` returned, or None if it was not run (e.g. because
+        the optimized graph came from the optimization cache).
+    optimizer_time
+        The total time spent in `optimizer`.
+
+    """
+    def name(opt):
+        return getattr(opt, 'name', None) or getattr(
+            opt, '__name__', opt.__class__.__name__)
+
+    def children(opt, prof):
+        # Return a list of (optimizer, time, profile), or None if `prof` is
+        # not a profile of `opt` with a known layout.
+        if not isinstance(prof, tuple) or not prof or prof[0] is not opt:
+            return None
+        if isinstance(opt, theano.gof.SeqOptimizer):
+            return list(zip(opt, prof[1], prof[6]))
+        if isinstance(opt, theano.gof.EquilibriumOptimizer):
+            time_opts = prof[6]
+            return sorted(((o, t, None) for o, t in iteritems(time_opts)
+                           if t > 0), key=lambda c: -c[1])
+        return None
+
+    def phases(opt, prof, t, prefix, top=False):
+        sub = children(opt, prof)
+        if sub is None:
+            return [(prefix + name(opt), t)]
+        if not (top and isinstance(opt, theano.gof.SeqOptimizer)):
+            # The top-level SeqOptimizer is not part of the names.
+            prefix += name(opt) + '/'
+        result = []
+        for sub_opt, sub_t, sub_prof in sub:
+            result.extend(phases(sub_opt, sub_prof, sub_t, prefix))
+        if isinstance(opt, theano.gof.EquilibriumOptimizer):
+            other = t - sum(sub_t for _, sub_t, _ in sub)
+            if other > 0:
+                result.append((prefix + 'other', other))
+        return result
+
+    if optimizer_profile is None:
+        return []
+    return phases(optimizer, optimizer_profile, optimizer_time, '', top=True)
+
+
+def write_chrome_trace(file, profiles):
+    """
+    Write the timeline of `profiles` to `file` in the Chrome trace event
+    format, that can be opened with chrome://tracing or other trace viewers.
+
+    Parameters
+    ----------
+    file
+        A file open for writing.
+    profiles
+        List of ProfileStats.
+
+    """
+    events = []
+    for ps in profiles:
+        if ps.trace_events:
+            events.extend(ps.trace_events)
+    events.sort(key=lambda e: e['ts'])
+    json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+
+
 class ProfileStats(object):
 
     """
@@ -194,6 +318,13 @@ class ProfileStats(object):
     # dict from node -> bool (1 if c, 0 if py)
     #
 
+    apply_swap = None
+    # dict from node -> 'pending', 'c' or 'python', for the nodes whose C
+    # code is compiled in background (see config.vm.background_compile):
+    # 'c' once the node switched from its Python implementation to its C
+    # one.
+    #
+
     message = None
     # pretty string to print in summary, to identify this output
     #
@@ -220,6 +351,52 @@ class ProfileStats(object):
     import_time = 0.0
     # time spent in importing compiled python module.
 
+    clone_time = 0.0
+    # time spent copying the graph before optimizing it
+    # (FunctionMaker.__init__)
+
+    optimizer_phases = None
+    # list of (name, time) for each optimizer run by the optimizer of the
+    # mode, e.g. each optimizer of optdb selected by the mode.
+
+    code_gen_time = 0.0
+    # time spent generating C code. This is a subset of linker_time.
+
+    cxx_time = 0.0
+    # time spent in the C compiler. This is a subset of linker_time, unless
+    # the compilation is done in background.
+
+    cxx_calls = 0
+    # number of times the C compiler was run
+
+    c_cache_hits = 0
+    # number of C modules found in the compilation cache
+
+    c_cache_misses = 0
+    # number of C modules that were not in the compilation cache
+
+    reallocated_buffers = 0
+    # number of variables that reuse the storage of a variable computed
+    # before them (see theano.gof.vm.calculate_reallocate_info)
+
+    reallocated_bytes = 0
+    # size of the reallocated_buffers whose shape is known at compile time,
+    # i.e. the number of bytes not allocated at each call
+
+    memo_hits = 0
+    # number of calls whose outputs were found in the memoization cache
+    # (see Function.set_memoize)
+
+    memo_misses = 0
+    # number of calls of a memoized function that were computed
+
+    buffer_pool_hits = 0
+    # number of outputs that were given an ndarray from the buffer pool
+    # (see theano.gof.vm.LoopPool)
+
+    buffer_pool_misses = 0
+    # number of outputs for which the buffer pool had no ndarray
+
     line_width = config.profiling.output_line_width
 
     nb_nodes = -1
@@ -230,6 +407,11 @@ class ProfileStats(object):
     optimizer_profile = None
     # None or tuple (the optimizer, the profile it returned)
 
+    trace_events = None
+    # None or deque of the last config.profiling.trace_size events (dicts
+    # in the Chrome trace event format) of the calls of the function and of
+    # its thunks.
+
     # param is called flag_time_thunks because most other attributes with time
     # in the name are times *of* something, rather than configuration flags.
     def __init__(self, atexit_print=True, flag_time_thunks=None, **kwargs):
@@ -249,8 +431,12 @@ class ProfileStats(object):
         self.output_size = {}
         self.apply_time = {}
         self.apply_cimpl = {}
+        self.apply_swap = {}
         self.variable_shape = {}
         self.variable_strides = {}
+        self.optimizer_phases = []
+        if config.profiling.trace_size:
+            self.trace_events = deque(maxlen=config.profiling.trace_size)
         if flag_time_thunks is None:
             self.flag_time_thunks = config.profiling.time_thunks
         else:
@@ -676,6 +862,9 @@ class ProfileStats(object):
         print('  Message: %s' % self.message, file=file)
         print('  Time in %i calls to Function.__call__: %es' % (
             self.fct_callcount, self.fct_call_time), file=file)
+        if self.memo_hits or self.memo_misses:
+            print('  Memoized calls: %d hits, %d misses' % (
+                self.memo_hits, self.memo_misses), file=file)
         if self.fct_call_time > 0:
             print('  Time in Function.fn.__call__: %es (%.3f%%)' % (
                 self.vm_call_time,
@@ -694,12 +883,86 @@ class ProfileStats(object):
         print('    Theano Linker time (includes C, CUDA code '
               'generation/compiling): %es' % self.linker_time, file=file)
         print('       Import time %es' % self.import_time, file=file)
+        print('       C code generation time %es' % self.code_gen_time,
+              file=file)
+        print('       C compilation time %es (%d compiler runs, %d/%d C '
+              'modules found in cache)' % (
+                  self.cxx_time, self.cxx_calls, self.c_cache_hits,
+                  self.c_cache_hits + self.c_cache_misses), file=file)
+        if self.reallocated_buffers:
+            print('    Buffers reused: %d (%dKB allocation saved per call '
+                  'for those of known size)' % (
+                      self.reallocated_buffers,
+                      int(round(self.reallocated_bytes / 1024.))), file=file)
+        if self.buffer_pool_hits or self.buffer_pool_misses:
+            print('    Buffer pool: %d ndarrays reused, %d not found' % (
+                self.buffer_pool_hits, self.buffer_pool_misses), file=file)
+        if self.apply_swap:
+            status = list(self.apply_swap.values())
+            print('    Background compilation: %d nodes switched to C, '
+                  '%d pending, %d kept in Python' % (
+                      status.count('c'), status.count('pending'),
+                      status.count('python')), file=file)
         print('', file=file)
 
         # The validation time is a subset of optimizer_time
         if self.optimizer_time > 0:
             assert self.validate_time < self.optimizer_time
 
+    def trace_call(self, name, t0, t1):
+        """
+        Add to the timeline a call to the function that ran from `t0` to
+        `t1`.
+
+        """
+        self.trace_events.append({
+            'name': name,
+            'cat': 'function',
+            'ph': 'X',
+            'ts': t0 * 1e6,
+            'dur': (t1 - t0) * 1e6,
+            'pid': os.getpid(),
+            'tid': threading.current_thread().ident,
+            'args': {}})
+
+    def write_chrome_trace(self, file):
+        """
+        Write the timeline of this function to `file` in the Chrome trace
+        event format.
+
+        """
+        write_chrome_trace(file, [self])
+
+    def compile_stats(self):
+        """
+        Return the compilation time breakdown of this function as a dict
+        that can be serialized in JSON.
+
+        The time spent creating the thunks is what remains of the linker
+        time once the C code generation, compilation and import are
+        removed.
+
+        """
+        thunk_time = (self.linker_time - self.code_gen_time -
+                      self.cxx_time - self.import_time)
+        return {
+            'message': self.message,
+            'nb_nodes': self.nb_nodes,
+            'compile_time': self.compile_time,
+            'clone_time': self.clone_time,
+            'optimizer_time': self.optimizer_time,
+            'validate_time': self.validate_time,
+            'optimizers': [{'name': name, 'time': t}
+                           for name, t in self.optimizer_phases],
+            'linker_time': self.linker_time,
+            'code_gen_time': self.code_gen_time,
+            'cxx_time': self.cxx_time,
+            'cxx_calls': self.cxx_calls,
+            'import_time': self.import_time,
+            'c_cache_hits': self.c_cache_hits,
+            'c_cache_misses': self.c_cache_misses,
+            'thunk_time': max(thunk_time, 0.0)}
+
     def summary_globals(self, file):
         print('Time in all call to theano.grad() %es' %
               theano.gradient.grad_time, file=file)
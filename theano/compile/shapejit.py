@@ -0,0 +1,143 @@
+"""
+Compile a Theano function again for each shape of its inputs.
+
+"""
+from __future__ import print_function
+import copy
+import logging
+
+import theano
+from theano.compat import OrderedDict
+from theano.compile.mode import get_mode
+
+_logger = logging.getLogger('theano.compile.shapejit')
+
+
+class ShapeJITFunction(object):
+    """
+    Function specialized for the shapes of the tensors it is called with.
+
+    The generic function is compiled first and handles any shape. The first
+    call with a new signature, the shapes of the tensor inputs, compiles a
+    version of the graph where these inputs have a specified shape (see
+    `theano.tensor.specify_shape`), with the 'specialize_shapes'
+    optimizations enabled. All the shapes in the graph are then constant:
+    shape computations are folded, ConvOp is unrolled for its shapes and
+    the C code of Elemwise and CAReduce uses constant sizes (see
+    `Op.c_static_shapes`). Later calls with the same signature use that
+    version.
+
+    The generic function is used for the calls with keyword arguments or
+    default values, when the signature can not be computed, once
+    `max_shapes` signatures were compiled, or when the compilation of the
+    specialized version failed.
+
+    Use the `specialize_shapes` parameter of `theano.function` to build
+    one.
+
+    Parameters
+    ----------
+    inputs
+        The inputs given to `theano.function`.
+    outputs
+        The outputs given to `theano.function`.
+    max_shapes
+        Maximum number of signatures to compile a version for.
+    kwargs
+        The other parameters of `theano.function`.
+
+    Attributes
+    ----------
+    generic : Function
+        The function compiled for any shape.
+    specialized : OrderedDict
+        Map each signature to its `Function`, or to None if its
+        compilation failed.
+
+    """
+
+    def __init__(self, inputs, outputs, max_shapes, **kwargs):
+        self.inputs = list(inputs)
+        self.outputs = outputs
+        self.max_shapes = max_shapes
+        self.kwargs = kwargs
+        self.generic = theano.function(inputs, outputs, **kwargs)
+        self.specialized = OrderedDict()
+        # Position of the inputs that can be specialized
+        self._tensor_inputs = [
+            i for i, inp in enumerate(self.inputs)
+            if isinstance(getattr(inp, 'variable', inp).type,
+                          theano.tensor.TensorType)]
+
+    def signature(self, args, kwargs):
+        """
+        Return the shapes of the tensor arguments, or None.
+
+        None means that the generic function must be used.
+
+        """
+        if kwargs or len(args) != len(self.inputs):
+            return None
+        signature = []
+        for i in self._tensor_inputs:
+            shape = getattr(args[i], 'shape', None)
+            var = getattr(self.inputs[i], 'variable', self.inputs[i])
+            # Let the generic function report bad arguments.
+            if (not isinstance(shape, tuple) or len(shape) != var.ndim or
+                    any(b and s != 1
+                        for b, s in zip(var.broadcastable, shape))):
+                return None
+            signature.append(tuple(int(s) for s in shape))
+        return tuple(signature)
+
+    def specialize(self, signature):
+        """
+        Compile the version of the function for `signature`.
+
+        """
+        inputs = list(self.inputs)
+        givens = self.kwargs.get('givens') or []
+        if isinstance(givens, dict):
+            givens = list(givens.items())
+        else:
+            givens = list(givens)
+        for i, shape in zip(self._tensor_inputs, signature):
+            var = getattr(inputs[i], 'variable', inputs[i])
+            new_var = var.type(name=var.name)
+            if var is inputs[i]:
+                inputs[i] = new_var
+            else:
+                inputs[i] = copy.copy(inputs[i])
+                inputs[i].variable = new_var
+            givens.append((var, theano.tensor.specify_shape(new_var, shape)))
+        kwargs = dict(self.kwargs)
+        kwargs['givens'] = givens
+        kwargs['mode'] = get_mode(kwargs.get('mode')).including(
+            'specialize_shapes')
+        if kwargs.get('name') is not None:
+            kwargs['name'] = '%s%s' % (kwargs['name'], signature)
+        return theano.function(inputs, self.outputs, **kwargs)
+
+    def __call__(self, *args, **kwargs):
+        fn = None
+        signature = self.signature(args, kwargs)
+        if signature is not None:
+            if (signature not in self.specialized and
+                    len(self.specialized) < self.max_shapes):
+                try:
+                    self.specialized[signature] = self.specialize(signature)
+                except Exception:
+                    _logger.warning('Failed to compile the function for the '
+                                    'shapes %s, using the generic version.',
+                                    signature, exc_info=True)
+                    self.specialized[signature] = None
+            fn = self.specialized.get(signature)
+        if fn is None:
+            fn = self.generic
+        return fn(*args, **kwargs)
+
+    def __getattr__(self, attr):
+        # Give access to the attributes of the generic function, e.g. maker.
+        if attr == 'generic':
+            raise AttributeError(attr)
+        return getattr(self.generic, attr)
@@ -15,6 +15,16 @@ from theano.gof import Container, Variable, generic, utils
 _logger = logging.getLogger('theano.compile.sharedvalue')
 __docformat__ = 'restructuredtext en'
 
+# Incremented each time the value of a shared variable may change: by
+# set_value, zero, and the calls of functions with updates. The memoized
+# functions (see Function.set_memoize) forget their results when it changes.
+shared_version = 0
+
+
+def shared_values_changed():
+    global shared_version
+    shared_version += 1
+
 
 class SharedVariable(Variable):
     """
@@ -125,6 +135,7 @@ class SharedVariable(Variable):
             self.container.value = new_value
         else:
             self.container.value = copy.deepcopy(new_value)
+        shared_values_changed()
 
     def zero(self, borrow=False):
         """
@@ -145,6 +156,7 @@ class SharedVariable(Variable):
             self.container.value[...] = 0
         else:
             self.container.value = 0 * self.container.value
+        shared_values_changed()
 
     def clone(self):
         cp = self.__class__(
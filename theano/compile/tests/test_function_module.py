@@ -558,6 +558,153 @@ class T_function(unittest.TestCase):
             if not isinstance(key, theano.gof.Constant):
                 assert (val[0] == None)
 
+    def test_call_many(self):
+        x = T.dvector('x')
+        s = T.dscalar('s')
+        acc = theano.shared(0.)
+        f = function([x, In(s, value=2.)], [x * s, x.sum()],
+                     updates=[(acc, acc + x.sum())])
+        # All the calls of a batch have the same number of arguments.
+        args1 = [(numpy.arange(3.) + i,) for i in range(4)]
+        # A list and an int vector go through the filter.
+        args2 = [([1., 2.], 3.), (numpy.arange(3), 1.)]
+        for args in [args1, args2]:
+            results = f.call_many(args)
+            assert len(results) == len(args)
+            for res, arg in zip(results, args):
+                x_val = numpy.asarray(arg[0], dtype='float64')
+                s_val = arg[1] if len(arg) > 1 else 2.
+                assert numpy.allclose(res[0], x_val * s_val)
+                assert numpy.allclose(res[1], x_val.sum())
+            # The outputs of different calls are not aliased.
+            assert not numpy.may_share_memory(results[0][0], results[1][0])
+        assert numpy.allclose(acc.get_value(),
+                              sum(numpy.sum(a[0]) for a in args1 + args2))
+
+        self.assertRaises(TypeError, f.call_many, [()])
+        self.assertRaises(TypeError, f.call_many,
+                          [(numpy.arange(3.),), (numpy.arange(3.), 1.)])
+        self.assertRaises(TypeError, f.call_many, [(numpy.ones((2, 2)),)])
+        assert f.call_many([]) == []
+
+    def test_call_many_single_output(self):
+        x = T.dvector('x')
+        p = theano.compile.profiling.ProfileStats(atexit_print=False)
+        f = function([x], x + 1, profile=p)
+        results = f.call_many((numpy.arange(2.) * i,) for i in range(3))
+        for i, res in enumerate(results):
+            assert numpy.allclose(res, numpy.arange(2.) * i + 1)
+        assert p.fct_callcount == 3
+
+    def test_output_subset(self):
+        x = T.dvector('x')
+        acc = theano.shared(0.)
+        outputs = [x * 2, T.exp(x).sum(), T.tanh(x).sum()]
+        v = numpy.arange(3.)
+        expected = [v * 2, numpy.exp(v).sum(), numpy.tanh(v).sum()]
+        mode = theano.Mode(
+            linker=theano.gof.vm.VM_Linker(allow_partial_eval=True),
+            optimizer='fast_run')
+        for m in [mode, None]:
+            f = function([x], outputs, updates=[(acc, acc + x.sum())],
+                         mode=m)
+            acc.set_value(0.)
+            out = f(v, output_subset=[2, 0])
+            assert len(out) == 2
+            assert numpy.allclose(out[0], expected[2])
+            assert numpy.allclose(out[1], expected[0])
+            assert numpy.allclose(acc.get_value(), v.sum())
+            out = f(v, output_subset=[1])
+            assert isinstance(out, list) and len(out) == 1
+            assert numpy.allclose(out[0], expected[1])
+            assert numpy.allclose(acc.get_value(), 2 * v.sum())
+            out = f(v)
+            assert all(numpy.allclose(o, e) for o, e in zip(out, expected))
+
+        # Only the nodes the requested output depends on are run.
+        f = function([x], outputs, mode=mode)
+        f(v, output_subset=[0])
+        ran = f.fn.node_executed_order
+        assert 0 < len(ran) < len(f.maker.fgraph.apply_nodes)
+        f(v)
+        assert len(f.fn.node_executed_order) == len(
+            f.maker.fgraph.apply_nodes)
+
+        f = function([x], dict(a=outputs[0], b=outputs[1]), mode=mode)
+        out = f(v, output_subset=['b'])
+        assert list(out.keys()) == ['b']
+        assert numpy.allclose(out['b'], expected[1])
+
+
+    def test_memoize(self):
+        x = T.dvector('x')
+        w = theano.shared(numpy.ones(3))
+        p = theano.compile.profiling.ProfileStats(atexit_print=False)
+        f = function([x], [x * w, (x ** 2).sum()], memoize=2, profile=p)
+        v = numpy.arange(3.)
+        f(v)
+        out = f(v.copy())
+        assert (p.memo_hits, p.memo_misses) == (1, 1)
+        assert numpy.allclose(out[0], v)
+        assert numpy.allclose(out[1], (v ** 2).sum())
+        # The memoized outputs are not modified through the returned ones.
+        out[0][:] = 100
+        assert numpy.allclose(f(v)[0], v)
+        assert (p.memo_hits, p.memo_misses) == (2, 1)
+
+        # Least recently used results are dropped.
+        f(v + 1)
+        f(v + 2)
+        f(v)
+        assert (p.memo_hits, p.memo_misses) == (2, 4)
+        assert len(f.memo) == 2
+
+        # Results are forgotten when a shared variable changes.
+        w.set_value(numpy.ones(3) * 2)
+        assert numpy.allclose(f(v)[0], 2 * v)
+        g = function([], [], updates=[(w, w * 2)])
+        g()
+        assert numpy.allclose(f(v)[0], 4 * v)
+        assert (p.memo_hits, p.memo_misses) == (2, 6)
+
+        # The objects that may be modified in place are not memoized.
+        f.input_storage[0].storage[0] = object()
+        assert f._memo_key() is None
+
+        # The updates done by call_many before an error are seen.
+        y = T.dvector('y')
+        h = function([y], y, updates=[(w, w + y)])
+        self.assertRaises(ValueError, h.call_many,
+                          [(numpy.ones(3),), (numpy.ones(2),)])
+        assert numpy.allclose(w.get_value(), 5)
+        assert numpy.allclose(f(v)[0], 5 * v)
+
+        self.assertRaises(ValueError, function, [x], x,
+                          updates=[(w, w + 1)], memoize=1)
+
+    def test_reoptimize(self):
+        x = T.dvector('x')
+        w = theano.shared(numpy.ones(3))
+        mode = theano.compile.get_default_mode().clone()
+        mode.time_budget = 1e-9
+        f = function([x], T.exp(T.log(x)) * w, mode=mode,
+                     updates=[(w, w + 1)])
+        assert f.maker.optimizer_interrupted
+        v = numpy.arange(1., 4.)
+        assert numpy.allclose(f(v), v)
+
+        old_maker = f.maker
+        f.reoptimize(background=False)
+        assert f.maker is not old_maker
+        assert not f.maker.optimizer_interrupted
+        # The state of the shared variable is kept.
+        assert numpy.allclose(f(v), 2 * v)
+        assert numpy.allclose(w.get_value(), 3)
+
+        f.reoptimize().join()
+        assert numpy.allclose(f(v), 3 * v)
+        assert f.reoptimized is None
+
 
 class T_picklefunction(unittest.TestCase):
 
@@ -0,0 +1,66 @@
+import gc
+import threading
+
+import numpy
+
+import theano
+import theano.tensor as T
+from theano.compile import FunctionPool
+
+
+def test_function_pool():
+    x = T.vector('x')
+    f = theano.function([x], T.exp(x).sum() * 2)
+    values = [numpy.arange(i, dtype=theano.config.floatX) for i in range(20)]
+    expected = [f(v) for v in values]
+
+    with FunctionPool(f, n_workers=4) as pool:
+        assert pool.get() is f
+        futures = [pool.submit(v) for v in values]
+        results = [future.get() for future in futures]
+    assert numpy.allclose(results, expected)
+    instances = list(pool.instances.values())
+    assert 1 < len(instances) <= 5
+    assert sum(fn is f for fn in instances) == 1
+    for fn in instances:
+        if fn is not f:
+            assert fn.maker.fgraph is not f.maker.fgraph
+
+
+def test_function_pool_threads():
+    x = T.vector('x')
+    f = theano.function([x], x * 3)
+    pool = FunctionPool(f)
+    results = {}
+
+    def run(i):
+        value = numpy.ones(3, dtype=theano.config.floatX) * i
+        results[i] = (pool.get(), pool(value).copy())
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(id(fn) for fn, _ in results.values())) == 4
+    for i, (_, out) in results.items():
+        assert numpy.allclose(out, 3 * i)
+
+    # The instances of the threads that are gone are released.
+    del threads, t
+    gc.collect()
+    assert len(pool.instances) == 0
+    # The original function is given again.
+    assert pool.get() is f
+
+
+def test_function_pool_updates():
+    x = T.vector('x')
+    s = theano.shared(numpy.asarray(0, dtype='int64'))
+    f = theano.function([x], x, updates=[(s, s + 1)])
+    value = numpy.ones(2, dtype=theano.config.floatX)
+    with FunctionPool(f, n_workers=4) as pool:
+        futures = [pool.submit(value) for i in range(50)]
+        for future in futures:
+            future.get()
+    assert s.get_value() == 50
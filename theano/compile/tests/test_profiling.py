@@ -2,6 +2,7 @@
 Test of memory profiling
 
 """
+import json
 import unittest
 
 import numpy
@@ -104,6 +105,57 @@ class Test_profiling(unittest.TestCase):
             theano.config.profile = config1
             theano.config.profile_memory = config2
 
+    def test_compile_stats(self):
+        x = T.dvector('x')
+        p = theano.ProfileStats(False)
+        f = theano.function([x], T.exp(x) * 2, profile=p, mode='FAST_RUN',
+                            name='test_compile_stats')
+        f(numpy.arange(3.))
+        stats = json.loads(json.dumps(p.compile_stats()))
+        assert stats['message'] == 'test_compile_stats'
+        assert stats['compile_time'] > 0
+        assert stats['clone_time'] > 0
+        assert stats['optimizers']
+        assert abs(sum(o['time'] for o in stats['optimizers']) -
+                   stats['optimizer_time']) < stats['optimizer_time']
+        # The nested optimizers are listed under their parents.
+        assert any(o['name'].startswith('canonicalize/')
+                   for o in stats['optimizers'])
+        for key in ['code_gen_time', 'cxx_time', 'import_time',
+                    'thunk_time']:
+            assert stats[key] <= stats['linker_time']
+        if theano.config.cxx:
+            assert stats['c_cache_hits'] + stats['c_cache_misses'] > 0
+
+    def test_chrome_trace(self):
+        trace_size = theano.config.profiling.trace_size
+        try:
+            theano.config.profiling.trace_size = 5
+            x = T.dvector('x')
+            p = theano.ProfileStats(False)
+            f = theano.function([x], T.exp(x) * 2 + x.sum(), profile=p,
+                                mode='FAST_RUN', name='test_chrome_trace')
+            n_nodes = len(f.maker.fgraph.apply_nodes)
+            for i in range(3):
+                f(numpy.arange(3.))
+            assert len(p.trace_events) == 5
+            buf = StringIO()
+            p.write_chrome_trace(buf)
+            events = json.loads(buf.getvalue())['traceEvents']
+            assert [e['ts'] for e in events] == sorted(e['ts'] for e in events)
+            assert events[-1]['name'] == 'test_chrome_trace'
+            assert events[-1]['cat'] == 'function'
+            # The thunks of the last call come just before it.
+            thunks = events[-1 - min(n_nodes, 4):-1]
+            assert all(e['cat'] == 'thunk' for e in thunks)
+            for e in thunks:
+                assert e['ph'] == 'X'
+                assert e['dur'] >= 0
+                assert all(shape in ([3], [])
+                           for shape in e['args']['input_shapes'])
+        finally:
+            theano.config.profiling.trace_size = trace_size
+
 
 if __name__ == '__main__':
     unittest.main()
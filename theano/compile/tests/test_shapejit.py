@@ -0,0 +1,52 @@
+import numpy
+
+import theano
+import theano.tensor as T
+from theano.compile import ShapeJITFunction
+
+
+def test_specialize_shapes():
+    x = T.matrix('x')
+    y = T.vector('y')
+    f = theano.function([x, y], [(x * y).sum(axis=0), x.shape[0] * 2],
+                        specialize_shapes=2)
+    assert isinstance(f, ShapeJITFunction)
+    rng = numpy.random.RandomState(0)
+    for shape in [(2, 3), (4, 5), (2, 3), (6, 7)]:
+        xv = rng.rand(*shape).astype(theano.config.floatX)
+        yv = rng.rand(shape[1]).astype(theano.config.floatX)
+        s, n = f(xv, yv)
+        assert numpy.allclose(s, (xv * yv).sum(axis=0))
+        assert n == shape[0] * 2
+        # Keyword arguments use the generic function
+        s, n = f(x=xv, y=yv)
+        assert numpy.allclose(s, (xv * yv).sum(axis=0))
+    # Only the first 2 signatures got their own version,
+    assert list(f.specialized.keys()) == [((2, 3), (3,)), ((4, 5), (5,))]
+    # and they were really compiled, not replaced by the generic one.
+    for fn in f.specialized.values():
+        assert fn is not None
+        assert fn.maker is not f.generic.maker
+
+    fgraph = f.specialized[((2, 3), (3,))].maker.fgraph
+    static_shapes = [getattr(var.tag, 'static_shape', None)
+                     for var in fgraph.variables]
+    assert (2, 3) in static_shapes
+    assert (3,) in static_shapes
+    # The shape computation was folded
+    assert not any(isinstance(node.op, (theano.compile.Shape,
+                                        theano.compile.Shape_i))
+                   for node in fgraph.toposort())
+    assert f.maker is f.generic.maker
+
+
+def test_specialize_shapes_updates():
+    x = T.vector('x')
+    count = theano.shared(0)
+    f = theano.function([x], x * 2, updates=[(count, count + 1)],
+                        specialize_shapes=True)
+    for size in [1, 2, 3, 2]:
+        assert numpy.allclose(f(numpy.ones(size, dtype=x.dtype)), 2)
+    assert len(f.specialized) == 3
+    assert None not in f.specialized.values()
+    assert count.get_value() == 4
@@ -617,9 +617,35 @@ AddConfigVar(
 
 AddConfigVar(
     'cache_optimizations',
-    "WARNING: work in progress, does not work yet. "
-    "Specify if the optimization cache should be used. This cache will "
-    "any optimized graph and its optimization. Actually slow downs a lot "
-    "the first optimization, and could possibly still contains some bugs. "
-    "Use at your own risks.",
+    "Specify if the optimization cache should be used. Optimized graphs "
+    "are saved in the compiledir, and a graph with the same structure as "
+    "one that was already optimized is not optimized again. Graphs with "
+    "ops that contain an inner compiled function, like scan, are not "
+    "cached.",
     BoolParam(False))
+
+AddConfigVar(
+    'cache_optimizations_max_size',
+    "Maximum size in MB of the optimization cache. When it is bigger, "
+    "the least recently used graphs are removed. 0 means no limit.",
+    IntParam(256, lambda i: i >= 0),
+    in_c_key=False)
+
+AddConfigVar(
+    'optimizer_pruning',
+    "Profile-guided pruning of the local optimizers of the interruptible "
+    "equilibrium passes (canonicalize, uncanonicalize). With "
+    "'learn', the local optimizers that change each family of graphs are "
+    "recorded in the compiledir. With 'on', they are also recorded, and "
+    "those that never changed a graph of the same family are skipped. "
+    "'off' disables both, to get all the optimizations back.",
+    EnumStr('off', 'learn', 'on'),
+    in_c_key=False)
+
+AddConfigVar(
+    'optimizer_pruning_min_compiles',
+    "Number of compilations of a family of graphs in which a local "
+    "optimizer must have been tried without changing anything before "
+    "optimizer_pruning skips it.",
+    IntParam(5, lambda i: i >= 1),
+    in_c_key=False)
@@ -10,6 +10,7 @@ from copy import copy
 import os
 import sys
 import logging
+import time
 
 import numpy
 
@@ -43,6 +44,10 @@ _logger = logging.getLogger("theano.gof.cc")
 
 run_cthunk = None  # Will be imported only when needed.
 
+# global variable that represent the total time spent generating the C code
+# of the modules.
+code_gen_time = 0
+
 
 def get_module_cache(init_args=None):
     """
@@ -520,6 +525,32 @@ def struct_variable_codeblocks(variable, policies, id, symbol_table, sub):
     return struct_builder, block
 
 
+def static_shapes(node):
+    """
+    Return the static shapes of the inputs and outputs of `node`.
+
+    Returns
+    -------
+    None or pair of lists
+        None if the op of `node` does not use static shapes (see
+        `Op.c_static_shapes`) or if none of its variables has one.
+        Otherwise the lists hold the `tag.static_shape` of each input and
+        output, or None for the variables without one.
+
+    """
+    # Pure Ops do not have a c_static_shapes method.
+    c_static_shapes = getattr(node.op, 'c_static_shapes', None)
+    if c_static_shapes is None or not c_static_shapes(node):
+        return None
+    input_shapes = [getattr(i.tag, 'static_shape', None)
+                    for i in node.inputs]
+    output_shapes = [getattr(o.tag, 'static_shape', None)
+                     for o in node.outputs]
+    if all(shp is None for shp in input_shapes + output_shapes):
+        return None
+    return input_shapes, output_shapes
+
+
 class CLinker(link.Linker):
     """
     WRITEME
@@ -753,6 +784,15 @@ class CLinker(link.Linker):
             sub['fail'] = failure_code(sub)
             if ctx is not graph.NoContext:
                 sub['context'] = context_var
+            if config.cmodule.release_gil and node.op.c_nogil(node):
+                sub['begin_nogil'] = "Py_BEGIN_ALLOW_THREADS"
+                sub['end_nogil'] = "Py_END_ALLOW_THREADS"
+            else:
+                sub['begin_nogil'] = ""
+                sub['end_nogil'] = ""
+            shapes = static_shapes(node)
+            if shapes is not None:
+                sub['input_shapes'], sub['output_shapes'] = shapes
 
             sub_struct = dict()
             sub_struct['id'] = id + 1
@@ -1384,12 +1424,17 @@ class CLinker(link.Linker):
                 version.append(o.type.c_code_cache_version())
 
             # add the signature for this node
-            sig.append((
+            node_sig = (
                 node.op,
                 tuple((i.type, in_sig(i, node_pos, ipos))
                       for ipos, i in enumerate(node.inputs)),
                 (1,  # Increment if cmodule change its handling of outputs
-                    tuple(o in no_recycling for o in node.outputs))))
+                    tuple(o in no_recycling for o in node.outputs)))
+            shapes = static_shapes(node)
+            if shapes is not None:
+                # The code was specialized for these shapes.
+                node_sig += (tuple(map(tuple, shapes)),)
+            sig.append(node_sig)
 
             if error_on_play[0]:
                 # if one of the signatures is not hashable
@@ -1419,14 +1464,47 @@ class CLinker(link.Linker):
         mod = self.get_dynamic_module()
         return mod.code()
 
-    def compile_cmodule(self, location=None):
+    def compile_cmodule(self, location=None, lock=True):
         """
         This compiles the source code for this linker and returns a
         loaded module.
 
+        Parameters
+        ----------
+        location
+            Directory where the module is built. Defaults to a new
+            temporary directory in the compilation directory.
+        lock : bool
+            If True, the lock on the compilation directory is held during
+            the compilation. The ModuleCache passes False, as it already
+            holds the lock of the module being compiled.
+
         """
         if location is None:
             location = cmodule.dlimport_workdir(config.compiledir)
+        c_compiler, compile_kwargs = self.compile_cmodule_args(location)
+        if lock:
+            get_lock()
+        try:
+            _logger.debug("LOCATION %s", str(location))
+            module = c_compiler.compile_str(**compile_kwargs)
+        except Exception as e:
+            e.args += (str(self.fgraph),)
+            raise
+        finally:
+            if lock:
+                release_lock()
+        return module
+
+    def compile_cmodule_args(self, location):
+        """
+        Return the compiler to use and the keyword arguments of its
+        `compile_str` method to build this linker's module in `location`.
+
+        This does all the work of `compile_cmodule` that needs neither the
+        compilation lock nor the compiler itself.
+
+        """
         mod = self.get_dynamic_module()
         c_compiler = self.c_compiler()
         libs = self.libraries()
@@ -1447,23 +1525,13 @@ class CLinker(link.Linker):
                 libs.remove('amdlibm')
         # We want to compute the code without the lock
         src_code = mod.code()
-        get_lock()
-        try:
-            _logger.debug("LOCATION %s", str(location))
-            module = c_compiler.compile_str(
-                module_name=mod.code_hash,
-                src_code=src_code,
-                location=location,
-                include_dirs=self.header_dirs(),
-                lib_dirs=self.lib_dirs(),
-                libs=libs,
-                preargs=preargs)
-        except Exception as e:
-            e.args += (str(self.fgraph),)
-            raise
-        finally:
-            release_lock()
-        return module
+        return c_compiler, dict(module_name=mod.code_hash,
+                                src_code=src_code,
+                                location=location,
+                                include_dirs=self.header_dirs(),
+                                lib_dirs=self.lib_dirs(),
+                                libs=libs,
+                                preargs=preargs)
 
     def get_dynamic_module(self):
         """
@@ -1473,7 +1541,9 @@ class CLinker(link.Linker):
         multiple times without penalty.
 
         """
+        global code_gen_time
         if not hasattr(self, '_mod'):
+            t0 = time.time()
             self.code_gen()
 
             mod = cmodule.DynamicModule()
@@ -1522,6 +1592,7 @@ class CLinker(link.Linker):
             for init_code_block in self.init_code() + self.c_init_code_apply:
                 mod.add_init_code(init_code_block)
             self._mod = mod
+            code_gen_time += time.time() - t0
         return self._mod
 
     def cthunk_factory(self, error_storage, in_storage, out_storage,
@@ -1661,6 +1732,87 @@ class _CThunk(object):
             reraise(exc_type, exc_value, exc_trace)
 
 
+def uses_default_c_thunk(node):
+    """
+    Return True if the thunk of `node` is made by the default
+    `Op.make_thunk` and would try to use C code.
+
+    The other Ops may not use the CLinker to make their thunk.
+
+    """
+    from theano.gof.op import Op, OpenMPOp
+
+    op = node.op
+    if not getattr(op, '_op_use_c_code', False):
+        return False
+    owner = [cls for cls in type(op).__mro__
+             if 'make_thunk' in cls.__dict__][0]
+    if owner not in (Op, OpenMPOp):
+        return False
+    # Op.make_c_thunk refuses to use C code for float16.
+    if not getattr(op, '_f16_ok', False):
+        for v in node.inputs + node.outputs:
+            if getattr(v.type, 'dtype', '') == 'float16':
+                return False
+    return True
+
+
+def precompile_nodes(nodes, no_recycling, n_workers=None):
+    """
+    Compile in parallel the C modules needed by the thunks of `nodes`.
+
+    The thunks are still made one at a time by `Op.make_thunk` afterwards,
+    but they then find their module already in the cache.
+
+    Only the nodes whose Op builds its thunk with the default
+    `Op.make_thunk` are considered, as the other Ops may not use the CLinker.
+
+    Parameters
+    ----------
+    nodes
+        Apply nodes whose thunks will be made.
+    no_recycling
+        Variables that will be passed as `no_recycling` to `make_thunk`
+        (they are part of the module key).
+    n_workers
+        Maximum number of compilations run at the same time. Defaults to
+        the Theano flag `cmodule.compilation_workers`.
+
+    Returns
+    -------
+    int
+        The number of modules that were compiled.
+
+    """
+    if n_workers is None:
+        n_workers = config.cmodule.compilation_workers
+    if n_workers <= 1 or not config.cxx:
+        return 0
+
+    module_cache = get_module_cache()
+    seen_keys = set()
+    keys_and_linkers = []
+    for node in nodes:
+        if not uses_default_c_thunk(node):
+            continue
+        try:
+            lnk = node.op.c_linker(node, no_recycling)
+            key = lnk.cmodule_key()
+            # Do not generate the code of modules we already know about.
+            if key in seen_keys or key in module_cache.entry_from_key:
+                continue
+            seen_keys.add(key)
+            # This generates the code, and fails if there is no C code.
+            lnk.get_src_code()
+        except (NotImplementedError, utils.MethodNotDefined, KeyError):
+            continue
+        keys_and_linkers.append((key, lnk))
+    if not keys_and_linkers:
+        return 0
+    return module_cache.compile_missing(keys_and_linkers,
+                                        n_workers=n_workers)
+
+
 class OpWiseCLinker(link.LocalLinker):
     """
     WRITEME
@@ -1744,6 +1896,9 @@ class OpWiseCLinker(link.LocalLinker):
             for k in storage_map:
                 compute_map[k] = [k.owner is None]
 
+            if theano.config.cxx:
+                precompile_nodes(order, no_recycling)
+
             thunks = []
             for node in order:
                 # Maker sure we use the C version of the code whenever
@@ -1931,6 +2086,9 @@ class HideC(object):
     c_support_code_struct = __hide
     c_cleanup_code_struct = __hide
 
+    def c_static_shapes(self, node):
+        return False
+
     def c_code_cache_version(self):
         return ()
 
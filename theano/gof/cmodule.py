@@ -6,6 +6,7 @@ from __future__ import print_function
 
 import atexit
 import six.moves.cPickle as pickle
+import json
 import logging
 import os
 import re
@@ -13,27 +14,32 @@ import shutil
 import stat
 import subprocess
 import sys
+import tarfile
 import tempfile
+import threading
 import time
 import platform
 import distutils.sysconfig
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
 
 import numpy.distutils  # TODO: TensorType should handle this
 
 import theano
-from theano.compat import PY3, decode, decode_iter
+from theano.compat import PY3, OrderedDict, decode, decode_iter
 from six import b, BytesIO, StringIO, string_types, iteritems
 from theano.gof.utils import flatten
 from theano.configparser import config
-from theano.gof.utils import hash_from_code
+from theano.gof.utils import hash_from_code, hash_from_file
 from theano.misc.windows import (subprocess_Popen,
                                  output_subprocess_Popen)
 
 # we will abuse the lockfile mechanism when reading and writing the registry
 from theano.gof import compilelock
-from theano.gof.compiledir import gcc_version_str, local_bitwidth
+from theano.gof.compiledir import (compiledir_format_dict, gcc_version_str,
+                                   local_bitwidth)
 
-from theano.configparser import AddConfigVar, BoolParam
+from theano.configparser import AddConfigVar, BoolParam, IntParam
 
 importlib = None
 try:
@@ -66,6 +72,41 @@ AddConfigVar('cmodule.compilation_warning',
              BoolParam(False))
 
 
+AddConfigVar('cmodule.compilation_workers',
+             "Maximum number of C modules compiled at the same time when "
+             "a new function is built. 1 means that modules are compiled "
+             "one after the other.",
+             IntParam(1, lambda i: i > 0),
+             in_c_key=False)
+
+AddConfigVar('cmodule.use_index',
+             "If True, keep an index of the modules in the cache, so that "
+             "a new process does not need to load all of them at startup. "
+             "They are then loaded when they are needed.",
+             BoolParam(True),
+             in_c_key=False)
+
+AddConfigVar('cmodule.max_cache_size',
+             "Maximum size, in megabytes, of the versioned modules kept in "
+             "the compiledir. When the cache grows larger, the least "
+             "recently used modules are deleted at exit. 0 means no limit.",
+             IntParam(0, lambda i: i >= 0),
+             in_c_key=False)
+
+AddConfigVar('cmodule.precompiled_headers',
+             "If True, g++ uses precompiled versions of the headers included "
+             "by all modules (Python, numpy and Theano helpers). They are "
+             "compiled once in the compiledir for each set of compiler "
+             "options.",
+             BoolParam(False),
+             in_c_key=False)
+
+AddConfigVar('cmodule.release_gil',
+             "If True, the C code of Ops that support it releases the GIL "
+             "while it computes, so other Python threads can run at the "
+             "same time.",
+             BoolParam(True))
+
 AddConfigVar('cmodule.preload_cache',
              "If set to True, will preload the C module cache at import time",
              BoolParam(False, allow_override=False),
@@ -77,6 +118,22 @@ METH_VARARGS = "METH_VARARGS"
 METH_NOARGS = "METH_NOARGS"
 # global variable that represent the total time spent in importing module.
 import_time = 0
+# global variables that represent the total time spent in the C compiler and
+# the number of times it was run. They are updated with _add_cxx_time, as the
+# compiler may be run by several threads.
+cxx_time = 0
+cxx_calls = 0
+_cxx_time_lock = threading.Lock()
+# `in_batch` is True in the threads of `ModuleCache.compile_missing`, whose
+# compilations are timed as a whole.
+_cxx_thread_state = threading.local()
+
+
+def _add_cxx_time(t, calls):
+    global cxx_time, cxx_calls
+    with _cxx_time_lock:
+        cxx_time += t
+        cxx_calls += calls
 
 
 class MissingGXX(Exception):
@@ -352,6 +409,20 @@ def last_access_time(path):
     return os.stat(path)[stat.ST_ATIME]
 
 
+def dir_size(path):
+    """
+    Return the total size in bytes of the files directly in a directory.
+
+    """
+    size = 0
+    for filename in os.listdir(path):
+        try:
+            size += os.path.getsize(os.path.join(path, filename))
+        except OSError:
+            pass
+    return size
+
+
 def module_name_from_dir(dirname, err=True, files=None):
     """
     Scan the contents of a cache directory and return full path of the
@@ -447,6 +518,23 @@ def get_module_hash(src_code, key):
     return hash_from_code('\n'.join(to_hash))
 
 
+def key_digest(key):
+    """
+    Return an MD5 hash of the pickled `key`, or None if it can not be
+    pickled.
+
+    It lets the module index find the directory of a key without generating
+    the source code of the module. The same key may have another digest in
+    another process (e.g. if it contains sets of strings), so the key must
+    still be checked once the directory is loaded.
+
+    """
+    try:
+        return hash_from_code(pickle.dumps(key, protocol=2))
+    except Exception:
+        return None
+
+
 def get_safe_part(key):
     """
     Return a tuple containing a subset of `key`, to be used to find equal keys.
@@ -567,6 +655,177 @@ class KeyData(object):
                 del entry_from_key[key]
 
 
+class ModuleIndex(object):
+    """
+    Append-only file mapping module hashes and keys to their cache directory.
+
+    The first line identifies the format version. Each following line is
+    ``<module hash> <directory name>``, or ``key <key digest> <directory
+    name>`` for one of the keys saved in the key.pkl file of the directory
+    (see `key_digest`). A line is only taken into account
+    once its final newline has been written, so a process that crashes while
+    appending to the index cannot corrupt it. Entries are never removed by
+    `append`: the index may refer to directories that were deleted since,
+    until `write` replaces it by a compacted version.
+
+    Parameters
+    ----------
+    filename
+        Path to the index file.
+
+    """
+
+    header = 'theano module index %d'
+    version = 2
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.reset()
+
+    def reset(self):
+        """
+        Forget what was read from the file.
+
+        """
+        self.entries = {}
+        """
+        Maps a module hash to the list of directories that contain it (the
+        same module may have been compiled by two processes at once).
+
+        """
+        self.key_entries = {}
+        """
+        Maps a key digest to the list of directories whose key.pkl file may
+        contain that key.
+
+        """
+        self.dirs = set()
+        """
+        Set of the directory names in the index.
+
+        """
+        self.n_entries = 0
+        self.valid = False
+        self._pos = 0
+        self._ino = None
+
+    def read(self):
+        """
+        Read the entries appended since the last call.
+
+        Returns
+        -------
+        bool
+            False if there is no index file, or if its format is unknown.
+
+        """
+        try:
+            st = os.stat(self.filename)
+        except OSError:
+            self.reset()
+            return False
+        if st.st_ino != self._ino or st.st_size < self._pos:
+            # The file was replaced by `write`.
+            self.reset()
+            self._ino = st.st_ino
+        if st.st_size == self._pos:
+            return self.valid
+        try:
+            with open(self.filename, 'rb') as f:
+                f.seek(self._pos)
+                data = f.read()
+        except IOError:
+            return self.valid
+        # Ignore the last line if it is not complete yet.
+        end = data.rfind(b('\n')) + 1
+        lines = decode(data[:end]).split('\n')[:-1]
+        if self._pos == 0 and lines:
+            self.valid = (lines[0] == self.header % self.version)
+            lines = lines[1:]
+        self._pos += end
+        if not self.valid:
+            return False
+        for line in lines:
+            parts = line.split(' ')
+            if len(parts) == 2:
+                module_hash, subdirs_elem = parts
+                self.entries.setdefault(module_hash, []).append(subdirs_elem)
+                self.dirs.add(subdirs_elem)
+            elif len(parts) == 3 and parts[0] == 'key':
+                self.key_entries.setdefault(parts[1], []).append(parts[2])
+            else:
+                continue
+            self.n_entries += 1
+        return self.valid
+
+    def append(self, module_hash, subdirs_elem, key_digests=()):
+        """
+        Add an entry at the end of the index, creating it if needed.
+
+        If `module_hash` is None, only the `key_digests` of the directory
+        are added. This must be called with the compilation lock held.
+
+        """
+        lines = ['key %s %s\n' % (digest, subdirs_elem)
+                 for digest in key_digests]
+        if module_hash is not None:
+            lines.insert(0, '%s %s\n' % (module_hash, subdirs_elem))
+        if not lines:
+            return
+        with open(self.filename, 'a+b') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            to_write = ''
+            if size == 0:
+                to_write += self.header % self.version + '\n'
+            else:
+                f.seek(max(0, size - 4096))
+                tail = f.read()
+                if not tail.endswith(b('\n')):
+                    # A process crashed while writing the last line. Readers
+                    # never use an incomplete line, so we can remove it.
+                    end = tail.rfind(b('\n'))
+                    if end >= 0:
+                        f.truncate(size - len(tail) + end + 1)
+                    else:
+                        to_write += '\n'
+            to_write += ''.join(lines)
+            f.seek(0, os.SEEK_END)
+            f.write(b(to_write))
+            f.flush()
+            os.fsync(f.fileno())
+        self.read()
+
+    def write(self, entries, key_entries=()):
+        """
+        Replace the index by one containing `entries`, a list of
+        (module hash, directory name) pairs, and `key_entries`, a list of
+        (key digest, directory name) pairs.
+
+        The new index is written to a temporary file that is then renamed,
+        so other processes never see a partial index. This must be called
+        with the compilation lock held.
+
+        """
+        fd, tmp_filename = tempfile.mkstemp(
+            prefix=os.path.basename(self.filename) + '.',
+            dir=os.path.dirname(self.filename))
+        try:
+            lines = [self.header % self.version]
+            lines.extend('%s %s' % entry for entry in entries)
+            lines.extend('key %s %s' % entry for entry in key_entries)
+            os.write(fd, b('\n'.join(lines) + '\n'))
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        if sys.platform == 'win32' and os.path.exists(self.filename):
+            # os.rename does not replace existing files on Windows.
+            os.remove(self.filename)
+        os.rename(tmp_filename, self.filename)
+        self.reset()
+        self.read()
+
+
 class ModuleCache(object):
     """
     Interface to the cache of dynamically compiled modules on disk.
@@ -589,6 +848,10 @@ class ModuleCache(object):
     - possibly a delete.me file, meaning this directory has been marked
     for deletion.
 
+    While a module is compiled, the lock directory
+    ``module_locks/<module hash>`` prevents other processes from compiling
+    the same module (see the Theano flag `compile.module_lock`).
+
     Keys should be tuples of length 2: (version, rest). The
     ``rest`` can be anything hashable and picklable, that uniquely
     identifies the computation in the module. The key is returned by
@@ -677,6 +940,11 @@ class ModuleCache(object):
         self.check_for_broken_eq = check_for_broken_eq
         self.loaded_key_pkl = set()
         self.time_spent_in_check_key = 0
+        self.index = ModuleIndex(os.path.join(dirname, 'module_index'))
+        self._listing_time = None
+        # Serializes the use of the cache by the threads of this process
+        # (see `vm.background_compile`).
+        self._thread_lock = threading.RLock()
 
         if do_refresh:
             self.refresh()
@@ -704,7 +972,7 @@ class ModuleCache(object):
         return self.module_from_name[name]
 
     def refresh(self, age_thresh_use=None, delete_if_problem=False,
-                cleanup=True):
+                cleanup=True, full_scan=False):
         """
         Update cache data by walking the cache directory structure.
 
@@ -712,6 +980,11 @@ class ModuleCache(object):
         Remove entries which have been removed from the filesystem.
         Also, remove malformed cache directories.
 
+        When the module index is used (Theano flag `cmodule.use_index`),
+        only the directories that are not in the index are walked, and only
+        if the cache directory changed since the last refresh. The modules
+        in the index are loaded later, when they are needed.
+
         Parameters
         ----------
         age_thresh_use
@@ -724,11 +997,15 @@ class ModuleCache(object):
             - Duplicated modules, regardless of their age.
         cleanup : bool
             Do a cleanup of the cache removing expired and broken modules.
+        full_scan : bool
+            If True, walk and load all the directories, even those in the
+            index. The index is created if it does not exist yet.
 
         Returns
         -------
         list
-            A list of modules of age higher than age_thresh_use.
+            A list of modules of age higher than age_thresh_use (only among
+            the directories that were walked).
 
         """
         if age_thresh_use is None:
@@ -749,198 +1026,38 @@ class ModuleCache(object):
 
         # add entries that are not in the entry_from_key dictionary
         time_now = time.time()
+        use_index = config.cmodule.use_index
+        index_ok = use_index and self.index.read()
+        if index_ok and not full_scan:
+            # Directories in the index are loaded lazily, when one of their
+            # keys is needed (see `_load_from_index`).
+            subdirs = self._new_subdirs()
+        else:
+            subdirs = self._list_subdirs()
+        to_index = []
         # Go through directories in alphabetical order to ensure consistent
         # behavior.
-        subdirs = sorted(os.listdir(self.dirname))
-        files, root = None, None  # To make sure the "del" below works
         for subdirs_elem in subdirs:
-            # Never clean/remove lock_dir
-            if subdirs_elem == 'lock_dir':
-                continue
-            root = os.path.join(self.dirname, subdirs_elem)
-            key_pkl = os.path.join(root, 'key.pkl')
-            if key_pkl in self.loaded_key_pkl:
-                continue
-            if not os.path.isdir(root):
-                continue
-            files = os.listdir(root)
-            if not files:
-                rmtree_empty(root, ignore_nocleanup=True,
-                             msg="empty dir")
-                continue
-            if 'delete.me' in files:
-                rmtree(root, ignore_nocleanup=True,
-                       msg="delete.me found in dir")
-                continue
-            elif 'key.pkl' in files:
-                try:
-                    entry = module_name_from_dir(root, files=files)
-                except ValueError:  # there is a key but no dll!
-                    if not root.startswith("/tmp"):
-                        # Under /tmp, file are removed periodically by the
-                        # os. So it is normal that this happens from time
-                        # to time.
-                        _logger.warning("ModuleCache.refresh() Found key "
-                                        "without dll in cache, deleting it. %s",
-                                        key_pkl)
-                    rmtree(root, ignore_nocleanup=True,
-                           msg="missing module file", level=logging.INFO)
-                    continue
-                if (time_now - last_access_time(entry)) < age_thresh_use:
-                    _logger.debug('refresh adding %s', key_pkl)
-
-                    def unpickle_failure():
-                        _logger.info("ModuleCache.refresh() Failed to "
-                                     "unpickle cache file %s", key_pkl)
-
-                    try:
-                        with open(key_pkl, 'rb') as f:
-                            key_data = pickle.load(f)
-                    except EOFError:
-                        # Happened once... not sure why (would be worth
-                        # investigating if it ever happens again).
-                        unpickle_failure()
-                        rmtree(root, ignore_nocleanup=True,
-                               msg='broken cache directory [EOF]',
-                               level=logging.WARNING)
-                        continue
-                    except ValueError:
-                        # This can happen when we have bad config value
-                        # in the cuda.nvcc_compiler.py file.
-                        # We should not hide it here, as this will cause
-                        # an unrelated error to appear.
-                        raise
-                    except Exception:
-                        unpickle_failure()
-                        if delete_if_problem:
-                            rmtree(root, ignore_nocleanup=True,
-                                   msg='broken cache directory',
-                                   level=logging.INFO)
-                        else:
-                            # This exception is often triggered by keys
-                            # that contain references to classes that have
-                            # not yet been imported (e.g. when running two
-                            # different Theano-based scripts). They are not
-                            # necessarily broken, but we cannot load them
-                            # now. They will be loaded later if needed.
-                            pass
-                        continue
-
-                    if not isinstance(key_data, KeyData):
-                        # This is some old cache data, that does not fit
-                        # the new cache format. It would be possible to
-                        # update it, but it is not entirely safe since we
-                        # do not know the config options that were used.
-                        # As a result, we delete it instead (which is also
-                        # simpler to implement).
-                        rmtree(root, ignore_nocleanup=True,
-                               msg=(
-                                   'invalid cache entry format -- this '
-                                   'should not happen unless your cache '
-                                   'was really old'),
-                               level=logging.WARN)
-                        continue
-
-                    # Check the path to the module stored in the KeyData
-                    # object matches the path to `entry`. There may be
-                    # a mismatch e.g. due to symlinks, or some directory
-                    # being renamed since last time cache was created.
-                    kd_entry = key_data.get_entry()
-                    if kd_entry != entry:
-                        if is_same_entry(entry, kd_entry):
-                            # Update KeyData object. Note that we also need
-                            # to update the key_pkl field, because it is
-                            # likely to be incorrect if the entry itself
-                            # was wrong.
-                            key_data.entry = entry
-                            key_data.key_pkl = key_pkl
-                        else:
-                            # This is suspicious. Better get rid of it.
-                            rmtree(root, ignore_nocleanup=True,
-                                   msg='module file path mismatch',
-                                   level=logging.INFO)
-                            continue
-
-                    # Find unversioned keys from other processes.
-                    # TODO: check if this can happen at all
-                    to_del = [key for key in key_data.keys if not key[0]]
-                    if to_del:
-                        _logger.warning(
-                            "ModuleCache.refresh() Found unversioned "
-                            "key in cache, removing it. %s", key_pkl)
-                        # Since the version is in the module hash, all
-                        # keys should be unversioned.
-                        if len(to_del) != len(key_data.keys):
-                            _logger.warning(
-                                'Found a mix of unversioned and '
-                                'versioned keys for the same '
-                                'module %s', key_pkl)
-                        rmtree(root, ignore_nocleanup=True,
-                               msg="unversioned key(s) in cache",
-                               level=logging.INFO)
-                        continue
-
-                    mod_hash = key_data.module_hash
-                    if mod_hash in self.module_hash_to_key_data:
-                        # This may happen when two processes running
-                        # simultaneously compiled the same module, one
-                        # after the other. We delete one once it is old
-                        # enough (to be confident there is no other process
-                        # using it), or if `delete_if_problem` is True.
-                        # Note that it is important to walk through
-                        # directories in alphabetical order so as to make
-                        # sure all new processes only use the first one.
-                        if cleanup:
-                            age = time.time() - last_access_time(entry)
-                            if delete_if_problem or age > self.age_thresh_del:
-                                rmtree(root, ignore_nocleanup=True,
-                                       msg='duplicated module',
-                                       level=logging.DEBUG)
-                            else:
-                                _logger.debug('Found duplicated module not '
-                                              'old enough yet to be deleted '
-                                              '(age: %s): %s',
-                                              age, entry)
-                        continue
-
-                    # Remember the map from a module's hash to the KeyData
-                    # object associated with it.
-                    self.module_hash_to_key_data[mod_hash] = key_data
-
-                    for key in key_data.keys:
-                        if key not in self.entry_from_key:
-                            self.entry_from_key[key] = entry
-                            # Assert that we have not already got this
-                            # entry somehow.
-                            assert entry not in self.module_from_name
-                            # Store safe part of versioned keys.
-                            if key[0]:
-                                self.similar_keys.setdefault(
-                                    get_safe_part(key),
-                                    []).append(key)
-                        else:
-                            dir1 = os.path.dirname(self.entry_from_key[key])
-                            dir2 = os.path.dirname(entry)
-                            _logger.warning(
-                                "The same cache key is associated to "
-                                "different modules (%s and %s). This "
-                                "is not supposed to happen! You may "
-                                "need to manually delete your cache "
-                                "directory to fix this.",
-                                dir1, dir2)
-                    # Clean up the name space to prevent bug.
-                    if key_data.keys:
-                        del key
-                    self.loaded_key_pkl.add(key_pkl)
+            mod_hash = self._load_dir(subdirs_elem, time_now, age_thresh_use,
+                                      delete_if_problem, cleanup, rmtree,
+                                      rmtree_empty, too_old_to_use)
+            if (use_index and mod_hash is not None and
+                    subdirs_elem not in self.index.dirs):
+                to_index.append((mod_hash, subdirs_elem))
+
+        if use_index and (to_index or not index_ok):
+            with compilelock.lock_ctx():
+                if self.index.read():
+                    for mod_hash, subdirs_elem in to_index:
+                        self.index.append(
+                            mod_hash, subdirs_elem,
+                            self._index_key_digests(mod_hash, subdirs_elem))
                 else:
-                    too_old_to_use.append(entry)
-
-            # If the compilation failed, no key.pkl is in that
-            # directory, but a mod.* should be there.
-            # We do nothing here.
-
-        # Clean up the name space to prevent bug.
-        del root, files, subdirs
+                    # There is no index yet (or one in an unknown format), so
+                    # we walked all directories: build it from what we
+                    # loaded.
+                    self.index.write(self._index_entries(),
+                                     self._index_key_entries())
 
         # Remove entries that are not in the filesystem.
         items_copy = list(self.module_hash_to_key_data.items())
@@ -999,6 +1116,323 @@ class ModuleCache(object):
 
         return too_old_to_use
 
+    def _load_dir(self, subdirs_elem, time_now, age_thresh_use,
+                  delete_if_problem, cleanup, rmtree, rmtree_empty,
+                  too_old_to_use):
+        """
+        Load the cache entry in the directory `subdirs_elem`, for `refresh`.
+
+        Returns
+        -------
+        str or None
+            The hash of the module, if it was added to the cache.
+
+        """
+        # Never clean/remove lock_dir and module_locks
+        if subdirs_elem in ('lock_dir', 'module_locks',
+                            'precompiled_headers'):
+            return None
+        root = os.path.join(self.dirname, subdirs_elem)
+        key_pkl = os.path.join(root, 'key.pkl')
+        if key_pkl in self.loaded_key_pkl:
+            return None
+        if not os.path.isdir(root):
+            return None
+        files = os.listdir(root)
+        if not files:
+            rmtree_empty(root, ignore_nocleanup=True,
+                         msg="empty dir")
+            return None
+        if 'delete.me' in files:
+            rmtree(root, ignore_nocleanup=True,
+                   msg="delete.me found in dir")
+            return None
+        elif 'key.pkl' in files:
+            try:
+                entry = module_name_from_dir(root, files=files)
+            except ValueError:  # there is a key but no dll!
+                if not root.startswith("/tmp"):
+                    # Under /tmp, file are removed periodically by the
+                    # os. So it is normal that this happens from time
+                    # to time.
+                    _logger.warning("ModuleCache.refresh() Found key "
+                                    "without dll in cache, deleting it. %s",
+                                    key_pkl)
+                rmtree(root, ignore_nocleanup=True,
+                       msg="missing module file", level=logging.INFO)
+                return None
+            if (time_now - last_access_time(entry)) < age_thresh_use:
+                _logger.debug('refresh adding %s', key_pkl)
+
+                def unpickle_failure():
+                    _logger.info("ModuleCache.refresh() Failed to "
+                                 "unpickle cache file %s", key_pkl)
+
+                try:
+                    with open(key_pkl, 'rb') as f:
+                        key_data = pickle.load(f)
+                except EOFError:
+                    # Happened once... not sure why (would be worth
+                    # investigating if it ever happens again).
+                    unpickle_failure()
+                    rmtree(root, ignore_nocleanup=True,
+                           msg='broken cache directory [EOF]',
+                           level=logging.WARNING)
+                    return None
+                except ValueError:
+                    # This can happen when we have bad config value
+                    # in the cuda.nvcc_compiler.py file.
+                    # We should not hide it here, as this will cause
+                    # an unrelated error to appear.
+                    raise
+                except Exception:
+                    unpickle_failure()
+                    if delete_if_problem:
+                        rmtree(root, ignore_nocleanup=True,
+                               msg='broken cache directory',
+                               level=logging.INFO)
+                    else:
+                        # This exception is often triggered by keys
+                        # that contain references to classes that have
+                        # not yet been imported (e.g. when running two
+                        # different Theano-based scripts). They are not
+                        # necessarily broken, but we cannot load them
+                        # now. They will be loaded later if needed.
+                        pass
+                    return None
+
+                if not isinstance(key_data, KeyData):
+                    # This is some old cache data, that does not fit
+                    # the new cache format. It would be possible to
+                    # update it, but it is not entirely safe since we
+                    # do not know the config options that were used.
+                    # As a result, we delete it instead (which is also
+                    # simpler to implement).
+                    rmtree(root, ignore_nocleanup=True,
+                           msg=(
+                               'invalid cache entry format -- this '
+                               'should not happen unless your cache '
+                               'was really old'),
+                           level=logging.WARN)
+                    return None
+
+                # Check the path to the module stored in the KeyData
+                # object matches the path to `entry`. There may be
+                # a mismatch e.g. due to symlinks, or some directory
+                # being renamed since last time cache was created.
+                kd_entry = key_data.get_entry()
+                if kd_entry != entry:
+                    if is_same_entry(entry, kd_entry):
+                        # Update KeyData object. Note that we also need
+                        # to update the key_pkl field, because it is
+                        # likely to be incorrect if the entry itself
+                        # was wrong.
+                        key_data.entry = entry
+                        key_data.key_pkl = key_pkl
+                    else:
+                        # This is suspicious. Better get rid of it.
+                        rmtree(root, ignore_nocleanup=True,
+                               msg='module file path mismatch',
+                               level=logging.INFO)
+                        return None
+
+                # Find unversioned keys from other processes.
+                # TODO: check if this can happen at all
+                to_del = [key for key in key_data.keys if not key[0]]
+                if to_del:
+                    _logger.warning(
+                        "ModuleCache.refresh() Found unversioned "
+                        "key in cache, removing it. %s", key_pkl)
+                    # Since the version is in the module hash, all
+                    # keys should be unversioned.
+                    if len(to_del) != len(key_data.keys):
+                        _logger.warning(
+                            'Found a mix of unversioned and '
+                            'versioned keys for the same '
+                            'module %s', key_pkl)
+                    rmtree(root, ignore_nocleanup=True,
+                           msg="unversioned key(s) in cache",
+                           level=logging.INFO)
+                    return None
+
+                mod_hash = key_data.module_hash
+                if mod_hash in self.module_hash_to_key_data:
+                    # This may happen when two processes running
+                    # simultaneously compiled the same module, one
+                    # after the other. We delete one once it is old
+                    # enough (to be confident there is no other process
+                    # using it), or if `delete_if_problem` is True.
+                    # Note that it is important to walk through
+                    # directories in alphabetical order so as to make
+                    # sure all new processes only use the first one.
+                    if cleanup:
+                        age = time.time() - last_access_time(entry)
+                        if delete_if_problem or age > self.age_thresh_del:
+                            rmtree(root, ignore_nocleanup=True,
+                                   msg='duplicated module',
+                                   level=logging.DEBUG)
+                        else:
+                            _logger.debug('Found duplicated module not '
+                                          'old enough yet to be deleted '
+                                          '(age: %s): %s',
+                                          age, entry)
+                    return None
+
+                # Remember the map from a module's hash to the KeyData
+                # object associated with it.
+                self.module_hash_to_key_data[mod_hash] = key_data
+
+                for key in key_data.keys:
+                    if key not in self.entry_from_key:
+                        self.entry_from_key[key] = entry
+                        # Assert that we have not already got this
+                        # entry somehow.
+                        assert entry not in self.module_from_name
+                        # Store safe part of versioned keys.
+                        if key[0]:
+                            self.similar_keys.setdefault(
+                                get_safe_part(key),
+                                []).append(key)
+                    else:
+                        dir1 = os.path.dirname(self.entry_from_key[key])
+                        dir2 = os.path.dirname(entry)
+                        _logger.warning(
+                            "The same cache key is associated to "
+                            "different modules (%s and %s). This "
+                            "is not supposed to happen! You may "
+                            "need to manually delete your cache "
+                            "directory to fix this.",
+                            dir1, dir2)
+                self.loaded_key_pkl.add(key_pkl)
+                return mod_hash
+            else:
+                too_old_to_use.append(entry)
+
+        # If the compilation failed, no key.pkl is in that
+        # directory, but a mod.* should be there.
+        # We do nothing here.
+        return None
+
+    def _list_subdirs(self):
+        """
+        Return the sorted list of all entries in the cache directory.
+
+        """
+        self._listing_time = time.time()
+        return sorted(os.listdir(self.dirname))
+
+    def _new_subdirs(self):
+        """
+        Return the sorted list of directories that are not in the index.
+
+        The cache directory is only listed when its modification time shows
+        that an entry was added or removed since the last listing.
+
+        """
+        if self._listing_time is not None:
+            try:
+                mtime = os.stat(self.dirname).st_mtime
+            except OSError:
+                mtime = None
+            # Leave some slack for filesystems with a coarse time
+            # resolution.
+            if mtime is not None and mtime < self._listing_time - 2:
+                return []
+        return [d for d in self._list_subdirs() if d not in self.index.dirs]
+
+    def _load_from_index(self, module_hash):
+        """
+        Load the cache entry of `module_hash` if it is in the index.
+
+        Returns
+        -------
+        bool
+            True if the module was loaded.
+
+        """
+        if (not config.cmodule.use_index or
+                module_hash in self.module_hash_to_key_data or
+                not self.index.read()):
+            return False
+        too_old_to_use = []
+
+        def no_rmtree(*args, **kwargs):
+            pass
+
+        for subdirs_elem in self.index.entries.get(module_hash, []):
+            loaded = self._load_dir(subdirs_elem, time.time(),
+                                    self.age_thresh_use, False, False,
+                                    no_rmtree, no_rmtree, too_old_to_use)
+            if loaded is not None:
+                return True
+        return False
+
+    def _load_from_key_index(self, key):
+        """
+        Load the cache entries that the index lists for `key`.
+
+        Returns
+        -------
+        bool
+            True if `key` is now in the cache.
+
+        """
+        if (not config.cmodule.use_index or not key[0] or
+                not self.index.read()):
+            return False
+        digest = key_digest(key)
+        too_old_to_use = []
+
+        def no_rmtree(*args, **kwargs):
+            pass
+
+        for subdirs_elem in self.index.key_entries.get(digest, []):
+            self._load_dir(subdirs_elem, time.time(), self.age_thresh_use,
+                           False, False, no_rmtree, no_rmtree, too_old_to_use)
+            if key in self.entry_from_key:
+                return True
+        return False
+
+    def _index_key_digests(self, module_hash, subdirs_elem):
+        """
+        Return the digests of the versioned keys of the module `module_hash`
+        if it was loaded from the directory `subdirs_elem`.
+
+        """
+        key_data = self.module_hash_to_key_data.get(module_hash)
+        if (key_data is None or os.path.basename(
+                os.path.dirname(key_data.key_pkl)) != subdirs_elem):
+            return []
+        digests = [key_digest(k) for k in key_data.keys if k[0]]
+        return sorted(d for d in digests if d is not None)
+
+    def _index_entries(self):
+        """
+        Return the (module hash, directory name) pairs of the versioned
+        modules loaded in the cache.
+
+        """
+        entries = []
+        for module_hash, key_data in iteritems(self.module_hash_to_key_data):
+            # Unversioned modules have no key.pkl file.
+            if os.path.exists(key_data.key_pkl):
+                subdirs_elem = os.path.basename(
+                    os.path.dirname(key_data.key_pkl))
+                entries.append((module_hash, subdirs_elem))
+        return sorted(entries, key=lambda e: e[1])
+
+    def _index_key_entries(self):
+        """
+        Return the (key digest, directory name) pairs of the versioned keys
+        loaded in the cache.
+
+        """
+        entries = []
+        for module_hash, module_dir in self._index_entries():
+            for digest in self._index_key_digests(module_hash, module_dir):
+                entries.append((digest, module_dir))
+        return entries
+
     def _get_from_key(self, key, key_data=None):
         """
         Returns a module if the passed-in key is found in the cache
@@ -1025,6 +1459,10 @@ class ModuleCache(object):
         return self._get_module(name)
 
     def _get_from_hash(self, module_hash, key, keep_lock=False):
+        if (self._load_from_index(module_hash) and
+                key in self.entry_from_key):
+            # The key was saved with the module we just loaded.
+            return self._get_from_key(key)
         if module_hash in self.module_hash_to_key_data:
             key_data = self.module_hash_to_key_data[module_hash]
             module = self._get_from_key(None, key_data)
@@ -1041,6 +1479,13 @@ class ModuleCache(object):
                 if (key[0] and not key_broken and
                         self.check_for_broken_eq):
                     self.check_key(key, key_data.key_pkl)
+                # Later lookups of this key do not need the source code.
+                if (key[0] and not key_broken and
+                        config.cmodule.use_index and self.index.read()):
+                    digest = key_digest(key)
+                    if digest is not None:
+                        self.index.append(None, os.path.basename(
+                            os.path.dirname(key_data.key_pkl)), [digest])
             self._update_mappings(key, key_data, module.__file__, check_in_keys=not key_broken)
             return module
         else:
@@ -1094,6 +1539,12 @@ class ModuleCache(object):
             if not key_broken and self.check_for_broken_eq:
                 self.check_key(key, key_pkl)
             self.loaded_key_pkl.add(key_pkl)
+            if config.cmodule.use_index and self.index.read():
+                digests = []
+                if not key_broken:
+                    digests = [d for d in [key_digest(key)] if d is not None]
+                self.index.append(module_hash, os.path.basename(location),
+                                  digests)
         elif config.cmodule.warn_no_version:
             key_flat = flatten(key)
             ops = [k for k in key_flat if isinstance(k, theano.Op)]
@@ -1115,15 +1566,22 @@ class ModuleCache(object):
             we avoid compilation.
         lnk
             Usually a CLinker instance, but it can be any object that defines
-            the `get_src_code()` and `compile_cmodule(location)` functions. The
-            first one returns the source code of the module to load/compile and
-            the second performs the actual compilation.
+            the `get_src_code()` and `compile_cmodule(location, lock)`
+            functions. The first one returns the source code of the module to
+            load/compile and the second performs the actual compilation
+            (without taking the compilation lock when `lock` is False).
         keep_lock : bool
             If True, the compilation lock will not be released if taken.
 
         """
+        with self._thread_lock:
+            return self._module_from_key(key, lnk, keep_lock)
+
+    def _module_from_key(self, key, lnk, keep_lock):
         # Is the module in the cache?
         module = self._get_from_key(key)
+        if module is None and self._load_from_key_index(key):
+            module = self._get_from_key(key)
         if module is not None:
             return module
 
@@ -1134,37 +1592,41 @@ class ModuleCache(object):
         if module is not None:
             return module
 
-        with compilelock.lock_ctx(keep_lock=keep_lock):
-            # 1) Maybe somebody else compiled it for us while we
-            #    where waiting for the lock. Try to load it again.
-            # 2) If other repo that import Theano have Theano ops defined,
-            #    we need to refresh the cache here. Otherwise, there are import
-            #    order problems.
-            #    When device=gpu, we compile during Theano
-            #    import. This triggers the loading of the cache. But
-            #    unpickling the cache asks that the external Ops are
-            #    completly loaded, which isn't always the case!
-            #    If a module isn't completly loaded and its unpickling
-            #    fails, it means it is safe for this function
-            #    compilation to skip them, but not for future
-            #    compilations. So reloading the cache here
-            #    compilation fixes this problem. (we could do that only once)
-            self.refresh(cleanup=False)
-
-            module = self._get_from_key(key)
-            if module is not None:
-                return module
-
-            module = self._get_from_hash(module_hash, key)
-            if module is not None:
-                return module
+        with self._module_lock([module_hash]):
+            with compilelock.lock_ctx(keep_lock=keep_lock):
+                # 1) Maybe somebody else compiled it for us while we
+                #    where waiting for the lock. Try to load it again.
+                # 2) If other repo that import Theano have Theano ops defined,
+                #    we need to refresh the cache here. Otherwise, there are
+                #    import order problems.
+                #    When device=gpu, we compile during Theano
+                #    import. This triggers the loading of the cache. But
+                #    unpickling the cache asks that the external Ops are
+                #    completly loaded, which isn't always the case!
+                #    If a module isn't completly loaded and its unpickling
+                #    fails, it means it is safe for this function
+                #    compilation to skip them, but not for future
+                #    compilations. So reloading the cache here
+                #    compilation fixes this problem. (we could do that only
+                #    once)
+                self.refresh(cleanup=False)
+
+                module = self._get_from_key(key)
+                if module is not None:
+                    return module
+
+                module = self._get_from_hash(module_hash, key)
+                if module is not None:
+                    return module
 
             hash_key = hash(key)
 
             nocleanup = False
             try:
                 location = dlimport_workdir(self.dirname)
-                module = lnk.compile_cmodule(location)
+                # We hold the lock of this module (or of the whole
+                # compilation directory), so the linker must not take it.
+                module = lnk.compile_cmodule(location, lock=False)
                 name = module.__file__
                 assert name.startswith(location)
                 assert name not in self.module_from_name
@@ -1186,12 +1648,171 @@ class ModuleCache(object):
             # compilation.
             assert hash(key) == hash_key
 
-            key_data = self._add_to_cache(module, key, module_hash)
-            self.module_hash_to_key_data[module_hash] = key_data
+            with compilelock.lock_ctx(keep_lock=keep_lock):
+                key_data = self._add_to_cache(module, key, module_hash)
+                self.module_hash_to_key_data[module_hash] = key_data
 
         self.stats[2] += 1
         return module
 
+    def compile_missing(self, keys_and_linkers, n_workers=None):
+        """
+        Compile at the same time the modules that are not in the cache yet.
+
+        Parameters
+        ----------
+        keys_and_linkers
+            Iterable of (key, lnk) pairs, with `key` and `lnk` as in
+            `module_from_key`. `lnk` must also define
+            `compile_cmodule_args(location)`, that returns the compiler to
+            use and the keyword arguments of its `compile_str` method.
+        n_workers
+            Maximum number of compilations run at the same time. Defaults
+            to the Theano flag `cmodule.compilation_workers`.
+
+        Returns
+        -------
+        int
+            The number of modules that were compiled and added to the cache.
+
+        Notes
+        -----
+        The compiler processes are run in parallel, but everything else
+        (code generation, loading of the modules and update of the cache)
+        is done sequentially in the calling thread. If the compilation of a
+        module fails, it is just not added to the cache: the following call
+        to `module_from_key` will then compile it again and report the error
+        as usual.
+
+        """
+        with self._thread_lock:
+            return self._compile_missing(keys_and_linkers, n_workers)
+
+    def _compile_missing(self, keys_and_linkers, n_workers):
+        if n_workers is None:
+            n_workers = config.cmodule.compilation_workers
+
+        def find_missing():
+            missing = OrderedDict()
+            seen_keys = set()
+            for key, lnk in keys_and_linkers:
+                # Equal keys may come with different source code (e.g. for
+                # unversioned Ops): only the first one is compiled, as in
+                # module_from_key.
+                if key in seen_keys:
+                    continue
+                seen_keys.add(key)
+                if (self._get_from_key(key) is not None or
+                        self._load_from_key_index(key)):
+                    continue
+                module_hash = get_module_hash(lnk.get_src_code(), key)
+                if module_hash in missing:
+                    continue
+                if self._get_from_hash(module_hash, key) is not None:
+                    continue
+                missing[module_hash] = (key, lnk)
+            return missing
+
+        keys_and_linkers = list(keys_and_linkers)
+        missing = find_missing()
+        if not missing:
+            return 0
+
+        n_compiled = 0
+        with self._module_lock(list(missing.keys())) as refresh:
+            with compilelock.lock_ctx():
+                # Somebody else may have compiled some of these modules
+                # while we were waiting for the lock.
+                self.refresh(cleanup=False)
+                jobs = []
+                for module_hash, (key, lnk) in iteritems(find_missing()):
+                    location = dlimport_workdir(self.dirname)
+                    compiler, kwargs = lnk.compile_cmodule_args(location)
+                    jobs.append((module_hash, key, location, compiler,
+                                 kwargs))
+            if not jobs:
+                return 0
+
+            def compile_job(job):
+                module_hash, key, location, compiler, kwargs = job
+                _cxx_thread_state.in_batch = True
+                try:
+                    compiler.compile_str(py_module=False, **kwargs)
+                except Exception as e:
+                    return e
+                return None
+
+            # gcc runs in its own process, so threads are enough to keep
+            # `n_workers` compilations going at the same time.
+            pool = ThreadPool(min(n_workers, len(jobs)))
+            t0 = time.time()
+            try:
+                result = pool.map_async(compile_job, jobs)
+                # The batch may take longer than compile.timeout.
+                while not result.ready():
+                    result.wait(max(config.compile.timeout / 4., 1.))
+                    refresh()
+                errors = result.get()
+            finally:
+                pool.close()
+                pool.join()
+                # The wall time, not the sum of the time of each job.
+                _add_cxx_time(time.time() - t0, len(jobs))
+
+            with compilelock.lock_ctx():
+                for job, error in zip(jobs, errors):
+                    module_hash, key, location, compiler, kwargs = job
+                    if error is not None:
+                        _logger.debug('Parallel compilation of %s failed: %s',
+                                      location, error)
+                        _rmtree(location, ignore_if_missing=True,
+                                msg='exception during parallel compilation')
+                        continue
+                    # This is what compile_str does when py_module is True.
+                    open(os.path.join(location, "__init__.py"), 'w').close()
+                    module = dlimport(module_name_from_dir(location))
+                    name = module.__file__
+                    assert name not in self.module_from_name
+                    self.module_from_name[name] = module
+                    key_data = self._add_to_cache(module, key, module_hash)
+                    self.module_hash_to_key_data[module_hash] = key_data
+                    self.stats[2] += 1
+                    n_compiled += 1
+        return n_compiled
+
+    @contextmanager
+    def _module_lock(self, module_hashes):
+        """
+        Lock the compilation of the modules identified by `module_hashes`.
+
+        Other processes can meanwhile compile other modules, but should
+        take the lock of the whole compilation directory to update the
+        cache metadata (the key.pkl files).
+
+        The lock of the whole compilation directory is used instead if the
+        Theano flag `compile.module_lock` is False, or if this process
+        already holds it (waiting for a module lock while holding it could
+        deadlock with another process).
+
+        The context gives a function to call regularly when the lock is
+        held for a long time, so that it is refreshed and not considered
+        stale by the other processes.
+
+        """
+        if (config.compile.module_lock and
+                not compilelock.lock_is_held()):
+            lock_dirs = [os.path.join(self.dirname, 'module_locks', h)
+                         for h in module_hashes]
+            with compilelock.multi_lock_ctx(lock_dirs) as refresh:
+                yield refresh
+        else:
+            with compilelock.lock_ctx():
+                def refresh():
+                    # Taking the held lock again refreshes it when needed.
+                    compilelock.get_lock()
+                    compilelock.release_lock()
+                yield refresh
+
     def check_key(self, key, key_pkl):
         """
         Perform checks to detect broken __eq__ / __hash__ implementations.
@@ -1260,7 +1881,8 @@ class ModuleCache(object):
 
     """
 
-    def clear_old(self, age_thresh_del=None, delete_if_problem=False):
+    def clear_old(self, age_thresh_del=None, delete_if_problem=False,
+                  full_scan=True):
         """
         Delete entries from the filesystem for cache entries that are too old.
 
@@ -1272,6 +1894,11 @@ class ModuleCache(object):
             Defaults to 31-day age if not provided.
         delete_if_problem
             See help of refresh() method.
+        full_scan
+            If False and the module index can be used, the age of the
+            indexed modules is read from their directory without loading
+            their key.pkl file, and only the directories that are not in the
+            index are walked.
 
         """
         if age_thresh_del is None:
@@ -1296,9 +1923,22 @@ class ModuleCache(object):
             # Update the age of modules that have been accessed by other
             # processes and get all module that are too old to use
             # (not loaded in self.entry_from_key).
+            use_index = (not full_scan and config.cmodule.use_index and
+                         self.index.read())
             too_old_to_use = self.refresh(
                 age_thresh_use=age_thresh_use,
-                delete_if_problem=delete_if_problem)
+                delete_if_problem=delete_if_problem,
+                full_scan=not use_index)
+            if use_index:
+                if age_thresh_use is None:
+                    age_thresh_use = self.age_thresh_use
+                time_now = time.time()
+                for module_hash, entry in self._indexed_modules():
+                    if (entry not in self.module_from_name and
+                            time_now - last_access_time(entry) >
+                            age_thresh_use):
+                        self._forget_module(module_hash, entry)
+                        too_old_to_use.append(entry)
 
             for entry in too_old_to_use:
                 # TODO: we are assuming that modules that haven't been
@@ -1311,6 +1951,276 @@ class ModuleCache(object):
                 _rmtree(parent, msg='old cache directory', level=logging.INFO,
                         ignore_nocleanup=True)
 
+            self._prune_index(full_scan=not use_index)
+
+    def clear_lru(self, max_size=None, full_scan=True):
+        """
+        Delete the least recently used modules until the cache fits in
+        ``max_size``.
+
+        Only versioned modules count towards the size of the cache and can
+        be deleted. Modules loaded by this process are never deleted.
+
+        Parameters
+        ----------
+        max_size
+            Maximum size of the cache, in bytes. Defaults to
+            ``config.cmodule.max_cache_size`` megabytes if not provided.
+        full_scan
+            If False and the module index can be used, the modules are
+            listed from the index, without loading their key.pkl file.
+
+        Returns
+        -------
+        tuple of int
+            The size of the cache before and after the clean-up, in bytes.
+
+        """
+        if max_size is None:
+            max_size = config.cmodule.max_cache_size * 1024 * 1024
+
+        with compilelock.lock_ctx():
+            use_index = (not full_scan and config.cmodule.use_index and
+                         self.index.read())
+            # Make sure that all modules on disk are known (in the index,
+            # for the directories that were not loaded).
+            self.refresh(full_scan=not use_index)
+
+            if use_index:
+                versioned = list(self._indexed_modules())
+            else:
+                versioned = []
+                for module_hash, key_data in iteritems(
+                        self.module_hash_to_key_data):
+                    if not key_data.keys or not list(key_data.keys)[0][0]:
+                        # Unversioned or broken, see clear_unversioned.
+                        continue
+                    versioned.append((module_hash, key_data.get_entry()))
+
+            modules = []
+            total_size = 0
+            for module_hash, entry in versioned:
+                parent = os.path.dirname(entry)
+                try:
+                    atime = last_access_time(entry)
+                    size = dir_size(parent)
+                except OSError:
+                    continue
+                total_size += size
+                if entry not in self.module_from_name:
+                    modules.append((atime, size, module_hash, entry))
+            size_before = total_size
+
+            # Oldest access first.
+            modules.sort()
+            for atime, size, module_hash, entry in modules:
+                if total_size <= max_size:
+                    break
+                self._forget_module(module_hash, entry)
+                parent = os.path.dirname(entry)
+                assert parent.startswith(os.path.join(self.dirname, 'tmp'))
+                _rmtree(parent, msg='least recently used',
+                        level=logging.INFO, ignore_nocleanup=True)
+                total_size -= size
+
+            self._prune_index(full_scan=not use_index)
+        return size_before, total_size
+
+    def _indexed_modules(self):
+        """
+        Yield the (module hash, module file) pairs of the modules in the
+        index that are still on disk, without loading their key.pkl file.
+
+        """
+        for module_hash, dirs in sorted(iteritems(self.index.entries)):
+            for subdirs_elem in dirs:
+                root = os.path.join(self.dirname, subdirs_elem)
+                try:
+                    entry = module_name_from_dir(root, err=False)
+                except (OSError, ValueError):
+                    continue
+                if entry is not None:
+                    yield module_hash, entry
+
+    def _forget_module(self, module_hash, entry):
+        """
+        Remove the module in the file `entry` from the loaded cache, if it
+        was loaded.
+
+        """
+        key_data = self.module_hash_to_key_data.get(module_hash)
+        if key_data is not None and key_data.get_entry() == entry:
+            del self.module_hash_to_key_data[module_hash]
+            key_data.delete_keys_from(self.entry_from_key,
+                                      do_manual_check=False)
+            self.loaded_key_pkl.discard(key_data.key_pkl)
+
+    def _prune_index(self, full_scan=True):
+        """
+        Rewrite the index if modules were deleted from the cache.
+
+        With `full_scan`, all modules on disk must have been loaded by
+        `refresh`. Otherwise, the index entries whose directory is gone are
+        removed.
+
+        """
+        if config.cmodule.use_index and self.index.read():
+            if full_scan:
+                entries = self._index_entries()
+                key_entries = self._index_key_entries()
+            else:
+                def existing(index_entries):
+                    return sorted(
+                        set((name, subdirs_elem)
+                            for name, dirs in iteritems(index_entries)
+                            for subdirs_elem in dirs
+                            if os.path.isdir(os.path.join(self.dirname,
+                                                          subdirs_elem))),
+                        key=lambda e: e[1])
+                entries = existing(self.index.entries)
+                key_entries = existing(self.index.key_entries)
+            if self.index.n_entries != len(entries) + len(key_entries):
+                self.index.write(entries, key_entries)
+
+    def export_bundle(self, filename):
+        """
+        Save the versioned modules of the cache into a tarball.
+
+        The tarball also contains the `platform_fingerprint` of this
+        machine. It can be loaded in the cache of another machine with the
+        same fingerprint by `import_bundle`.
+
+        Parameters
+        ----------
+        filename
+            Path of the gzipped tarball to create.
+
+        Returns
+        -------
+        int
+            The number of exported modules.
+
+        """
+        with compilelock.lock_ctx():
+            # Make sure that all modules on disk are known.
+            self.refresh(full_scan=True)
+            modules = []
+            for module_hash, key_data in sorted(
+                    iteritems(self.module_hash_to_key_data)):
+                if not key_data.keys or not list(key_data.keys)[0][0]:
+                    # Unversioned or broken modules can not be reused.
+                    continue
+                modules.append((module_hash,
+                                os.path.dirname(key_data.get_entry())))
+
+            manifest = dict(version=BUNDLE_VERSION,
+                            fingerprint=platform_fingerprint(),
+                            modules=[(module_hash, os.path.basename(location))
+                                     for module_hash, location in modules])
+            data = b(json.dumps(manifest, indent=1, sort_keys=True))
+            info = tarfile.TarInfo(BUNDLE_MANIFEST)
+            info.size = len(data)
+            info.mtime = time.time()
+
+            tar = tarfile.open(filename, 'w:gz')
+            try:
+                tar.addfile(info, BytesIO(data))
+                for module_hash, location in modules:
+                    name = os.path.basename(location)
+                    for f_name in sorted(os.listdir(location)):
+                        path = os.path.join(location, f_name)
+                        if f_name != 'delete.me' and os.path.isfile(path):
+                            tar.add(path, arcname=name + '/' + f_name)
+            finally:
+                tar.close()
+        return len(modules)
+
+    def import_bundle(self, filename, check_fingerprint=True):
+        """
+        Add to the cache the modules saved by `export_bundle`.
+
+        Nothing is compiled: the modules are copied into the cache directory
+        and loaded by `refresh`. Modules already in the cache are skipped.
+
+        Parameters
+        ----------
+        filename
+            Path of the tarball.
+        check_fingerprint : bool
+            If True, raise a ValueError if the tarball was created on a
+            machine whose `platform_fingerprint` is different from this one.
+
+        Returns
+        -------
+        int
+            The number of imported modules.
+
+        """
+        tar = tarfile.open(filename, 'r:*')
+        try:
+            try:
+                manifest = json.loads(decode(
+                    tar.extractfile(BUNDLE_MANIFEST).read()))
+            except KeyError:
+                raise ValueError('%s is not a bundle of compiled modules' %
+                                 filename)
+            if manifest.get('version') != BUNDLE_VERSION:
+                raise ValueError('Unsupported version of the bundle %s: %s' %
+                                 (filename, manifest.get('version')))
+            if check_fingerprint:
+                local = platform_fingerprint()
+                other = manifest['fingerprint']
+                diff = sorted(k for k in set(local) | set(other)
+                              if local.get(k) != other.get(k))
+                if diff:
+                    raise ValueError(
+                        'The modules in %s were compiled on an incompatible '
+                        'platform. Differences: %s' % (filename, ', '.join(
+                            '%s (%s != %s)' % (k, other.get(k), local.get(k))
+                            for k in diff)))
+
+            # Only consider files in the directory of a module.
+            members = {}
+            for info in tar.getmembers():
+                parts = info.name.split('/')
+                if (info.isfile() and len(parts) == 2 and
+                        parts[0].startswith('tmp') and
+                        parts[1] not in ('', '.', '..') and
+                        not any(os.sep in p for p in parts)):
+                    members.setdefault(parts[0], []).append(info)
+
+            n_imported = 0
+            with compilelock.lock_ctx():
+                self.refresh(full_scan=True)
+                known = (set(self.module_hash_to_key_data) |
+                         set(self.index.entries))
+                for module_hash, name in manifest['modules']:
+                    infos = members.get(name, [])
+                    if (module_hash in known or
+                            name + '/key.pkl' not in [i.name for i in infos]):
+                        continue
+                    location = os.path.join(self.dirname, name)
+                    if os.path.exists(location):
+                        continue
+                    os.mkdir(location)
+                    # As for a compilation, key.pkl is written last so that
+                    # other processes ignore the module until it is complete.
+                    infos.sort(key=lambda i: i.name.endswith('/key.pkl'))
+                    for info in infos:
+                        path = os.path.join(location,
+                                            info.name.split('/')[1])
+                        with open(path, 'wb') as f:
+                            shutil.copyfileobj(tar.extractfile(info), f)
+                    known.add(module_hash)
+                    n_imported += 1
+                # The modules keep their directory name, so refresh() can fix
+                # the paths stored in their KeyData. This also adds them to
+                # the index.
+                self.refresh()
+        finally:
+            tar.close()
+        return n_imported
+
     def clear(self, unversioned_min_age=None, clear_base_files=False,
               delete_if_problem=False):
         """
@@ -1462,9 +2372,13 @@ class ModuleCache(object):
 
     def _on_atexit(self):
         # Note: no need to call refresh() since it is called by clear_old().
-        with compilelock.lock_ctx():
-            self.clear_old()
+        # The index is enough to find old modules: the full scan is left to
+        # the theano-cache command.
+        with self._thread_lock, compilelock.lock_ctx():
+            self.clear_old(full_scan=False)
             self.clear_unversioned()
+            if config.cmodule.max_cache_size:
+                self.clear_lru(full_scan=False)
         _logger.debug('Time spent checking keys: %s',
                       self.time_spent_in_check_key)
 
@@ -1498,6 +2412,31 @@ def _rmtree(parent, ignore_nocleanup=False, msg='', level=logging.DEBUG,
 
 _module_cache = None
 
+# Name of the description of the content of a bundle created by
+# ModuleCache.export_bundle, and version of its format.
+BUNDLE_MANIFEST = 'theano_modules.json'
+BUNDLE_VERSION = 1
+
+
+def platform_fingerprint():
+    """
+    Return a dict describing the platform compiled modules depend on.
+
+    Modules compiled on a machine with a different fingerprint can not be
+    reused. This does not call the compiler.
+
+    """
+    return dict(
+        platform=compiledir_format_dict['short_platform'],
+        processor=compiledir_format_dict['processor'],
+        python_version=compiledir_format_dict['python_version'],
+        python_bitwidth=compiledir_format_dict['python_bitwidth'],
+        python_int_bitwidth=compiledir_format_dict['python_int_bitwidth'],
+        numpy_abi_version='0x%X' %
+        numpy.core.multiarray._get_ndarray_c_version(),
+        c_compiler=GCC_compiler.version_str(),
+        config_md5=theano.configparser.get_config_md5())
+
 
 def get_module_cache(dirname, init_args=None):
     """
@@ -1763,6 +2702,138 @@ class Compiler(object):
                                          output=output, compiler=compiler)
 
 
+# The includes at the start of the code of the modules, in that order, that
+# can be put in a precompiled header.
+PCH_INCLUDES = ['#include <Python.h>',
+                '#include <iostream>',
+                '#include "theano_mod_helper.h"',
+                '#include <math.h>',
+                '#include <numpy/arrayobject.h>',
+                '#include <numpy/arrayscalars.h>']
+
+# Map the hash of a precompiled header to its header file (None if its
+# compilation failed).
+_precompiled_headers = {}
+
+
+# Computed by _pch_headers_version the first time it is needed.
+_pch_headers_version_str = None
+
+
+def _pch_headers_version():
+    """
+    Return a string that changes when the content of the headers in
+    `PCH_INCLUDES` may change, as g++ does not check that a precompiled
+    header is older than the headers it includes.
+
+    """
+    global _pch_headers_version_str
+    if _pch_headers_version_str is None:
+        helper = os.path.join(os.path.abspath(os.path.dirname(__file__)),
+                              'theano_mod_helper.h')
+        _pch_headers_version_str = '\n'.join([
+            'python %s' % sys.version,
+            'numpy %s 0x%X' % (
+                numpy.__version__,
+                numpy.core.multiarray._get_ndarray_c_version()),
+            'theano_mod_helper.h %s' % hash_from_file(helper)])
+    return _pch_headers_version_str
+
+
+def get_precompiled_header(src_code, args):
+    """
+    Return a header to pass to g++ with -include, so that it uses a
+    precompiled version of the includes at the start of `src_code`.
+
+    The header is compiled with the options `args` the first time it is
+    needed. It is stored in the compiledir in a directory that depends on
+    the compiler, the options, the includes and the version of the
+    included headers (see `_pch_headers_version`), so modules compiled with
+    different options do not use the same one. If g++ still finds that the
+    precompiled header can not be used, it parses the header instead.
+
+    Parameters
+    ----------
+    src_code
+        The code of the module.
+    args
+        The compiler options used for the module, except the output and
+        input files.
+
+    Returns
+    -------
+    str or None
+        The path to the header, or None if `src_code` does not start with
+        `PCH_INCLUDES[0]` or if the compilation of the header failed.
+
+    """
+    lines = src_code.split('\n', len(PCH_INCLUDES))[:len(PCH_INCLUDES)]
+    n_includes = 0
+    for line, include in zip(lines, PCH_INCLUDES):
+        if line.strip() != include:
+            break
+        n_includes += 1
+    if n_includes == 0:
+        return None
+    header_code = '\n'.join(PCH_INCLUDES[:n_includes]) + '\n'
+    pch_hash = hash_from_code('\n'.join(
+        [GCC_compiler.version_str(), ' '.join(args), _pch_headers_version(),
+         header_code]))
+    if pch_hash in _precompiled_headers:
+        return _precompiled_headers[pch_hash]
+
+    pch_dir = os.path.join(config.compiledir, 'precompiled_headers', pch_hash)
+    header = os.path.join(pch_dir, 'theano_pch.h')
+    if not os.path.exists(header + '.gch'):
+        # Other processes may build it at the same time: every file is
+        # written to a temporary file first, then renamed.
+        if not os.path.isdir(pch_dir):
+            try:
+                os.makedirs(pch_dir)
+            except OSError:
+                if not os.path.isdir(pch_dir):
+                    raise
+        fd, tmp_header = tempfile.mkstemp(dir=pch_dir)
+        with os.fdopen(fd, 'w') as f:
+            f.write(header_code)
+        os.chmod(tmp_header, 0o644)
+        _rename(tmp_header, header)
+        fd, tmp_pch = tempfile.mkstemp(suffix='.gch', dir=pch_dir)
+        os.close(fd)
+        cmd = ([theano.config.cxx, '-x', 'c++-header'] + list(args) +
+               ['-o', tmp_pch, header])
+        _logger.debug('Running cmd: %s', ' '.join(cmd))
+        p_out = output_subprocess_Popen(cmd)
+        if p_out[2]:
+            _logger.warning('Compilation of the precompiled header %s '
+                            'failed, the modules will be compiled without '
+                            'it: %s', header, decode(p_out[1]))
+            if os.path.exists(tmp_pch):
+                os.remove(tmp_pch)
+            header = None
+        else:
+            os.chmod(tmp_pch, 0o644)
+            _rename(tmp_pch, header + '.gch')
+    _precompiled_headers[pch_hash] = header
+    return header
+
+
+def _rename(src, dst, replace=False):
+    # os.rename does not replace an existing file on Windows. Unless
+    # `replace` is True, the existing file is kept, as it has the same
+    # content.
+    try:
+        os.rename(src, dst)
+    except OSError:
+        if not os.path.exists(dst):
+            raise
+        if replace:
+            os.remove(dst)
+            os.rename(src, dst)
+        else:
+            os.remove(src)
+
+
 class GCC_compiler(Compiler):
     # The equivalent flags of --march=native used by g++.
     march_flags = None
@@ -2137,6 +3208,12 @@ class GCC_compiler(Compiler):
             # improved loading times on most platforms (win32 is
             # different, as usual).
             cmd.append('-fvisibility=hidden')
+        if config.cmodule.precompiled_headers:
+            # The options before the output file are also used to compile
+            # the precompiled header (except the shared library one).
+            header = get_precompiled_header(src_code, cmd[2:])
+            if header is not None:
+                cmd.extend(['-include', header])
         cmd.extend(['-o', lib_filename])
         cmd.append(cppfilename)
         cmd.extend(['-L%s' % ldir for ldir in lib_dirs])
@@ -2151,7 +3228,10 @@ class GCC_compiler(Compiler):
             print(' '.join(cmd), file=sys.stderr)
 
         try:
+            t0 = time.time()
             p_out = output_subprocess_Popen(cmd)
+            if not getattr(_cxx_thread_state, 'in_batch', False):
+                _add_cxx_time(time.time() - t0, 1)
             compile_stderr = decode(p_out[1])
         except Exception:
             # An exception can occur e.g. if `g++` is not found.
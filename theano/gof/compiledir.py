@@ -275,6 +275,10 @@ def cleanup():
     """
     compiledir = theano.config.compiledir
     for directory in os.listdir(compiledir):
+        if directory in ('lock_dir', 'module_locks', 'module_index',
+                         'precompiled_headers'):
+            # Bookkeeping of the module cache, not compiled modules.
+            continue
         file = None
         try:
             try:
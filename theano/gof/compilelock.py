@@ -4,6 +4,7 @@
 import atexit
 import os
 import socket  # only used for gethostname()
+import threading
 import time
 import logging
 
@@ -12,7 +13,7 @@ from contextlib import contextmanager
 import numpy as np
 
 from theano import config
-from theano.configparser import AddConfigVar, IntParam
+from theano.configparser import AddConfigVar, BoolParam, IntParam
 
 random = np.random.RandomState([2015, 8, 2])
 
@@ -41,8 +42,21 @@ period for running processes.""",
                       allow_override=False),
              in_c_key=False)
 
+AddConfigVar('compile.module_lock',
+             """If True, the compilation of a C module in the cache only
+locks that module, so processes compiling different modules do not wait for
+each other. Only the updates of the cache metadata are done under the lock
+of the whole compilation directory. If False, that lock is held during the
+whole compilation.""",
+             BoolParam(True),
+             in_c_key=False)
+
 hostname = socket.gethostname()
 
+# The lock on the compilation directory is re-entrant for the process that
+# holds it, so threads of that process also need to exclude each other.
+_thread_lock = threading.RLock()
+
 
 def force_unlock():
     """
@@ -56,9 +70,11 @@ def force_unlock():
 @contextmanager
 def lock_ctx(lock_dir=None, keep_lock=False, **kw):
     get_lock(lock_dir=lock_dir, **kw)
-    yield
-    if not keep_lock:
-        release_lock()
+    try:
+        yield
+    finally:
+        if not keep_lock:
+            release_lock()
 
 
 # We define this name with an underscore so that python shutdown
@@ -79,6 +95,15 @@ def _get_lock(lock_dir=None, **kw):
     We can lock only on 1 directory at a time.
 
     """
+    _thread_lock.acquire()
+    try:
+        _acquire_lock(lock_dir, **kw)
+    except:
+        _thread_lock.release()
+        raise
+
+
+def _acquire_lock(lock_dir=None, **kw):
     if lock_dir is None:
         lock_dir = os.path.join(config.compiledir, 'lock_dir')
     if not hasattr(get_lock, 'n_lock'):
@@ -129,17 +154,86 @@ def _get_lock(lock_dir=None, **kw):
 get_lock = _get_lock
 
 
+def lock_is_held():
+    """
+    Return True if this process holds the lock on the compilation directory.
+
+    """
+    return getattr(get_lock, 'n_lock', 0) > 0
+
+
+def lock_is_enabled():
+    """
+    Return False if locking was disabled with `set_lock_status`.
+
+    """
+    return getattr(get_lock, 'lock_is_enabled', True)
+
+
+@contextmanager
+def multi_lock_ctx(lock_dirs, **kw):
+    """
+    Hold locks on several directories, independently of the lock on the
+    compilation directory.
+
+    The locks are taken with `lock`, so they are detected as stale exactly
+    like the compilation directory lock. They are acquired in sorted order,
+    so that processes locking overlapping sets of directories cannot
+    deadlock, and are all released when leaving the context.
+
+    The context gives a function that refreshes the locks when they were
+    not refreshed for half of `config.compile.timeout` (or always if its
+    `force` argument is True), as `get_lock` does for the compilation
+    directory lock. It must be called regularly while the locks are held
+    for a long time, else other processes consider them stale.
+
+    Parameters
+    ----------
+    lock_dirs
+        Lock directories, as `tmp_dir` in `lock`.
+    kw
+        Additional arguments forwarded to `lock`.
+
+    """
+    acquired = []
+    # A list so that refresh can update it.
+    last_refresh = [time.time()]
+
+    def refresh(force=False):
+        now = time.time()
+        if force or now - last_refresh[0] > config.compile.timeout / 2:
+            for lock_dir in acquired:
+                lockpath = os.path.join(lock_dir, 'lock')
+                _logger.info('Refreshing lock %s', str(lockpath))
+                refresh_lock(lockpath)
+            last_refresh[0] = now
+
+    try:
+        if lock_is_enabled():
+            for lock_dir in sorted(set(lock_dirs)):
+                lock(lock_dir, **kw)
+                acquired.append(lock_dir)
+        last_refresh[0] = time.time()
+        yield refresh
+    finally:
+        for lock_dir in reversed(acquired):
+            Unlocker(lock_dir).unlock(force=False)
+
+
 def release_lock():
     """
     Release lock on compilation directory.
 
     """
-    get_lock.n_lock -= 1
-    assert get_lock.n_lock >= 0
-    # Only really release lock once all lock requests have ended.
-    if get_lock.lock_is_enabled and get_lock.n_lock == 0:
-        get_lock.start_time = None
-        get_lock.unlocker.unlock(force=False)
+    try:
+        get_lock.n_lock -= 1
+        assert get_lock.n_lock >= 0
+        # Only really release lock once all lock requests have ended.
+        if get_lock.lock_is_enabled and get_lock.n_lock == 0:
+            get_lock.start_time = None
+            get_lock.unlocker.unlock(force=False)
+    finally:
+        _thread_lock.release()
 
 
 def set_lock_status(use_lock):
@@ -257,7 +351,7 @@ def lock(tmp_dir, timeout=notset, min_wait=None, max_wait=None, verbosity=1):
                         msg = "process '%s'" % read_owner.split('_')[0]
                         _logger.warning("Overriding existing lock by dead %s "
                                         "(I am process '%s')", msg, my_pid)
-                    get_lock.unlocker.unlock(force=True)
+                    Unlocker(tmp_dir).unlock(force=True)
                     continue
                 if last_owner == read_owner:
                     if (timeout is not None and
@@ -270,7 +364,7 @@ def lock(tmp_dir, timeout=notset, min_wait=None, max_wait=None, verbosity=1):
                                 msg = "process '%s'" % read_owner.split('_')[0]
                             _logger.warning("Overriding existing lock by %s "
                                             "(I am process '%s')", msg, my_pid)
-                        get_lock.unlocker.unlock(force=True)
+                        Unlocker(tmp_dir).unlock(force=True)
                         continue
                 else:
                     last_owner = read_owner
@@ -347,7 +441,7 @@ def refresh_lock(lock_file):
         # from failing, we release the lock, but as there is a
         # problem, we still keep the original exception.
         # This way, only 1 test would fail.
-        while get_lock.n_lock > 0:
+        while lock_is_held():
             release_lock()
         _logger.warn('Refreshing lock failed, we release the'
                      ' lock before raising again the exception')
@@ -658,7 +658,11 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
 
     It is a work in progress. The following data structures have been
     converted to use the incremental strategy:
-        <none>
+        - the topological order used to detect cycles in validate(). It
+          is built at the first validation with destructive ops, then each
+          new edge (a changed input or a new ordering) reorders only the
+          nodes between its ends (Pearce and Kelly, "A Dynamic Topological
+          Sort Algorithm for Directed Acyclic Graphs").
 
     The following data structures remain to be converted:
         <unknown>
@@ -666,6 +670,12 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
     """
     pickle_rm_attr = ["destroyers"]
 
+    # Topological order of the Apply nodes, following their inputs and the
+    # orderings, except the edges in bad_edges. None when it must be
+    # rebuilt. It is a class attribute for the DestroyHandler pickled
+    # before it was added.
+    order = None
+
     def __init__(self, do_imports_on_attach=True):
         self.fgraph = None
         self.do_imports_on_attach = do_imports_on_attach
@@ -743,6 +753,7 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
         # clients: how many times does an apply use a given variable
         self.clients = OrderedDict()  # variable -> apply -> ninputs
         self.stale_droot = True
+        self.order = None
 
         self.debug_all_apps = OrderedSet()
         if self.do_imports_on_attach:
@@ -777,6 +788,7 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
         del self.view_o
         del self.clients
         del self.stale_droot
+        self.order = None
         assert self.fgraph.destroyer_handler is self
         delattr(self.fgraph, 'destroyers')
         delattr(self.fgraph, 'destroy_handler')
@@ -816,6 +828,12 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
         for i, output in enumerate(app.outputs):
             self.clients.setdefault(output, OrderedDict())
 
+        # Its inputs are already in the order and its outputs have no
+        # client yet.
+        if self.order is not None:
+            self.position[app] = len(self.order)
+            self.order.append(app)
+
         self.stale_droot = True
 
     def on_prune(self, fgraph, app, reason):
@@ -853,6 +871,17 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
             if not self.view_o[i]:
                 del self.view_o[i]
 
+        if self.order is not None:
+            pos = self.position.pop(app, None)
+            if pos is None:
+                self.order = None
+            else:
+                self.order[pos] = None
+                for c in self.ord_succ.pop(app, ()):
+                    self.ord_pred[c].discard(app)
+                for p in self.ord_pred.pop(app, ()):
+                    self.ord_succ[p].discard(app)
+
         self.stale_droot = True
 
     def on_change_input(self, fgraph, app, i, old_r, new_r, reason):
@@ -896,6 +925,14 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
 
                     self.view_o.setdefault(new_r, OrderedSet()).add(output)
 
+            if self.order is not None and new_r.owner is not None:
+                edge = (new_r.owner, app)
+                try:
+                    if not self.add_edge(*edge):
+                        self.bad_edges.add(edge)
+                except KeyError:
+                    self.order = None
+
         self.stale_droot = True
 
     def validate(self, fgraph):
@@ -910,7 +947,7 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
         if self.destroyers:
             ords = self.orderings(fgraph)
 
-            if _contains_cycle(fgraph, ords):
+            if self.contains_cycle(ords):
                 raise InconsistencyError("Dependency graph contains cycles")
         else:
             # James's Conjecture:
@@ -926,6 +963,150 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
             pass
         return True
 
+    def reset_order(self, order, ords):
+        """
+        Use `order`, a topological order of the graph that respects
+        `ords`, as order.
+
+        """
+        self.order = list(order)
+        self.position = dict((app, i) for i, app in enumerate(self.order))
+        # The edges of the orderings, and the same edges by node, except
+        # those in bad_edges.
+        self.ord_edges = set()
+        self.ord_succ = {}
+        self.ord_pred = {}
+        # Edges (u, v) not respected by the order, because they closed a
+        # cycle when they were added.
+        self.bad_edges = set()
+        for app, prereqs in iteritems(ords):
+            for p in prereqs:
+                self.ord_edges.add((p, app))
+                self.ord_succ.setdefault(p, set()).add(app)
+                self.ord_pred.setdefault(app, set()).add(p)
+
+    def successors(self, app):
+        """
+        Return the nodes that must be computed after `app`.
+
+        """
+        bad = self.bad_edges
+        rval = [c for out in app.outputs for c, _ in out.clients
+                if c != 'output' and (app, c) not in bad]
+        rval.extend(self.ord_succ.get(app, ()))
+        return rval
+
+    def predecessors(self, app):
+        """
+        Return the nodes that must be computed before `app`.
+
+        """
+        bad = self.bad_edges
+        rval = [i.owner for i in app.inputs
+                if i.owner is not None and (i.owner, app) not in bad]
+        rval.extend(self.ord_pred.get(app, ()))
+        return rval
+
+    def add_edge(self, u, v):
+        """
+        Update the order so that `u` is before `v`.
+
+        Only the nodes between `v` and `u` in the order are visited. Return
+        False if `v` is an ancestor of `u`, the order is then unchanged.
+
+        """
+        position = self.position
+        lower = position[v]
+        upper = position[u]
+        if upper < lower:
+            return True
+        if upper == lower:
+            return False
+        # The descendants of v before u
+        forward = set([v])
+        stack = [v]
+        while stack:
+            for c in self.successors(stack.pop()):
+                if c in forward:
+                    continue
+                pos = position[c]
+                if pos == upper:
+                    return False
+                if pos < upper:
+                    forward.add(c)
+                    stack.append(c)
+        # The ancestors of u after v
+        backward = set([u])
+        stack = [u]
+        while stack:
+            for p in self.predecessors(stack.pop()):
+                if p not in backward and position[p] > lower:
+                    backward.add(p)
+                    stack.append(p)
+        # Reuse their positions, with the ancestors of u first.
+        moved = (sorted(backward, key=position.__getitem__) +
+                 sorted(forward, key=position.__getitem__))
+        slots = sorted(position[app] for app in moved)
+        for pos, app in zip(slots, moved):
+            self.order[pos] = app
+            position[app] = pos
+        return True
+
+    def contains_cycle(self, ords):
+        """
+        Return True if the graph with the orderings `ords` contains a cycle.
+
+        The order is updated with the edges of the orderings that changed
+        since the last call and the edges that closed a cycle are tried
+        again. The first call, or the first after an inconsistency of the
+        order, sorts the whole graph.
+
+        """
+        fgraph = self.fgraph
+        if self.order is None:
+            try:
+                order = graph.io_toposort(fgraph.inputs, fgraph.outputs, ords)
+            except ValueError:
+                return True
+            self.reset_order(order, ords)
+            return False
+
+        try:
+            new_edges = set((p, app) for app, prereqs in iteritems(ords)
+                            for p in prereqs)
+            # Removing edges keeps the order valid.
+            for p, app in self.ord_edges - new_edges:
+                self.ord_succ.get(p, set()).discard(app)
+                self.ord_pred.get(app, set()).discard(p)
+            added = new_edges - self.ord_edges
+            self.ord_edges = new_edges
+            for edge in added:
+                self.bad_edges.add(edge)
+            for edge in list(self.bad_edges):
+                u, v = edge
+                if (edge not in new_edges and
+                        (v not in self.position or
+                         not any(i.owner is u for i in v.inputs))):
+                    # That edge is not in the graph anymore.
+                    self.bad_edges.discard(edge)
+                    continue
+                if self.add_edge(u, v):
+                    self.bad_edges.discard(edge)
+                    if edge in new_edges:
+                        self.ord_succ.setdefault(u, set()).add(v)
+                        self.ord_pred.setdefault(v, set()).add(u)
+        except KeyError:
+            # A node is missing from the order.
+            self.order = None
+            return self.contains_cycle(ords)
+
+        if len(self.position) * 2 < len(self.order):
+            # Remove the holes left by the pruned nodes.
+            order = [app for app in self.order if app is not None]
+            self.position = dict((app, i) for i, app in enumerate(order))
+            self.order = order
+        return bool(self.bad_edges)
+
     def orderings(self, fgraph):
         """
         Return orderings induced by destructive operations.
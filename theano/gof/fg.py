@@ -722,6 +722,10 @@ class FunctionGraph(utils.object2):
         {node: predecessors} where predecessors is a list of nodes
         that should be computed before the key node.
 
+        If the toolbox.TopoOrder feature is attached, the order it keeps
+        is returned when it satisfies these orderings, without traversing
+        the graph.
+
         """
         if len(self.apply_nodes) < 2:
             # optimization
@@ -733,6 +737,10 @@ class FunctionGraph(utils.object2):
 
         ords = self.orderings()
 
+        topo_order = getattr(self, 'topo_order', None)
+        if topo_order is not None:
+            return topo_order.toposort(ords)
+
         order = graph.io_toposort(fg.inputs, fg.outputs, ords)
 
         return order
@@ -296,6 +296,46 @@ class CLinkerOp(CLinkerObject):
         """
         return self.c_code_cache_version()
 
+    def c_nogil(self, node):
+        """
+        Optional: return True if the C code of `node` can release the GIL.
+
+        The code returned by `c_code` can delimit its compute part with
+        the `sub` symbols 'begin_nogil' and 'end_nogil'. When this method
+        returns True and `config.cmodule.release_gil` is set, `CLinker`
+        replaces them with `Py_BEGIN_ALLOW_THREADS` and
+        `Py_END_ALLOW_THREADS`, otherwise with empty strings, so other
+        Python threads can run while that part executes.
+
+        The code between these symbols must not use the Python C-API
+        (this includes 'fail') and must be inside a single C block.
+
+        Notes
+        -----
+            Ops that use these symbols should read them with
+            `sub.get('begin_nogil', '')`, since `c_code` can also be called
+            with a `sub` that does not come from `CLinker`.
+
+        """
+        return False
+
+    def c_static_shapes(self, node):
+        """
+        Optional: return True if the C code of `node` uses static shapes.
+
+        The inputs and outputs of `node` can carry a constant shape in
+        their `tag.static_shape` (see the 'specialize_shapes' optimization
+        tag). When this method returns True, `CLinker` passes these shapes
+        to `c_code` as the `sub` entries 'input_shapes' and 'output_shapes',
+        two lists with one tuple (or None when unknown) per variable, and
+        puts them in the key of the compiled module.
+
+        The generated code can then use them as compile-time constants, but
+        it must still check them against the actual arguments.
+
+        """
+        return False
+
     def c_code_cleanup(self, node, name, inputs, outputs, sub):
         """
         Optional: return C code to run after c_code, whether it failed or not.
@@ -803,6 +843,17 @@ class Op(utils.object2, PureOp, CLinkerOp):
         else:
             return NotImplemented
 
+    def c_linker(self, node, no_recycling):
+        """
+        Return the CLinker used by `make_c_thunk` to compile `node` alone.
+
+        """
+        e = FunctionGraph(node.inputs, node.outputs)
+        e_no_recycling = [new_o
+                          for (new_o, old_o) in zip(e.outputs, node.outputs)
+                          if old_o in no_recycling]
+        return theano.gof.cc.CLinker().accept(e, no_recycling=e_no_recycling)
+
     def make_c_thunk(self, node, storage_map, compute_map, no_recycling):
         """
         Like make_thunk, but will only try to make a C thunk.
@@ -824,12 +875,7 @@ class Op(utils.object2, PureOp, CLinkerOp):
                 print("Disabling C code for %s due to unsupported "
                       "float16" % (self,))
                 raise NotImplementedError("float16")
-        e = FunctionGraph(node.inputs, node.outputs)
-        e_no_recycling = [new_o
-                          for (new_o, old_o) in zip(e.outputs, node.outputs)
-                          if old_o in no_recycling]
-        cl = theano.gof.cc.CLinker().accept(e,
-                                            no_recycling=e_no_recycling)
+        cl = self.c_linker(node, no_recycling)
 
         logger.debug('Trying CLinker.make_thunk')
         outputs = cl.make_thunk(input_storage=node_input_storage,
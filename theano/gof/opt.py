@@ -21,7 +21,7 @@ from theano import config
 from theano.compat import izip, OrderedDict
 from six import string_types, iteritems, itervalues
 from six.moves import reduce
-from theano.gof import graph, op, utils, unify, toolbox
+from theano.gof import graph, op, utils, unify, toolbox, optprofile
 from theano.gof.fg import InconsistencyError
 from theano.misc.ordered_set import OrderedSet
 
@@ -32,6 +32,9 @@ _optimizer_idx = [0]
 
 
 def _list_of_nodes(fgraph):
+    topo_order = getattr(fgraph, 'topo_order', None)
+    if topo_order is not None:
+        return topo_order.nodes()
     return list(graph.io_toposort(fgraph.inputs, fgraph.outputs))
 
 
@@ -489,6 +492,12 @@ class MergeFeature(object):
         self.nodes_seen = set()
         # Ordered set of distinct (not mergeable) nodes without any input
         self.noinput_nodes = OrderedSet()
+        # Hash-consing index of nodes_seen: (op, inputs) -> list of nodes.
+        # The inputs of the nodes are taken with their Assert removed.
+        # A node whose key can not be hashed is not in the index.
+        self.node_index = {}
+        # node -> its key in node_index
+        self.node_key = {}
 
         # Each element of scheduled is a list of list of (out, new_out) pairs.
         # Each list of pairs represent the substitution needed to replace all
@@ -501,10 +510,10 @@ class MergeFeature(object):
         #     [(node.out1, cand3.out1), (node.out2, cand3.out2)]]]
         self.scheduled = []
 
-        # List of (node, candidate) pairs, where we tried to replace node by
+        # Set of (node, candidate) pairs, where we tried to replace node by
         # candidate, but it failed. This is used to avoid infinite loops
         # during the replacement phase.
-        self.blacklist = []
+        self.blacklist = set()
 
         for node in fgraph.toposort():
             self.on_import(fgraph, node, "on_attach")
@@ -514,8 +523,18 @@ class MergeFeature(object):
         # from the other nodes in nodes_seen
         if node in self.nodes_seen:
             self.nodes_seen.discard(node)
+            self.index_discard(node)
             self.process_node(fgraph, node)
 
+        # The nodes using the output of an Assert are indexed with the
+        # input of the Assert, which just changed.
+        if (not isinstance(node, string_types) and
+                isinstance(node.op, theano.tensor.opt.Assert)):
+            for client, _ in node.outputs[0].clients:
+                if client in self.node_key:
+                    self.index_discard(client)
+                    self.index_add(client)
+
         # Since we are in on_change_input, node should have inputs.
         if not isinstance(node, string_types):
             assert node.inputs
@@ -532,6 +551,7 @@ class MergeFeature(object):
 
     def on_prune(self, fgraph, node, reason):
         self.nodes_seen.discard(node)
+        self.index_discard(node)
         if not node.inputs:
             self.noinput_nodes.discard(node)
         for c in node.inputs:
@@ -542,6 +562,45 @@ class MergeFeature(object):
                 self.const_sig_inv.discard(sig)
                 self.seen_constants.discard(id(c))
 
+    def index_key(self, node, inputs):
+        """
+        Return the key of `node` in node_index, or None if not hashable.
+
+        """
+        key = (node.op, tuple(inputs))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def index_add(self, node):
+        """
+        Add `node` to node_index, with the Assert of its inputs removed.
+
+        """
+        inputs = [i.owner.inputs[0]
+                  if i.owner and isinstance(i.owner.op,
+                                            theano.tensor.opt.Assert)
+                  else i
+                  for i in node.inputs]
+        key = self.index_key(node, inputs)
+        if key is not None:
+            self.node_index.setdefault(key, []).append(node)
+            self.node_key[node] = key
+
+    def index_discard(self, node):
+        """
+        Remove `node` from node_index, if it is there.
+
+        """
+        key = self.node_key.pop(node, None)
+        if key is not None:
+            bucket = self.node_index[key]
+            bucket.remove(node)
+            if not bucket:
+                del self.node_index[key]
+
     def process_constant(self, fgraph, c):
         """
         Check if a constant can be merged, and queue that replacement.
@@ -573,6 +632,9 @@ class MergeFeature(object):
 
         node_has_assert = False
 
+        # The candidates are the nodes seen with the same op and inputs.
+        key = self.index_key(node, node.inputs)
+
         # These asserts ensure that the fgraph has set the clients field
         # properly.
         # The clients should at least contain `node` itself!
@@ -580,8 +642,11 @@ class MergeFeature(object):
             assert len(node.inputs[0].clients) > 0
             assert (node, 0) in node.inputs[0].clients
 
-            merge_candidates = [c for (c, i) in node.inputs[0].clients
-                                if c in self.nodes_seen]
+            if key is not None:
+                merge_candidates = list(self.node_index.get(key, ()))
+            else:
+                merge_candidates = [c for (c, i) in node.inputs[0].clients
+                                    if c in self.nodes_seen]
 
             # Put all clients of Assert inputs (if exist) into merge_candidates
             # TODO: Deactivated for now as this cause cycle in the graph.
@@ -604,7 +669,10 @@ class MergeFeature(object):
             # If two nodes have no input, but perform the same operation,
             # they are not always constant-folded, so we want to merge them.
             # In that case, the candidates are all the nodes without inputs.
-            merge_candidates = self.noinput_nodes
+            if key is not None:
+                merge_candidates = list(self.node_index.get(key, ()))
+            else:
+                merge_candidates = self.noinput_nodes
 
         replacement_candidates = []
         for candidate in merge_candidates:
@@ -684,6 +752,7 @@ class MergeFeature(object):
             self.scheduled.append(replacement_candidates)
         else:
             self.nodes_seen.add(node)
+            self.index_add(node)
             if not node.inputs:
                 self.noinput_nodes.add(node)
 
@@ -826,7 +895,7 @@ class MergeOptimizer(Optimizer):
                 except InconsistencyError:
                     success = False
                     nb_fail += 1
-                    fgraph.merge_feature.blacklist.append(
+                    fgraph.merge_feature.blacklist.add(
                         (pairs[0][0].owner, pairs[0][1].owner))
                 if success:
                     nb_merged += len(pairs)
@@ -849,7 +918,7 @@ class MergeOptimizer(Optimizer):
             callback_time = None
             callbacks_time = {}
         # clear blacklist
-        fgraph.merge_feature.blacklist = []
+        fgraph.merge_feature.blacklist = set()
         return (nb_fail, time.time() - t0, validate_time,
                 callback_time, callbacks_time, nb_merged, nb_constant)
 
@@ -1811,6 +1880,7 @@ class NavigatorOptimizer(Optimizer):
         super(NavigatorOptimizer, self).add_requirements(fgraph)
         # Added by default
         # fgraph.attach_feature(toolbox.ReplaceValidate())
+        fgraph.attach_feature(toolbox.TopoOrder())
         if self.local_opt:
             self.local_opt.add_requirements(fgraph)
 
@@ -1842,7 +1912,10 @@ class TopoOptimizer(NavigatorOptimizer):
         callback_before = fgraph.execute_callbacks_time
         nb_nodes_start = len(fgraph.apply_nodes)
         t0 = time.time()
-        q = deque(graph.io_toposort(fgraph.inputs, start_from))
+        if start_from is fgraph.outputs:
+            q = deque(_list_of_nodes(fgraph))
+        else:
+            q = deque(graph.io_toposort(fgraph.inputs, start_from))
         io_t = time.time() - t0
 
         def importer(node):
@@ -1984,6 +2057,13 @@ class EquilibriumOptimizer(NavigatorOptimizer):
         times.
     ignore_newtrees
         See EquilibriumDB ignore_newtrees parameter definition.
+    interruptible
+        If True, stop before the equilibrium once the time given to optimize
+        the graph is used: when the fgraph has an `optimizer_deadline`
+        attribute (a time.time() value), no node is processed after it, and
+        fgraph.optimizer_interrupted is set to True. The local optimizers
+        that never change a family of graphs can also be skipped (see
+        `config.optimizer_pruning` and `theano.gof.optprofile`).
 
     """
 
@@ -1992,11 +2072,13 @@ class EquilibriumOptimizer(NavigatorOptimizer):
                  failure_callback=None,
                  ignore_newtrees=True,
                  max_use_ratio=None,
-                 final_optimizers=None):
+                 final_optimizers=None,
+                 interruptible=False):
         super(EquilibriumOptimizer, self).__init__(
             None,
             ignore_newtrees=ignore_newtrees,
             failure_callback=failure_callback)
+        self.interruptible = interruptible
         self.local_optimizers_map = OrderedDict()
         self.local_optimizers_all = []
         self.global_optimizers = []
@@ -2049,6 +2131,37 @@ class EquilibriumOptimizer(NavigatorOptimizer):
         changed = True
         max_use_abort = False
         opt_name = None
+        deadline = None
+        if self.interruptible:
+            deadline = getattr(fgraph, 'optimizer_deadline', None)
+        deadline_abort = False
+        profiles = None
+        pruned = {}
+        tried = set()
+        local_optimizers_all = self.local_optimizers_all
+        local_optimizers_map = self.local_optimizers_map
+        if self.interruptible and config.optimizer_pruning != 'off':
+            profiles = optprofile.get_profiles()
+            family = optprofile.family_key(self, fgraph)
+            if config.optimizer_pruning == 'on':
+                try:
+                    pruned = profiles.never_used(
+                        family, self.get_local_optimizers(),
+                        config.optimizer_pruning_min_compiles)
+                except Exception as e:
+                    _logger.warning('Could not load the optimizer profile '
+                                    'of %s: %s', family, e)
+                    pruned = {}
+            if pruned:
+                local_optimizers_all = [o for o in local_optimizers_all
+                                        if o not in pruned]
+                local_optimizers_map = dict(
+                    (k, [o for o in v if o not in pruned])
+                    for k, v in iteritems(local_optimizers_map))
+                _logger.debug('EquilibriumOptimizer %s skips %d local '
+                              'optimizers, %.3fs saved' % (
+                                  getattr(self, 'name', ''), len(pruned),
+                                  sum(pruned.values())))
         global_process_count = {}
         start_nb_nodes = len(fgraph.apply_nodes)
         max_nb_nodes = len(fgraph.apply_nodes)
@@ -2073,6 +2186,9 @@ class EquilibriumOptimizer(NavigatorOptimizer):
         while changed and not max_use_abort:
             process_count = {}
             t0 = time.time()
+            if deadline is not None and t0 > deadline:
+                deadline_abort = True
+                break
             changed = False
 
             # apply global optimizers
@@ -2100,7 +2216,10 @@ class EquilibriumOptimizer(NavigatorOptimizer):
 
             # apply local optimizer
             topo_t0 = time.time()
-            q = deque(graph.io_toposort(fgraph.inputs, start_from))
+            if start_from is fgraph.outputs:
+                q = deque(_list_of_nodes(fgraph))
+            else:
+                q = deque(graph.io_toposort(fgraph.inputs, start_from))
             io_toposort_timing.append(time.time() - topo_t0)
 
             nb_nodes.append(len(q))
@@ -2121,12 +2240,16 @@ class EquilibriumOptimizer(NavigatorOptimizer):
             u = self.attach_updater(fgraph, importer, pruner)
             try:
                 while q:
+                    if deadline is not None and time.time() > deadline:
+                        deadline_abort = True
+                        break
                     node = q.pop()
                     current_node = node
 
-                    for lopt in (self.local_optimizers_all +
-                                 self.local_optimizers_map.get(type(node.op), []) +
-                                 self.local_optimizers_map.get(node.op, [])):
+                    for lopt in (local_optimizers_all +
+                                 local_optimizers_map.get(type(node.op), []) +
+                                 local_optimizers_map.get(node.op, [])):
+                        tried.add(lopt)
                         nb = change_tracker.nb_imported
                         t_opt = time.time()
                         lopt_change = self.process_node(fgraph, node, lopt)
@@ -2176,6 +2299,19 @@ class EquilibriumOptimizer(NavigatorOptimizer):
 
         end_nb_nodes = len(fgraph.apply_nodes)
 
+        if profiles is not None and not (deadline_abort or max_use_abort):
+            # Only complete runs tell that an optimizer is not useful.
+            try:
+                profiles.record(family, tried,
+                                [o for o in tried if global_process_count[o]],
+                                time_opts)
+            except Exception as e:
+                _logger.warning('Could not record the optimizer profile '
+                                'of %s: %s', family, e)
+        if deadline_abort:
+            fgraph.optimizer_interrupted = True
+            _logger.info("EquilibriumOptimizer %s stopped by the optimization "
+                         "time budget" % getattr(self, 'name', ''))
         if max_use_abort:
             _logger.error("EquilibriumOptimizer max'ed out by '%s'" % opt_name +
                           ". You can safely raise the current threshold of " +
@@ -2185,7 +2321,7 @@ class EquilibriumOptimizer(NavigatorOptimizer):
         return (self, loop_timing, loop_process_count,
                 (start_nb_nodes, end_nb_nodes, max_nb_nodes),
                 global_opt_timing, nb_nodes, time_opts, io_toposort_timing,
-                node_created, global_sub_profs, final_sub_profs)
+                node_created, global_sub_profs, final_sub_profs, pruned)
 
     def print_summary(self, stream=sys.stdout, level=0, depth=-1):
         name = getattr(self, 'name', None)
@@ -2201,7 +2337,7 @@ class EquilibriumOptimizer(NavigatorOptimizer):
         (opt, loop_timing, loop_process_count,
          (start_nb_nodes, end_nb_nodes, max_nb_nodes),
          global_opt_timing, nb_nodes, time_opts, io_toposort_timing,
-         node_created, global_sub_profs, final_sub_profs) = prof
+         node_created, global_sub_profs, final_sub_profs, pruned) = prof
 
         blanc = ('    ' * level)
         print(blanc, "EquilibriumOptimizer", end=' ', file=stream)
@@ -2219,6 +2355,10 @@ class EquilibriumOptimizer(NavigatorOptimizer):
         print(blanc, "  time in global optimizers %.3fs" % s, file=stream)
         s = sum([time_opts[o] for o in opt.final_optimizers])
         print(blanc, "  time in final optimizers %.3fs" % s, file=stream)
+        if pruned:
+            print(blanc, "  %d local optimizers pruned, estimated %.3fs "
+                  "saved" % (len(pruned), sum(pruned.values())),
+                  file=stream)
         for i in range(len(loop_timing)):
             lopt = ""
             if loop_process_count[i]:
@@ -2355,6 +2495,7 @@ class EquilibriumOptimizer(NavigatorOptimizer):
         node_created = merge_dict(prof1[8], prof2[8])
         global_sub_profs = merge_list(prof1[9], prof2[9])
         final_sub_profs = merge_list(prof1[10], prof2[10])
+        pruned = merge_dict(prof1[11], prof2[11])
         return (new_opt,
                 loop_timing,
                 loop_process_count,
@@ -2365,7 +2506,8 @@ class EquilibriumOptimizer(NavigatorOptimizer):
                 io_toposort_timing,
                 node_created,
                 global_sub_profs,
-                final_sub_profs)
+                final_sub_profs,
+                pruned)
 
 #################
 #   Utilities   #
@@ -253,6 +253,10 @@ class EquilibriumDB(DB):
         If False, we will apply local opt on new node introduced during local
         optimization application. This could result in less fgraph iterations,
         but this doesn't mean it will be faster globally.
+    interruptible
+        If True, the optimizations are not all needed to get a correct graph,
+        so they stop once the optimization time budget of the function is
+        used (see the EquilibriumOptimizer parameter).
 
     Notes
     -----
@@ -261,9 +265,10 @@ class EquilibriumDB(DB):
 
     """
 
-    def __init__(self, ignore_newtrees=True):
+    def __init__(self, ignore_newtrees=True, interruptible=False):
         super(EquilibriumDB, self).__init__()
         self.ignore_newtrees = ignore_newtrees
+        self.interruptible = interruptible
         self.__final__ = {}
 
     def register(self, name, obj, *tags, **kwtags):
@@ -286,7 +291,8 @@ class EquilibriumDB(DB):
             max_use_ratio=config.optdb.max_use_ratio,
             ignore_newtrees=self.ignore_newtrees,
             failure_callback=opt.NavigatorOptimizer.warn_inplace,
-            final_optimizers=final_opts)
+            final_optimizers=final_opts,
+            interruptible=self.interruptible)
 
 
 class SequenceDB(DB):
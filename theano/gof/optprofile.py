@@ -0,0 +1,230 @@
+"""
+Persistent statistics of the local optimizers, used to prune those that never
+change the graphs of a family.
+
+When `config.optimizer_pruning` is not 'off', the interruptible
+`EquilibriumOptimizer` (canonicalize and uncanonicalize in the default
+optimizer) record, for each family of graphs, how many compilations tried each
+local optimizer, how many of them were changed by it and the time it took.
+Stabilize is never pruned: its rewrites are needed for numerical stability.
+
+A family is identified by the name of the EquilibriumOptimizer and the set of
+ops of the graph it starts from, each with the type of its outputs and the ops
+computing its inputs, so a model rebuilt with other sizes or in another
+process is in the same family. This does not describe the whole structure of
+the graph: a local optimizer that matches a deeper pattern may be pruned on a
+graph of the family where it would apply. Only use pruning on passes whose
+rewrites are not needed for correctness.
+
+When it is 'on', the local optimizers that were tried in at least
+`config.optimizer_pruning_min_compiles` compilations of the family and never
+changed anything are not tried anymore on that family.
+
+Each family is stored in its own file in the ``optimizer_profiles``
+directory of the compiledir. Files are written to a temporary file that is
+then renamed. Two processes updating the same family at the same time may
+lose the counts of one compilation, which only delays the pruning.
+
+"""
+from __future__ import print_function
+
+import hashlib
+import logging
+import os
+import re
+import sys
+import tempfile
+
+import six.moves.cPickle as pickle
+from six import b, iteritems
+
+import theano
+from theano import config
+from theano.gof.cmodule import _rename
+
+_logger = logging.getLogger('theano.gof.optprofile')
+
+# Increase this when the format of the files or of the key changes.
+PROFILE_VERSION = 2
+
+
+def optimizer_name(opt):
+    """
+    Return the name under which the statistics of `opt` are stored, or None
+    if it has no name, in which case it is never pruned.
+
+    """
+    return getattr(opt, 'name', None) or getattr(opt, '__name__', None)
+
+
+def family_key(optimizer, fgraph):
+    """
+    Return the key of the family of `fgraph` for `optimizer`.
+
+    """
+    ops = set()
+    for node in fgraph.apply_nodes:
+        inputs = [str(inp.owner.op) if inp.owner else str(inp.type)
+                  for inp in node.inputs]
+        ops.add('%s %s (%s)' % (node.op,
+                                ','.join(str(out.type)
+                                         for out in node.outputs),
+                                ','.join(inputs)))
+    lines = ['version %d' % PROFILE_VERSION,
+             'theano %s' % theano.__version__,
+             'optimizer %s' % optimizer_name(optimizer)]
+    lines.extend(sorted(re.sub(r' at 0x[0-9a-fA-F]+', '', op) for op in ops))
+    return hashlib.md5(b('\n'.join(lines))).hexdigest()
+
+
+class OptimizerProfiles(object):
+    """
+    Directory of the statistics of the local optimizers per graph family.
+
+    The statistics of a family are a dict mapping the name of each local
+    optimizer tried to a list [number of compilations that tried it,
+    number of them it changed, total time spent in it].
+
+    Parameters
+    ----------
+    dirname
+        Directory holding the files. It is created if needed.
+
+    """
+
+    def __init__(self, dirname):
+        self.dirname = dirname
+
+    def filename(self, family):
+        return os.path.join(self.dirname, family + '.pkl')
+
+    def load(self, family):
+        """
+        Return the statistics of `family`, empty if it is unknown.
+
+        """
+        filename = self.filename(family)
+        try:
+            with open(filename, 'rb') as f:
+                version, stats = pickle.load(f)
+        except IOError:
+            return {}
+        except Exception as e:
+            _logger.warning('Ignoring the corrupted optimizer profile %s: %s',
+                            filename, e)
+            return {}
+        if version != PROFILE_VERSION:
+            return {}
+        return stats
+
+    def never_used(self, family, local_optimizers, min_compiles):
+        """
+        Return the local optimizers that can be skipped on `family`.
+
+        Returns
+        -------
+        dict
+            Maps each optimizer of `local_optimizers` that was tried in at
+            least `min_compiles` compilations of `family` without changing
+            the graph to the average time it took per compilation.
+
+        """
+        stats = self.load(family)
+        pruned = {}
+        if not stats:
+            return pruned
+        for opt in local_optimizers:
+            s = stats.get(optimizer_name(opt))
+            if s is not None and s[0] >= min_compiles and s[1] == 0:
+                pruned[opt] = s[2] / s[0]
+        return pruned
+
+    def record(self, family, tried, changed, time_opts):
+        """
+        Add one compilation to the statistics of `family`.
+
+        Parameters
+        ----------
+        tried
+            The local optimizers tried during the compilation.
+        changed
+            The ones among them that changed the graph.
+        time_opts
+            Dict mapping the optimizers to the time spent in them.
+
+        """
+        new = {}
+        for opt in tried:
+            name = optimizer_name(opt)
+            if name is None:
+                continue
+            s = new.setdefault(name, [1, 0, 0.])
+            if opt in changed:
+                s[1] = 1
+            s[2] += time_opts.get(opt, 0.)
+        if not new:
+            return
+        # Reload to lose as few counts as possible from other processes.
+        stats = self.load(family)
+        for name, (n, n_changed, t) in iteritems(new):
+            s = stats.setdefault(name, [0, 0, 0.])
+            s[0] += n
+            s[1] += n_changed
+            s[2] += t
+
+        if not os.path.isdir(self.dirname):
+            try:
+                os.makedirs(self.dirname)
+            except OSError:
+                # Another process may have created it.
+                assert os.path.isdir(self.dirname)
+        fd, tmp_filename = tempfile.mkstemp(prefix='tmp', suffix='.pkl',
+                                            dir=self.dirname)
+        try:
+            os.write(fd, pickle.dumps((PROFILE_VERSION, stats), -1))
+        finally:
+            os.close(fd)
+        _rename(tmp_filename, self.filename(family), replace=True)
+
+    def report(self, stream=sys.stdout, min_compiles=None):
+        """
+        Print, for each family, the local optimizers that are pruned and the
+        estimated time this saves per compilation.
+
+        """
+        if min_compiles is None:
+            min_compiles = config.optimizer_pruning_min_compiles
+        try:
+            filenames = sorted(f for f in os.listdir(self.dirname)
+                               if f.endswith('.pkl') and
+                               not f.startswith('tmp'))
+        except OSError:
+            filenames = []
+        total = 0.
+        for f in filenames:
+            family = f[:-len('.pkl')]
+            stats = self.load(family)
+            pruned = [(t / n, name) for name, (n, n_changed, t)
+                      in iteritems(stats)
+                      if n >= min_compiles and n_changed == 0]
+            if not pruned:
+                continue
+            pruned.sort(reverse=True)
+            saved = sum(t for t, _ in pruned)
+            total += saved
+            print('Family %s: %d of %d local optimizers pruned, %.3fs saved '
+                  'per compilation' % (family, len(pruned), len(stats),
+                                       saved), file=stream)
+            for t, name in pruned:
+                print('    %.3fs - %s' % (t, name), file=stream)
+        print('Total: %.3fs saved when compiling each family once' % total,
+              file=stream)
+
+
+def get_profiles():
+    """
+    Return the OptimizerProfiles of the compiledir.
+
+    """
+    return OptimizerProfiles(os.path.join(config.compiledir,
+                                          'optimizer_profiles'))
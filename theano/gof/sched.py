@@ -1,6 +1,9 @@
 from collections import defaultdict
+import heapq
+
+import numpy
 from six import iteritems
-from theano.gof.graph import list_of_nodes
+from theano.gof.graph import Constant, list_of_nodes
 from theano.compat import cmp
 
 # {{{ http://code.activestate.com/recipes/578231/ (r1)
@@ -270,3 +273,203 @@ def key_to_cmp(key):
     def key_cmp(a, b):
         return cmp(key(a), key(b))
     return key_cmp
+
+
+# Size assumed by estimate_nbytes for the dimensions whose length is not
+# known at compile time.
+UNKNOWN_DIM = 100
+
+
+def estimate_nbytes(fgraph):
+    """
+    Return a function that estimates the size in bytes of the variables of
+    `fgraph`.
+
+    The size is computed, by order of preference, from the shapes recorded
+    by the profiler (see config.profile_memory) if `fgraph` was already run,
+    from the shapes inferred by the ShapeFeature of `fgraph`, or from the
+    broadcastable pattern of the type, assuming that each unknown dimension
+    has `UNKNOWN_DIM` elements. Variables without a dtype take 0 bytes.
+
+    """
+    profile = getattr(fgraph, 'profile', None)
+    variable_shape = getattr(profile, 'variable_shape', None) or {}
+    shape_feature = getattr(fgraph, 'shape_feature', None)
+    shape_of = shape_feature.shape_of if shape_feature else {}
+
+    def nbytes(var):
+        if var in variable_shape and hasattr(var.type, 'get_size'):
+            try:
+                return var.type.get_size(variable_shape[var])
+            except Exception:
+                pass
+        dtype = getattr(var.type, 'dtype', None)
+        broadcastable = getattr(var.type, 'broadcastable', None)
+        if dtype is None or broadcastable is None:
+            return 0
+        shape = shape_of.get(var)
+        size = numpy.dtype(dtype).itemsize
+        for i, b in enumerate(broadcastable):
+            if b:
+                continue
+            if shape is not None and isinstance(shape[i], Constant):
+                size *= int(shape[i].data)
+            else:
+                size *= UNKNOWN_DIM
+        return size
+
+    return nbytes
+
+
+def memory_schedule(fgraph, nbytes=None):
+    """
+    Order the nodes of `fgraph` to keep the peak memory usage low.
+
+    This is a greedy list scheduler: among the nodes whose inputs are
+    computed, it always runs the one that increases the memory usage the
+    least, i.e. that allocates the fewest bytes for its outputs minus the
+    bytes of the inputs it is the last one to use. Views and inplace
+    outputs allocate nothing, and keep their input alive. Ties are broken
+    with the order of `fgraph.toposort()`. It runs in
+    O(E log(N)) for a graph of N nodes and E edges.
+
+    Parameters
+    ----------
+    fgraph
+        The FunctionGraph to schedule. The orderings of its features (e.g.
+        the ones of DestroyHandler) are respected.
+    nbytes
+        Function that returns the size in bytes of a variable. Defaults to
+        `estimate_nbytes(fgraph)`.
+
+    Returns
+    -------
+    list
+        The Apply nodes of `fgraph`.
+
+    """
+    if nbytes is None:
+        nbytes = estimate_nbytes(fgraph)
+    order = fgraph.toposort()
+    position = dict((node, i) for i, node in enumerate(order))
+    ords = fgraph.orderings()
+    outputs = set(fgraph.outputs)
+
+    # Views and inplace outputs share the memory of their `root` input, that
+    # is freed when all the users of all its aliases are done.
+    root = {}
+    size = {}
+    for node in order:
+        aliased = {}
+        for o, i in iteritems(getattr(node.op, 'view_map', {})):
+            aliased[o] = i[0]
+        for o, i in iteritems(getattr(node.op, 'destroy_map', {})):
+            aliased[o] = i[0]
+        for o, out in enumerate(node.outputs):
+            if o in aliased:
+                inp = node.inputs[aliased[o]]
+                root[out] = root.get(inp, inp)
+                size[out] = 0
+            else:
+                size[out] = nbytes(out)
+
+    def root_of(var):
+        return root.get(var, var)
+
+    # The number of (user node, alias) pairs of each root not scheduled
+    # yet, and the max number of aliases of a root used by one node.
+    pending = defaultdict(int)
+    max_share = defaultdict(int)
+    never_freed = set()
+    for var in outputs:
+        never_freed.add(root_of(var))
+    node_roots = {}
+    for node in order:
+        roots = defaultdict(int)
+        for var in set(node.inputs):
+            r = root_of(var)
+            if r.owner is None:
+                continue
+            roots[r] += 1
+            pending[r] += 1
+        for r, n in iteritems(roots):
+            max_share[r] = max(max_share[r], n)
+        node_roots[node] = roots
+
+    def delta(node):
+        allocated = sum(size[out] for out in node.outputs)
+        freed = sum(size.get(r, 0) for r, n in iteritems(node_roots[node])
+                    if pending[r] == n and r not in never_freed)
+        return allocated - freed
+
+    prereqs = {}
+    users = defaultdict(list)
+    for node in order:
+        p = set(var.owner for var in node.inputs if var.owner)
+        p.update(ords.get(node, []))
+        prereqs[node] = len(p)
+        for q in p:
+            users[q].append(node)
+    consumers = defaultdict(list)
+    for node in order:
+        for r in node_roots[node]:
+            consumers[r].append(node)
+
+    # Heap of (delta, position, node). An entry is stale if the delta of
+    # the node changed since it was pushed.
+    current = {}
+    heap = []
+
+    def push(node):
+        d = delta(node)
+        current[node] = d
+        heapq.heappush(heap, (d, position[node], node))
+
+    for node in order:
+        if not prereqs[node]:
+            push(node)
+    rval = []
+    done = set()
+    while heap:
+        d, _, node = heapq.heappop(heap)
+        if node in done or current[node] != d:
+            continue
+        done.add(node)
+        rval.append(node)
+        for r, n in iteritems(node_roots[node]):
+            pending[r] -= n
+            if 0 < pending[r] <= max_share[r]:
+                # One of the remaining users may now free r.
+                for other in consumers[r]:
+                    if other in current and other not in done:
+                        push(other)
+        for other in users[node]:
+            prereqs[other] -= 1
+            if not prereqs[other]:
+                push(other)
+    assert len(rval) == len(order)
+    return rval
+
+
+def memory_schedule_fn(nbytes=None):
+    """
+    Make a schedule function that orders the nodes with `memory_schedule`.
+
+    Parameters
+    ----------
+    nbytes
+        Function that takes a FunctionGraph and returns a function that
+        gives the size in bytes of its variables. Defaults to
+        `estimate_nbytes`.
+
+    """
+    if nbytes is None:
+        nbytes = estimate_nbytes
+
+    def schedule(fgraph):
+        """
+        Order nodes in a FunctionGraph to reduce the peak memory usage.
+
+        """
+        return memory_schedule(fgraph, nbytes(fgraph))
+    return schedule
@@ -201,6 +201,25 @@ def test_clinker_literal_inlining():
     assert "4.12345678" in code  # we expect the number to be inlined
 
 
+def test_clinker_release_gil():
+    if not theano.config.cxx:
+        raise SkipTest("G++ not available, so we need to skip this test.")
+    x = theano.tensor.dvector('x')
+    value = numpy.arange(5.)
+    release_gil = theano.config.cmodule.release_gil
+    try:
+        for release in [True, False]:
+            theano.config.cmodule.release_gil = release
+            e = theano.tensor.exp(x).sum()
+            lnk = CLinker().accept(Env([x], [e]))
+            code = lnk.code_gen()
+            assert ("Py_BEGIN_ALLOW_THREADS" in code) == release
+            fn = lnk.make_function()
+            assert numpy.allclose(fn(value), numpy.exp(value).sum())
+    finally:
+        theano.config.cmodule.release_gil = release_gil
+
+
 def test_clinker_single_node():
     if not theano.config.cxx:
         raise SkipTest("G++ not available, so we need to skip this test.")
@@ -4,10 +4,24 @@ But this one tests a current behavior that isn't good: the c_code isn't
 deterministic based on the input type and the op.
 
 """
+import os
+import shutil
+import tempfile
+import time
+
 import numpy
+from nose.plugins.skip import SkipTest
+from six import b
+import six.moves.cPickle as pickle
 
 import theano
-from theano.gof.cmodule import GCC_compiler
+from theano.gof import compilelock
+from theano.gof.cc import precompile_nodes
+from theano.gof.cmodule import (GCC_compiler, KeyData, ModuleCache,
+                                ModuleIndex, PCH_INCLUDES,
+                                get_lib_extension, get_precompiled_header,
+                                key_digest, platform_fingerprint,
+                                std_include_dirs)
 
 
 class MyOp(theano.compile.ops.DeepCopyOp):
@@ -67,3 +81,298 @@ def test_flag_detection():
     # but was not detected because that path is not usually taken,
     # so we test it here directly.
     GCC_compiler.try_flags(["-lblas"])
+
+
+def test_parallel_compilation():
+    # Compiling the modules in parallel must give the same function as
+    # compiling them one after the other.
+    if not theano.config.cxx:
+        raise SkipTest("G++ not available, so we need to skip this test.")
+    x = theano.tensor.dvector('x')
+    outs = [theano.tensor.exp(x), theano.tensor.tanh(x) * 2,
+            theano.tensor.sqrt(x).sum()]
+    mode = theano.compile.get_default_mode().excluding('fusion')
+    v = numpy.arange(1, 10, dtype='float64')
+    orig = theano.config.cmodule.compilation_workers
+    try:
+        theano.config.cmodule.compilation_workers = 1
+        f_serial = theano.function([x], outs, mode=mode)
+        theano.config.cmodule.compilation_workers = 4
+        f_parallel = theano.function([x], outs, mode=mode)
+    finally:
+        theano.config.cmodule.compilation_workers = orig
+    for r_s, r_p in zip(f_serial(v), f_parallel(v)):
+        assert numpy.allclose(r_s, r_p)
+
+
+def test_precompile_nodes():
+    if not theano.config.cxx:
+        raise SkipTest("G++ not available, so we need to skip this test.")
+    x = theano.tensor.dvector('x')
+    fgraph = theano.gof.FunctionGraph([x], [theano.tensor.cosh(x) - 3])
+    order = fgraph.toposort()
+    # Nothing is compiled when parallel compilation is disabled.
+    assert precompile_nodes(order, [], n_workers=1) == 0
+    # Once the modules are compiled, they are found in the cache.
+    precompile_nodes(order, [], n_workers=2)
+    assert precompile_nodes(order, [], n_workers=2) == 0
+
+
+def test_multi_lock_ctx():
+    base = tempfile.mkdtemp()
+    try:
+        lock_dirs = [os.path.join(base, 'module_locks', h)
+                     for h in ('b', 'a', 'b')]
+        with compilelock.multi_lock_ctx(lock_dirs) as refresh:
+            owners = []
+            for lock_dir in lock_dirs:
+                with open(os.path.join(lock_dir, 'lock')) as f:
+                    owners.append(f.read())
+            # Just acquired: nothing to refresh yet.
+            refresh()
+            for lock_dir, owner in zip(lock_dirs, owners):
+                with open(os.path.join(lock_dir, 'lock')) as f:
+                    assert f.read() == owner
+            refresh(force=True)
+            for lock_dir, owner in zip(lock_dirs, owners):
+                with open(os.path.join(lock_dir, 'lock')) as f:
+                    assert f.read() != owner
+        for lock_dir in lock_dirs:
+            assert not os.path.exists(lock_dir)
+    finally:
+        shutil.rmtree(base)
+
+
+def test_module_lock_released():
+    # Compiling a module must not leave its module lock behind, nor keep
+    # the lock on the whole compilation directory.
+    if not theano.config.cxx:
+        raise SkipTest("G++ not available, so we need to skip this test.")
+    x = theano.tensor.dvector('x')
+    f = theano.function([x], theano.tensor.arcsinh(x) * 3)
+    f(numpy.arange(3, dtype='float64'))
+    lock_base = os.path.join(theano.config.compiledir, 'module_locks')
+    if os.path.isdir(lock_base):
+        assert os.listdir(lock_base) == []
+    assert not compilelock.lock_is_held()
+
+
+def test_module_index():
+    base = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(base, 'module_index')
+        index = ModuleIndex(filename)
+        assert not index.read()
+        index.append('hash1', 'tmp1')
+        index.append('hash2', 'tmp2')
+        # Simulate a process that crashed while appending an entry.
+        with open(filename, 'ab') as f:
+            f.write(b('hash3 tm'))
+        other = ModuleIndex(filename)
+        assert other.read()
+        assert other.entries == {'hash1': ['tmp1'], 'hash2': ['tmp2']}
+        index.append('hash1', 'tmp4')
+        assert other.read()
+        assert other.entries['hash1'] == ['tmp1', 'tmp4']
+        assert 'hash3' not in other.entries
+        assert other.n_entries == 3
+        index.append(None, 'tmp2', ['digest1', 'digest2'])
+        assert other.read()
+        assert other.key_entries == {'digest1': ['tmp2'],
+                                     'digest2': ['tmp2']}
+        assert other.n_entries == 5
+        # Replacing the index is seen by other readers.
+        index.write([('hash2', 'tmp2')], [('digest1', 'tmp2')])
+        assert other.read()
+        assert other.entries == {'hash2': ['tmp2']}
+        assert other.key_entries == {'digest1': ['tmp2']}
+        assert other.dirs == set(['tmp2'])
+        # An index in an unknown format is ignored.
+        with open(filename, 'wb') as f:
+            f.write(b('theano module index 0\nhash1 tmp1\n'))
+        assert not ModuleIndex(filename).read()
+    finally:
+        shutil.rmtree(base)
+
+
+def make_fake_modules(base):
+    """
+    Create three fake modules of 1000 bytes in `base`, the first one being
+    the least recently used (100 seconds ago).
+
+    """
+    now = time.time()
+    for i in range(3):
+        location = tempfile.mkdtemp(dir=base)
+        entry = os.path.join(location, 'mod.' + get_lib_extension())
+        with open(entry, 'wb') as f:
+            f.write(b('x') * 1000)
+        key_pkl = os.path.join(location, 'key.pkl')
+        key = ((1,), ('CLinker.cmodule_key', 'md5:%d' % i))
+        key_data = KeyData(keys=set([key]),
+                           module_hash='hash%d' % i,
+                           key_pkl=key_pkl, entry=entry)
+        with open(key_pkl, 'wb') as f:
+            pickle.dump(key_data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.utime(entry, (now - 100 + i, now - 100 + i))
+
+
+def test_clear_lru():
+    base = tempfile.mkdtemp()
+    try:
+        make_fake_modules(base)
+        cache = ModuleCache(base)
+        assert len(cache.module_hash_to_key_data) == 3
+        before, after = cache.clear_lru(max_size=2800)
+        assert 3000 < before < 4000
+        assert after <= 2800
+        assert sorted(cache.module_hash_to_key_data) == ['hash1', 'hash2']
+        assert sorted(key[1][1] for key in cache.entry_from_key
+                      ) == ['md5:1', 'md5:2']
+        # The deleted module is not seen by new processes.
+        other = ModuleCache(base)
+        assert sorted(other.index.entries) == ['hash1', 'hash2']
+        other.refresh(full_scan=True)
+        assert sorted(other.module_hash_to_key_data) == ['hash1', 'hash2']
+        assert cache.clear_lru(max_size=0)[1] == 0
+        assert [d for d in os.listdir(base) if d.startswith('tmp')] == []
+    finally:
+        shutil.rmtree(base)
+
+
+def test_clear_from_index():
+    if not theano.config.cmodule.use_index:
+        raise SkipTest("Needs the module index")
+    base = tempfile.mkdtemp()
+    try:
+        make_fake_modules(base)
+        # Builds the index.
+        ModuleCache(base)
+        # The clean-up done at exit does not load the key.pkl files of the
+        # indexed modules.
+        cache = ModuleCache(base)
+        assert not cache.loaded_key_pkl
+        cache.clear_old(age_thresh_del=99.5, full_scan=False)
+        assert sorted(cache.index.entries) == ['hash1', 'hash2']
+        before, after = cache.clear_lru(max_size=1500, full_scan=False)
+        assert 2000 < before < 3000
+        assert after <= 1500
+        assert sorted(cache.index.entries) == ['hash2']
+        assert not cache.loaded_key_pkl
+        other = ModuleCache(base)
+        other.refresh(full_scan=True)
+        assert sorted(other.module_hash_to_key_data) == ['hash2']
+    finally:
+        shutil.rmtree(base)
+
+
+def test_key_index():
+    if not theano.config.cmodule.use_index:
+        raise SkipTest("Needs the module index")
+    base = tempfile.mkdtemp()
+    try:
+        make_fake_modules(base)
+        # Builds the index.
+        ModuleCache(base)
+        # A key is found without its module hash, only loading its
+        # directory.
+        cache = ModuleCache(base)
+        assert not cache.loaded_key_pkl
+        key = ((1,), ('CLinker.cmodule_key', 'md5:1'))
+        assert key_digest(key) in cache.index.key_entries
+        assert cache._load_from_key_index(key)
+        assert list(cache.module_hash_to_key_data) == ['hash1']
+        assert len(cache.loaded_key_pkl) == 1
+        assert not cache._load_from_key_index(
+            ((1,), ('CLinker.cmodule_key', 'md5:3')))
+    finally:
+        shutil.rmtree(base)
+
+
+def test_export_import_bundle():
+    if not theano.config.cxx:
+        raise SkipTest("Need cxx for this test")
+    x = theano.tensor.dvector()
+    fingerprint = platform_fingerprint()
+    base = tempfile.mkdtemp()
+    try:
+        # Use a new cache, so that only a few modules are exported.
+        src_dir = os.path.join(base, 'src')
+        os.mkdir(src_dir)
+        src = ModuleCache(src_dir)
+        for y in [theano.tensor.exp(x) * 2, theano.tensor.tanh(x) + 3]:
+            lnk = y.owner.op.c_linker(y.owner, [])
+            src.module_from_key(lnk.cmodule_key(), lnk)
+        bundle = os.path.join(base, 'bundle.tar.gz')
+        n_exported = src.export_bundle(bundle)
+        assert n_exported == 2
+        dst_dir = os.path.join(base, 'compiledir')
+        os.mkdir(dst_dir)
+        dst = ModuleCache(dst_dir)
+        assert dst.import_bundle(bundle) == n_exported
+        # Importing twice does not duplicate modules.
+        assert dst.import_bundle(bundle) == 0
+        assert len(dst.module_hash_to_key_data) == n_exported
+        for key_data in dst.module_hash_to_key_data.values():
+            assert key_data.get_entry().startswith(dst_dir)
+        # The keys are found without compilation. The modules themselves
+        # can not be loaded here, as they were already imported from the
+        # original cache by this process.
+        for key in src.entry_from_key:
+            if key[0]:
+                assert dst.entry_from_key[key].startswith(dst_dir)
+
+        # A bundle from another platform is refused.
+        fingerprint['c_compiler'] = 'other'
+        old = theano.gof.cmodule.platform_fingerprint
+        theano.gof.cmodule.platform_fingerprint = lambda: fingerprint
+        try:
+            dst.import_bundle(bundle)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('The bundle should have been refused')
+        finally:
+            theano.gof.cmodule.platform_fingerprint = old
+    finally:
+        shutil.rmtree(base)
+
+
+def test_precompiled_header():
+    if not theano.config.cxx:
+        raise SkipTest("Need cxx for this test")
+    args = ['-g', '-O0', '-fPIC'] + ['-I%s' % d for d in std_include_dirs()]
+    assert get_precompiled_header('int f() { return 0; }\n', args) is None
+    code = '\n'.join(PCH_INCLUDES[:1] + ['int f() { return 0; }', ''])
+    header = get_precompiled_header(code, args)
+    assert os.path.exists(header + '.gch')
+    with open(header) as f:
+        assert f.read() == PCH_INCLUDES[0] + '\n'
+    assert get_precompiled_header(code, args) == header
+    # Other compiler options use another header.
+    other = get_precompiled_header(code, args + ['-DTHEANO_TEST_PCH'])
+    assert other not in (None, header)
+    # Other versions of the included headers use another header.
+    old_version = theano.gof.cmodule._pch_headers_version_str
+    assert numpy.__version__ in old_version
+    theano.gof.cmodule._pch_headers_version_str = old_version + ' changed'
+    try:
+        other = get_precompiled_header(code, args)
+        assert other not in (None, header)
+    finally:
+        theano.gof.cmodule._pch_headers_version_str = old_version
+    # The header is not used if it can not be compiled.
+    assert get_precompiled_header(
+        code, args + ['-include', 'theano_no_such_header.h']) is None
+
+    old = theano.config.cmodule.precompiled_headers
+    theano.config.cmodule.precompiled_headers = True
+    base = tempfile.mkdtemp()
+    try:
+        GCC_compiler.compile_str('pch_test', code, location=base,
+                                 py_module=False)
+        assert os.path.exists(os.path.join(
+            base, 'pch_test.' + get_lib_extension()))
+    finally:
+        theano.config.cmodule.precompiled_headers = old
+        shutil.rmtree(base)
@@ -432,3 +432,34 @@ def test_value_repl_2():
     consistent(g)
     g.replace(sy, transpose_view(MyConstant("abc")))
     consistent(g)
+
+
+def test_incremental_order():
+    # The order kept by the DestroyHandler to detect cycles must stay
+    # valid through the replacements and their reverts.
+    def check_order(g):
+        dh = g.destroy_handler
+        assert not dh.bad_edges
+        assert set(dh.position) == g.apply_nodes
+        for app in g.apply_nodes:
+            for p in dh.predecessors(app):
+                assert dh.position[p] < dh.position[app]
+
+    x, y, z = inputs()
+    e1 = add(x, y)
+    e2 = add(y, x)
+    g = Env([x, y, z], [dot(e1, e2)])
+    assert g.destroy_handler.order is None
+    g.replace_validate(e1, add_in_place(x, y))
+    check_order(g)
+    try:
+        g.replace_validate(e2, add_in_place(y, x))
+        raise Exception("Shouldn't have reached this point.")
+    except InconsistencyError:
+        pass
+    consistent(g)
+    check_order(g)
+    g.replace_validate(e2, sigmoid(transpose_view(y)))
+    check_order(g)
+    g.replace_validate(x, transpose_view(z))
+    check_order(g)
@@ -1,14 +1,20 @@
 import os
+import shutil
+import tempfile
+
 import numpy
 import theano
 import theano.tensor as T
+from theano.compile.function_module import std_fgraph
+from theano.compile.io import In, SymbolicOutput
+from theano.compile.optcache import OptimizationCache, graph_key
 
 floatX = 'float32'
 
 
 def test_graph_opt_caching():
-    opt_db_file = theano.config.compiledir + '/optimized_graphs.pkl'
-    os.system('rm %s' % opt_db_file)
+    opt_db_dir = os.path.join(theano.config.compiledir, 'optimized_graphs')
+    shutil.rmtree(opt_db_dir, ignore_errors=True)
 
     mode = theano.config.mode
     if mode in ["DEBUG_MODE", "DebugMode"]:
@@ -36,5 +42,110 @@ def test_graph_opt_caching():
     finally:
         theano.config.cache_optimizations = default
 
+
+def test_graph_opt_cache_hit():
+    mode = theano.compile.mode.get_mode('FAST_RUN')
+    default = theano.config.cache_optimizations
+    dirname = tempfile.mkdtemp()
+    cache = OptimizationCache(dirname)
+
+    def build(name):
+        x = T.dvector(name)
+        y = T.dvector()
+        w = theano.shared(numpy.arange(3.), name=name + '_w')
+        out = T.exp(x * 2 + y) * w + x.sum()
+        return [x, y], out, w
+
+    def specs(inputs, out, w):
+        return ([In(i) for i in inputs + [w]], [SymbolicOutput(out)])
+
+    class CountingOptimizer(object):
+        def __init__(self, optimizer):
+            self.optimizer = optimizer
+            self.calls = 0
+
+        def __call__(self, fgraph):
+            self.calls += 1
+            return self.optimizer(fgraph)
+
+        def print_summary(self, stream, level=0, depth=-1):
+            self.optimizer.print_summary(stream, level, depth)
+
+    try:
+        theano.config.cache_optimizations = True
+        inputs, out, w = build('a')
+        ins, outs = specs(inputs, out, w)
+        opt = CountingOptimizer(mode.optimizer)
+        fgraph = std_fgraph(ins, outs)[0]
+        key = graph_key(fgraph, ins, outs, opt)
+        cache.optimize(opt, fgraph, ins, outs)
+        assert opt.calls == 1
+        assert os.path.exists(cache.entry_filename(key))
+        assert key in cache.read_index()
+        n_nodes = len(fgraph.apply_nodes)
+
+        # The same structure, with other names and other variables, is
+        # found in the cache and the optimizer is not called.
+        inputs2, out2, w2 = build('b')
+        ins2, outs2 = specs(inputs2, out2, w2)
+        fgraph2 = std_fgraph(ins2, outs2)[0]
+        assert graph_key(fgraph2, ins2, outs2, opt) == key
+        assert cache.optimize(opt, fgraph2, ins2, outs2) is None
+        assert opt.calls == 1
+        assert len(fgraph2.apply_nodes) == n_nodes
+        assert all(r in fgraph2.inputs
+                   for r in theano.gof.graph.inputs(fgraph2.outputs)
+                   if not isinstance(r, theano.gof.Constant))
+
+        # Another constant gives another key.
+        x = T.dvector('a')
+        y = T.dvector()
+        out3 = T.exp(x * 3 + y) * w + x.sum()
+        ins3, outs3 = specs([x, y], out3, w)
+        fgraph3 = std_fgraph(ins3, outs3)[0]
+        assert graph_key(fgraph3, ins3, outs3, opt) != key
+
+        # The functions built from the cache compute the right values.
+        f1 = theano.function(inputs, out, mode=mode)
+        f2 = theano.function(inputs2, out2, mode=mode)
+        w2.set_value(numpy.arange(3.) + 1)
+        xv = numpy.asarray([1., 2., 3.])
+        yv = numpy.asarray([.5, .25, 0.])
+        expected = numpy.exp(xv * 2 + yv) * numpy.arange(3.) + xv.sum()
+        assert numpy.allclose(f1(xv, yv), expected)
+        expected = numpy.exp(xv * 2 + yv) * (numpy.arange(3.) + 1) + xv.sum()
+        assert numpy.allclose(f2(xv, yv), expected)
+    finally:
+        theano.config.cache_optimizations = default
+        shutil.rmtree(dirname)
+
+
+def test_graph_opt_cache_lru():
+    dirname = tempfile.mkdtemp()
+    try:
+        cache = OptimizationCache(dirname)
+        mode = theano.compile.mode.get_mode('FAST_RUN')
+        keys = []
+        for i in range(3):
+            x = T.dvector()
+            ins, outs = [In(x)], [SymbolicOutput(x * (i + 2))]
+            fgraph = std_fgraph(ins, outs)[0]
+            key = graph_key(fgraph, ins, outs, mode.optimizer)
+            cache.optimize(mode.optimizer, fgraph, ins, outs)
+            # Make the access times distinct.
+            os.utime(cache.entry_filename(key), (i, i))
+            keys.append(key)
+        sizes = cache.read_index()
+        assert sorted(sizes) == sorted(keys)
+        # The first entry is the least recently used one.
+        cache.clear_lru(sizes[keys[1]] + sizes[keys[2]])
+        assert not os.path.exists(cache.entry_filename(keys[0]))
+        assert os.path.exists(cache.entry_filename(keys[1]))
+        assert os.path.exists(cache.entry_filename(keys[2]))
+        assert sorted(cache.read_index()) == sorted(keys[1:])
+    finally:
+        shutil.rmtree(dirname)
+
+
 if __name__ == '__main__':
     test_graph_opt_caching()
@@ -1,4 +1,11 @@
+import os
+import shutil
+import tempfile
 
+from six import StringIO
+
+import theano
+from theano.gof import optprofile
 from theano.gof.type import Type
 from theano.gof.graph import Variable, Apply, Constant
 from theano.gof.op import Op
@@ -510,6 +517,33 @@ class TestMergeOptimizer:
                         if isinstance(n.op, NoInputOp)]
         assert len(no_input_ops) == 2, fg.apply_nodes
 
+    def test_node_index(self):
+        # Check that the index of the MergeFeature follows the changes
+        # of the graph.
+        x, y, z = inputs()
+        e = op1(op_y(x, y), op_z(x, y), op2(op_y(x, z)))
+        g = FunctionGraph([x, y, z], [e])
+        MergeOptimizer().optimize(g)
+        assert str(g) in ("[Op1(*1 -> OpY(x, y), *1, Op2(OpY(x, z)))]",
+                          "[Op1(*1 -> OpZ(x, y), *1, Op2(OpY(x, z)))]")
+
+        feature = g.merge_feature
+        assert set(feature.node_key) == feature.nodes_seen == g.apply_nodes
+        for node, key in feature.node_key.items():
+            assert key == (node.op, tuple(node.inputs))
+            assert node in feature.node_index[key]
+
+        # Changing an input of a node reindexes it, so it can be merged.
+        node = e.owner.inputs[2].owner.inputs[0].owner
+        g.replace(node.inputs[1], y)
+        assert feature.node_key[e.owner.inputs[0].owner] == (op_y, (x, y))
+        MergeOptimizer().optimize(g)
+        assert str(g) in ("[Op1(*1 -> OpY(x, y), *1, Op2(*1))]",
+                          "[Op1(*1 -> OpZ(x, y), *1, Op2(*1))]")
+        assert len(g.apply_nodes) == 3
+        assert set(feature.node_key) == g.apply_nodes
+        assert sum(len(b) for b in feature.node_index.values()) == 3
+
 
 class TestEquilibrium(object):
 
@@ -567,6 +601,81 @@ class TestEquilibrium(object):
         # print 'after', g
         assert str(g) == '[Op1(x, y)]'
 
+    def test_deadline(self):
+        x, y, z = map(MyVariable, 'xyz')
+        e = op3(op4(x, y))
+        subs = [PatternSub((op4, 'x', 'y'), (op1, 'x', 'y'))]
+        g = FunctionGraph([x, y, z], [e])
+        g.optimizer_deadline = 0
+        # Only interruptible optimizers look at the deadline.
+        EquilibriumOptimizer(subs, max_use_ratio=10).optimize(g)
+        assert str(g) == '[Op3(Op1(x, y))]'
+        assert not hasattr(g, 'optimizer_interrupted')
+
+        g = FunctionGraph([x, y, z], [op3(op4(x, y))])
+        g.optimizer_deadline = 0
+        EquilibriumOptimizer(subs, max_use_ratio=10,
+                             interruptible=True).optimize(g)
+        assert str(g) == '[Op3(Op4(x, y))]'
+        assert g.optimizer_interrupted
+
+    def test_pruning(self):
+        # Tried on the Op3 nodes, but only changes Op3(Op1(x, y)).
+        never = PatternSub((op3, (op1, 'x', 'y')), (op2, 'x', 'y'),
+                           name='never')
+        useful = PatternSub((op4, 'x', 'y'), (op5, 'x', 'y'), name='useful')
+        opt = EquilibriumOptimizer([never, useful], max_use_ratio=10,
+                                   interruptible=True)
+        opt.name = 'test_pruning'
+
+        dirname = tempfile.mkdtemp()
+        profiles = optprofile.OptimizerProfiles(dirname)
+        get_profiles = optprofile.get_profiles
+        pruning = theano.config.optimizer_pruning
+        min_compiles = theano.config.optimizer_pruning_min_compiles
+        optprofile.get_profiles = lambda: profiles
+        theano.config.optimizer_pruning = 'on'
+        theano.config.optimizer_pruning_min_compiles = 2
+        try:
+            x, y, z = map(MyVariable, 'xyz')
+            for i in range(3):
+                g = FunctionGraph([x, y, z], [op3(op4(x, y))])
+                prof = opt.apply(g)
+                assert str(g) == '[Op3(Op5(x, y))]'
+                pruned = prof[-1]
+                if i < 2:
+                    assert pruned == {}
+                else:
+                    assert list(pruned) == [never]
+
+            # The graphs of another family are still fully optimized.
+            g = FunctionGraph([x, y, z], [op3(op1(x, y))])
+            assert opt.apply(g)[-1] == {}
+            assert str(g) == '[Op2(x, y)]'
+
+            stream = StringIO()
+            profiles.report(stream)
+            assert '1 of 2 local optimizers pruned' in stream.getvalue()
+
+            # 'off' tries all the local optimizers again.
+            theano.config.optimizer_pruning = 'off'
+            g = FunctionGraph([x, y, z], [op3(op4(x, y))])
+            assert opt.apply(g)[-1] == {}
+
+            # The profiles can not be written where a file is, which must
+            # not stop the optimization.
+            theano.config.optimizer_pruning = 'on'
+            profiles.dirname = os.path.join(dirname, 'file')
+            open(profiles.dirname, 'w').close()
+            g = FunctionGraph([x, y, z], [op3(op4(x, y))])
+            assert opt.apply(g)[-1] == {}
+            assert str(g) == '[Op3(Op5(x, y))]'
+        finally:
+            optprofile.get_profiles = get_profiles
+            theano.config.optimizer_pruning = pruning
+            theano.config.optimizer_pruning_min_compiles = min_compiles
+            shutil.rmtree(dirname)
+
 
 def test_pre_constant_merge_slice():
     ms = theano.tensor.type_other.MakeSlice()(1)
@@ -1,5 +1,9 @@
+import numpy
+
+import theano
 from theano.gof.sched import (make_dependence_cmp, sort_apply_nodes,
-                              reverse_dict, _toposort, posort)
+                              reverse_dict, _toposort, posort,
+                              memory_schedule)
 
 from theano import tensor
 from theano.gof.graph import io_toposort
@@ -67,3 +71,57 @@ def test_posort():
             lambda a, b: a - b]
     assert (posort(l, *cmps) ==
             [10, 1, 11, 2, 12, 3, 13, 4, 14, 5, 15, 6, 16, 7, 17, 8, 18, 9, 19])
+
+
+def peak_memory(order, nbytes, outputs):
+    """Peak of the bytes allocated by the nodes, freed after their last use.
+
+    """
+    last_use = {}
+    for i, node in enumerate(order):
+        for var in node.inputs:
+            last_use[var] = i
+    live = peak = 0
+    for i, node in enumerate(order):
+        live += sum(nbytes(out) for out in node.outputs)
+        peak = max(peak, live)
+        live -= sum(nbytes(var) for var in set(node.inputs)
+                    if var.owner and last_use[var] == i and
+                    var not in outputs)
+    return peak
+
+
+def test_memory_schedule():
+    # Each branch builds a big matrix that is reduced to a scalar: running
+    # the branches one after the other keeps a single big matrix alive.
+    x = tensor.vector('x')
+    branches = [tensor.outer(x, x + i).sum() for i in range(4)]
+    fgraph = theano.FunctionGraph([x], [tensor.add(*branches)])
+
+    def nbytes(var):
+        if isinstance(var.owner.op, tensor.DimShuffle):
+            return 0
+        return 1000 if var.ndim == 2 else 1
+
+    order = memory_schedule(fgraph, nbytes)
+    assert set(order) == set(fgraph.apply_nodes)
+    done = set()
+    for node in order:
+        assert all(inp.owner is None or inp.owner in done
+                   for inp in node.inputs)
+        done.add(node)
+    assert peak_memory(order, nbytes, fgraph.outputs) <= peak_memory(
+        fgraph.toposort(), nbytes, fgraph.outputs)
+    assert peak_memory(order, nbytes, fgraph.outputs) < 2000
+
+
+def test_memory_schedule_linker():
+    x = tensor.dvector('x')
+    y = tensor.exp(x).sum() + tensor.outer(x, x).sum()
+    linker = theano.gof.vm.VM_Linker(
+        schedule=theano.gof.sched.memory_schedule_fn())
+    f = theano.function([x], y, mode=theano.Mode(linker=linker))
+    value = numpy.arange(3.)
+    assert numpy.allclose(f(value),
+                          numpy.exp(value).sum() +
+                          numpy.outer(value, value).sum())
@@ -85,3 +85,35 @@ class TestNodeFinder:
         for type, num in ((add, 4), (sigmoid, 3), (dot, 1)):
             if not len([t for t in g.get_nodes(type)]) == num:
                 raise Exception("Expected: %i times %s" % (num, type))
+
+
+class TestTopoOrder:
+
+    def check_order(self, g):
+        order = g.topo_order.nodes()
+        assert len(order) == len(g.apply_nodes)
+        assert set(order) == g.apply_nodes
+        position = dict((node, i) for i, node in enumerate(order))
+        for node in order:
+            for input in node.inputs:
+                if input.owner is not None:
+                    assert position[input.owner] < position[node]
+
+    def test_straightforward(self):
+        x, y, z = inputs()
+        e0 = dot(y, z)
+        e = add(add(sigmoid(x), sigmoid(sigmoid(z))), dot(add(x, y), e0))
+        g = FunctionGraph([x, y, z], [e], clone=False)
+        g.attach_feature(TopoOrder())
+
+        assert hasattr(g, 'topo_order')
+        self.check_order(g)
+        # The new nodes are imported after the clients of x.
+        g.replace(x, sigmoid(dot(y, e0)))
+        self.check_order(g)
+        g.replace(e0, add(y, z))
+        self.check_order(g)
+        assert g.toposort() == g.topo_order.nodes()
+
+        g.remove_feature(g.topo_order)
+        assert not hasattr(g, 'topo_order')
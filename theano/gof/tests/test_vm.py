@@ -6,7 +6,7 @@ import unittest
 
 from nose.plugins.skip import SkipTest
 import numpy
-from six import itervalues
+from six import iteritems, itervalues
 
 from theano import function
 from theano.gof import vm
@@ -396,3 +396,262 @@ def test_reallocation():
         assert check_storage(storage_map)[0]
         assert len(set(id(v) for v in
                        itervalues(storage_map))) < len(storage_map)
+
+
+def test_reallocation_tensors():
+    x = tensor.dvector('x')
+    y = tensor.dvector('y')
+    z = tensor.tanh(3 * x + y) + tensor.cosh(x + 5 * y)
+    value = numpy.arange(4.)
+    expected = numpy.tanh(3 * value + 1) + numpy.cosh(value + 5)
+    for allow_gc in [False, True]:
+        l = vm.VM_Linker(allow_gc=allow_gc, lazy=False, use_cloop=False)
+        m = theano.compile.get_mode(theano.Mode(linker=l))
+        m = m.excluding('fusion', 'inplace')
+        profile = theano.compile.profiling.ProfileStats(atexit_print=False)
+        f = theano.function([x, y], z, mode=m, profile=profile)
+        assert profile.reallocated_buffers > 0
+        # Some thunks write their output in the storage of the output of a
+        # thunk that ran before them.
+        shared = []
+        for i, thunk in enumerate(f.fn.thunks):
+            for j in range(i):
+                for k, cell in enumerate(thunk.outputs):
+                    if any(cell is c for c in f.fn.thunks[j].outputs):
+                        shared.append((f.fn.nodes[i].outputs[k], cell))
+        assert shared
+        for i in range(2):
+            assert numpy.allclose(f(value, numpy.ones(4)), expected)
+        inputs = f.maker.fgraph.inputs
+        for var, cell in shared:
+            if allow_gc:
+                # The storage of the variable reusing the buffer is freed.
+                assert cell[0] is None
+            else:
+                # It holds the value computed by the later thunk.
+                g = theano.function(inputs, var,
+                                    mode=Mode(linker='py', optimizer=None))
+                assert numpy.allclose(cell[0], g(value, numpy.ones(4)))
+        if allow_gc:
+            # No intermediate result is kept after the call.
+            for var, cell in iteritems(f.fn.storage_map):
+                if var.owner and var not in f.maker.fgraph.outputs:
+                    assert cell[0] is None, var
+
+
+def test_reallocation_views():
+    # v is a view of a, that is still needed after the last use of v. The
+    # storage of v must not be reused by c.
+    x = tensor.dvector('x')
+    a = x + 1
+    v = a[::-1]
+    b = v + 1
+    c = x * 2
+    outputs = [b, a + c]
+    value = numpy.arange(4.)
+    for allow_gc in [False, True]:
+        l = vm.VM_Linker(allow_gc=allow_gc, lazy=False, use_cloop=False)
+        m = theano.compile.get_mode(theano.Mode(linker=l))
+        m = m.excluding('fusion', 'inplace')
+        f = theano.function([x], outputs, mode=m)
+        for i in range(2):
+            b_val, out_val = f(value)
+            assert numpy.allclose(b_val, (value + 1)[::-1] + 1)
+            assert numpy.allclose(out_val, (value + 1) + value * 2)
+
+
+class ScaleOp(theano.Op):
+    """Multiply by a constant, with C code that is not cached on disk."""
+
+    __props__ = ("factor",)
+
+    def __init__(self, factor):
+        self.factor = factor
+
+    def make_node(self, x):
+        x = tensor.as_tensor_variable(x)
+        return theano.Apply(self, [x], [x.type()])
+
+    def perform(self, node, inputs, outputs):
+        outputs[0][0] = inputs[0] * self.factor
+
+    def c_code(self, node, name, inames, onames, sub):
+        x, = inames
+        z, = onames
+        factor = self.factor
+        fail = sub['fail']
+        return """
+        Py_XDECREF(%(z)s);
+        %(z)s = (PyArrayObject*)PyArray_NewCopy(%(x)s, NPY_ANYORDER);
+        if (!%(z)s)
+            %(fail)s
+        {
+            npy_intp n = PyArray_SIZE(%(z)s);
+            dtype_%(z)s* data = (dtype_%(z)s*)PyArray_DATA(%(z)s);
+            for (npy_intp i = 0; i < n; ++i)
+                data[i] *= %(factor)s;
+        }
+        """ % locals()
+
+
+def test_background_compile():
+    if not theano.config.cxx:
+        raise SkipTest("G++ not available, so we need to skip this test.")
+    x = tensor.dvector('x')
+    value = numpy.arange(5.)
+    for factor, use_cloop in [(3, False), (5, True)]:
+        profile = theano.compile.profiling.ProfileStats(atexit_print=False)
+        linker = vm.VM_Linker(use_cloop=use_cloop, background_compile=True)
+        f = function([x], ScaleOp(factor)(x) + 1,
+                     mode=Mode(optimizer=None, linker=linker),
+                     profile=profile)
+        compiler = f.fn.background_compiler
+        node, = [n for n in f.maker.fgraph.apply_nodes
+                 if isinstance(n.op, ScaleOp)]
+        assert node in compiler.status
+        assert numpy.allclose(f(value), value * factor + 1)
+        assert compiler.wait(timeout=600)
+        assert compiler.status[node] == 'c'
+        thunk = f.fn.thunks[f.fn.nodes.index(node)]
+        assert hasattr(thunk, 'cthunk')
+        assert numpy.allclose(f(value), value * factor + 1)
+        assert profile.apply_swap[node] == 'c'
+        assert profile.apply_cimpl[node]
+
+
+class BadKeyScaleOp(ScaleOp):
+
+    def c_compile_args(self):
+        raise RuntimeError('no key')
+
+
+def test_background_compile_bad_key():
+    if not theano.config.cxx:
+        raise SkipTest("G++ not available, so we need to skip this test.")
+    x = tensor.dvector('x')
+    value = numpy.arange(5.)
+    linker = vm.VM_Linker(background_compile=True)
+    # The Python implementation is kept when the key of the C module can
+    # not be computed.
+    f = function([x], BadKeyScaleOp(3)(x) + 1,
+                 mode=Mode(optimizer=None, linker=linker))
+    compiler = getattr(f.fn, 'background_compiler', None)
+    if compiler is not None:
+        assert not any(isinstance(n.op, BadKeyScaleOp)
+                       for n in compiler.status)
+    assert numpy.allclose(f(value), value * 3 + 1)
+
+
+def test_parallel_vm():
+    x = tensor.dvector('x')
+    # Independent branches, joined at the end.
+    branches = [tensor.tanh(x * (i + 1)).sum() for i in range(6)]
+    out = tensor.add(*branches)
+    value = numpy.arange(5.)
+    expected = sum(numpy.tanh(value * (i + 1)).sum() for i in range(6))
+    for allow_gc in [True, False]:
+        linker = vm.VM_Linker(allow_gc=allow_gc, n_threads=3)
+        f = function([x], [out] + branches[:2],
+                     mode=Mode(optimizer=None, linker=linker))
+        assert isinstance(f.fn, vm.Parallel)
+        for i in range(3):
+            outs = f(value)
+            assert numpy.allclose(outs[0], expected)
+            assert numpy.allclose(outs[1], numpy.tanh(value).sum())
+        if allow_gc:
+            # Only the outputs are kept.
+            kept = [var for var, storage in f.fn.storage_map.items()
+                    if var.owner and storage[0] is not None]
+            assert set(kept) <= set(f.maker.fgraph.outputs)
+
+
+def test_parallel_vm_error():
+    x = tensor.dvector('x')
+    y = tensor.dvector('y')
+    out = (x + y).sum() + tensor.exp(x).sum()
+    linker = vm.VM_Linker(n_threads=2)
+    f = function([x, y], out, mode=Mode(optimizer=None, linker=linker))
+    assert isinstance(f.fn, vm.Parallel)
+    try:
+        f(numpy.arange(3.), numpy.arange(4.))
+    except ValueError as e:
+        assert e.__op_instance__.op == tensor.add
+    else:
+        assert False
+    # The function can still be used after an error.
+    assert numpy.allclose(f(numpy.arange(3.), numpy.arange(3.)),
+                          (2 * numpy.arange(3.)).sum() +
+                          numpy.exp(numpy.arange(3.)).sum())
+
+
+class InterruptOp(theano.Op):
+    """Raise KeyboardInterrupt when run."""
+
+    __props__ = ()
+
+    def make_node(self, x):
+        x = tensor.as_tensor_variable(x)
+        return theano.Apply(self, [x], [x.type()])
+
+    def perform(self, node, inputs, outputs):
+        raise KeyboardInterrupt()
+
+
+def test_parallel_vm_interrupt():
+    x = tensor.dvector('x')
+    out = InterruptOp()(x * 2).sum() + tensor.exp(x).sum()
+    linker = vm.VM_Linker(n_threads=2)
+    f = function([x], out, mode=Mode(optimizer=None, linker=linker))
+    assert isinstance(f.fn, vm.Parallel)
+    # The exception is raised in the caller instead of blocking it.
+    try:
+        f(numpy.arange(3.))
+    except KeyboardInterrupt:
+        pass
+    else:
+        assert False
+
+
+def test_buffer_pool():
+    x = tensor.dvector('x')
+    out = tensor.tanh(x * 2) + tensor.exp(x + 1)
+    linker = vm.VM_Linker(buffer_pool=True, use_cloop=False)
+    profile = theano.compile.profiling.ProfileStats(atexit_print=False)
+    f = function([x], out, mode=Mode(optimizer=None, linker=linker),
+                 profile=profile)
+    assert isinstance(f.fn, vm.LoopPool)
+    # The output is returned without a copy.
+    assert f.maker.outputs[0].borrow
+    for size in [5, 5, 5, 7, 7]:
+        value = numpy.arange(float(size))
+        expected = numpy.tanh(value * 2) + numpy.exp(value + 1)
+        assert numpy.allclose(f(value), expected)
+    # The intermediate results of a call reuse the ndarrays of the previous
+    # one when the shape did not change.
+    assert profile.buffer_pool_hits > 0
+    assert profile.buffer_pool_misses > 0
+
+
+def test_buffer_pool_release():
+    pool = vm.BufferPool(max_buffers=2)
+    a = numpy.zeros(3)
+    cell = [a]
+    # `a` is still used, so it is not kept.
+    pool.release(cell)
+    assert cell[0] is None
+    assert pool.get('float64', (3,)) is None
+    cell = [numpy.zeros(3)]
+    pool.release(cell)
+    assert pool.get('float64', (3,)) is not None
+    assert pool.get('float64', (3,)) is None
+    # Views are not kept.
+    cell = [numpy.zeros(4)[1:]]
+    pool.release(cell)
+    assert pool.get('float64', (3,)) is None
+    # The least recently released shapes are dropped.
+    for shape in [(1,), (2,), (2,)]:
+        cell = [numpy.zeros(shape)]
+        pool.release(cell)
+    assert pool.get('float64', (1,)) is None
+    assert pool.get('float64', (2,)) is not None
+    assert (pool.hits, pool.misses) == (2, 4)
@@ -4,6 +4,8 @@ import sys
 import time
 import inspect
 
+from six import iteritems
+
 import theano
 from theano import config
 from theano.compat import OrderedDict
@@ -404,6 +406,155 @@ class NodeFinder(Bookkeeper):
         return all
 
 
+class TopoOrder(Feature):
+    """
+    Keep a topological order of the Apply nodes of the fgraph.
+
+    The order is updated as the graph changes: imported nodes are put at
+    the end, pruned nodes are removed, and when a node gets an input
+    computed after it, the nodes between them are reordered locally
+    (Pearce and Kelly, "A Dynamic Topological Sort Algorithm for Directed
+    Acyclic Graphs"). So getting the order does not need to traverse the
+    graph, unlike `graph.io_toposort`.
+
+    The order only follows the inputs of the nodes, not the orderings of
+    the features. FunctionGraph.toposort uses it when it is attached and
+    respects these orderings.
+
+    """
+
+    def __init__(self):
+        self.fgraph = None
+        self.order = None
+        self.position = None
+        self.holes = 0
+
+    def on_attach(self, fgraph):
+        if hasattr(fgraph, 'topo_order') or self.fgraph is not None:
+            raise AlreadyThere("TopoOrder is already present or serves"
+                               " another FunctionGraph.")
+        self.fgraph = fgraph
+        fgraph.topo_order = self
+        self.reset(graph.io_toposort(fgraph.inputs, fgraph.outputs))
+
+    def on_detach(self, fgraph):
+        if self.fgraph is not fgraph:
+            raise Exception("This TopoOrder instance was not attached to the"
+                            " provided fgraph.")
+        self.fgraph = None
+        self.order = None
+        self.position = None
+        del fgraph.topo_order
+
+    def reset(self, nodes):
+        """
+        Use `nodes`, a topological order of the fgraph, as order.
+
+        """
+        self.order = list(nodes)
+        self.position = dict((node, i) for i, node in enumerate(self.order))
+        self.holes = 0
+
+    def on_import(self, fgraph, node, reason):
+        # The inputs of node are already in the graph, and its outputs
+        # have no client yet.
+        if self.order is not None:
+            self.position[node] = len(self.order)
+            self.order.append(node)
+
+    def on_prune(self, fgraph, node, reason):
+        if self.order is not None:
+            self.order[self.position.pop(node)] = None
+            self.holes += 1
+
+    def on_change_input(self, fgraph, node, i, r, new_r, reason=None):
+        if self.order is None or node == 'output' or new_r.owner is None:
+            return
+        try:
+            lower = self.position[node]
+            upper = self.position[new_r.owner]
+            if upper < lower:
+                return
+            if upper == lower:
+                # node uses its own output.
+                self.order = None
+                return
+            # Nodes computed after node and before new_r.owner that
+            # depend on node.
+            forward = set([node])
+            stack = [node]
+            while stack:
+                for out in stack.pop().outputs:
+                    for client, _ in out.clients:
+                        if client == 'output' or client in forward:
+                            continue
+                        pos = self.position[client]
+                        if pos == upper:
+                            # new_r depends on node: there is a cycle.
+                            # The change will be reverted, so rebuild the
+                            # order the next time it is needed.
+                            self.order = None
+                            return
+                        if pos < upper:
+                            forward.add(client)
+                            stack.append(client)
+            # Nodes computed after node and before new_r.owner that
+            # new_r depends on.
+            backward = set([new_r.owner])
+            stack = [new_r.owner]
+            while stack:
+                for inp in stack.pop().inputs:
+                    owner = inp.owner
+                    if (owner is not None and owner not in backward and
+                            self.position[owner] > lower):
+                        backward.add(owner)
+                        stack.append(owner)
+        except KeyError:
+            self.order = None
+            return
+        # Reuse the positions of these nodes, putting the ancestors of
+        # new_r first.
+        moved = (sorted(backward, key=self.position.__getitem__) +
+                 sorted(forward, key=self.position.__getitem__))
+        slots = sorted(self.position[n] for n in moved)
+        for pos, n in zip(slots, moved):
+            self.order[pos] = n
+            self.position[n] = pos
+
+    def nodes(self):
+        """
+        Return a topological order of the Apply nodes of the fgraph.
+
+        Only the inputs of the nodes are taken into account, like
+        `graph.io_toposort(fgraph.inputs, fgraph.outputs)`.
+
+        """
+        if self.order is None:
+            self.reset(graph.io_toposort(self.fgraph.inputs,
+                                         self.fgraph.outputs))
+        elif self.holes:
+            self.reset([n for n in self.order if n is not None])
+        return list(self.order)
+
+    def toposort(self, orderings):
+        """
+        Return a topological order that respects `orderings` too.
+
+        `orderings` is the result of `FunctionGraph.orderings`.
+
+        """
+        order = self.nodes()
+        position = self.position
+        for node, prereqs in iteritems(orderings):
+            pos = position.get(node, -1)
+            if any(position.get(p, pos) >= pos for p in prereqs):
+                order = graph.io_toposort(self.fgraph.inputs,
+                                          self.fgraph.outputs, orderings)
+                self.reset(order)
+                break
+        return order
+
+
 class PrintListener(Feature):
 
     def __init__(self, active=True):
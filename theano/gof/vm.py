@@ -10,16 +10,24 @@ from collections import defaultdict
 import logging
 import os
 import sys
+import threading
 import time
 import warnings
+from multiprocessing.pool import ThreadPool
+
+import numpy
 
 from theano.configparser import (config, AddConfigVar,
-                                 BoolParam, ConfigParam, _config_var_list)
+                                 BoolParam, ConfigParam, EnumStr, IntParam,
+                                 _config_var_list)
 
+import theano.gof.cc
 import theano.gof.cmodule
+from theano.gof import sched
+from theano.compat import get_unbound_function, OrderedDict
 
 from six import iteritems, itervalues
-from six.moves import xrange
+from six.moves import queue, xrange
 
 logger = logging.getLogger(__name__)
 
@@ -56,13 +64,160 @@ AddConfigVar('vm.lazy',
              ConfigParam('None', filter_vm_lazy),
              in_c_key=False)
 
+AddConfigVar('vm.background_compile',
+             "Useful only for the vm linkers. If True, the nodes whose C "
+             "code is not in the cache first run their Python "
+             "implementation, while their C code is compiled in a "
+             "background thread. Each node switches to its C implementation "
+             "as soon as it is ready.",
+             BoolParam(False),
+             in_c_key=False)
+
+AddConfigVar('vm.threads',
+             "Useful only for the vm linkers. If bigger than 1, graphs "
+             "without lazy evaluation are run by the Parallel VM, that runs "
+             "the nodes that do not depend on each other at the same time "
+             "in this number of threads.",
+             IntParam(1, lambda i: i >= 1),
+             in_c_key=False)
+
+AddConfigVar('vm.schedule',
+             "Useful only for the vm linkers that are not given a schedule. "
+             "'toposort' runs the nodes in the order of fgraph.toposort(), "
+             "'memory' orders them to reduce the peak memory usage (see "
+             "theano.gof.sched.memory_schedule).",
+             EnumStr('toposort', 'memory'),
+             in_c_key=False)
+
+AddConfigVar('vm.partial_eval',
+             "Useful only for the vm linkers. If True, always use the Stack "
+             "VM, so that a call of a function with the output_subset "
+             "argument only runs the nodes needed by these outputs.",
+             BoolParam(False),
+             in_c_key=False)
+
+AddConfigVar('vm.buffer_pool',
+             "Useful only for the vm linkers. If True, graphs without lazy "
+             "evaluation are run by the LoopPool VM, that keeps the freed "
+             "ndarrays in a pool and gives them back to the nodes that "
+             "compute an output of the same dtype and shape, and the "
+             "outputs of the functions are returned without a copy, as with "
+             "borrow=True.",
+             BoolParam(False),
+             in_c_key=False)
+
+
+def _same_scalar(a, b):
+    """
+    Return True if the scalar variables `a` and `b` always have the same
+    value, i.e. if they are the same constant or the same computation.
+
+    """
+    if a is b:
+        return True
+    if isinstance(a, theano.Constant) and isinstance(b, theano.Constant):
+        return a.type == b.type and numpy.all(a.data == b.data)
+    if a.owner is None or b.owner is None:
+        return False
+    return (a.owner.op == b.owner.op and
+            a.index == b.index and
+            len(a.owner.inputs) == len(b.owner.inputs) and
+            all(_same_scalar(x, y)
+                for x, y in zip(a.owner.inputs, b.owner.inputs)))
+
+
+def same_shape(a, b, shape_of):
+    """
+    Return True if `shape_of` (see ShapeFeature) tells that the variables
+    `a` and `b` always have the same shape.
+
+    """
+    sh_a = shape_of.get(a)
+    sh_b = shape_of.get(b)
+    if sh_a is None or sh_b is None or len(sh_a) != len(sh_b):
+        return False
+    return all(_same_scalar(x, y) for x, y in zip(sh_a, sh_b))
+
+
+def static_nbytes(var, shape_of):
+    """
+    Return the size in bytes of the value of `var` if it is known at compile
+    time, else None.
+
+    """
+    shape = shape_of.get(var)
+    dtype = getattr(var.type, 'dtype', None)
+    if shape is None or dtype is None:
+        return None
+    nbytes = numpy.dtype(dtype).itemsize
+    for dim in shape:
+        if not isinstance(dim, theano.Constant):
+            return None
+        nbytes *= int(dim.data)
+    return nbytes
+
 
 def calculate_reallocate_info(order, fgraph, storage_map, compute_map_re,
-                              dependencies):
+                              dependencies, shape_of=None):
+    """
+    Find the variables whose storage can be reused by a variable computed
+    later, once they are not needed anymore.
+
+    Scalars can always be reused by a scalar of the same type. With
+    `shape_of` (the shapes inferred by the ShapeFeature of `fgraph`),
+    tensors are also reused by tensors of the same type that always have
+    the same shape. As C thunks reuse the buffer found in their output
+    storage when it has the right shape, this saves an allocation each time
+    the function is called. A view and the variable it views share a
+    buffer, so none of them is reused before all of them are dead.
+
+    Returns
+    -------
+    dict
+        Map each reused variable `ins` to [ins, out], `out` being the
+        variable that will use its storage.
+
+    """
+    if shape_of is None:
+        shape_of = {}
+
+    # The outputs that are views or inplace computations of an input
+    # already reuse a buffer.
+    aliased = set()
+    for node in order:
+        for idx_o in list(getattr(node.op, 'destroy_map', {}).keys()) + list(
+                getattr(node.op, 'view_map', {}).keys()):
+            aliased.add(node.outputs[idx_o])
+
+    def reusable(ins):
+        ndim = getattr(ins, 'ndim', None)
+        return ndim == 0 or (ndim is not None and ins in shape_of)
+
+    def can_reuse(ins, out):
+        if out in pre_allocated or ins.type != out.type or out in aliased:
+            return False
+        if getattr(out, 'ndim', None) == 0:
+            return True
+        return (out not in fgraph.outputs and
+                same_shape(ins, out, shape_of))
+
+    def is_dead(origin):
+        # The views of origin share its buffer, so it can only be reused
+        # once origin and all its views are not needed anymore, and if none
+        # of them is an output or already reused.
+        aliases = [origin] + all_views[origin]
+        return (not any(v in fgraph.outputs or v in allocated
+                        for v in aliases) and
+                all([compute_map_re[v][0]
+                     for var in aliases
+                     for v in dependencies.get(var, [])]))
+
     reallocated_info = {}
     viewed_by = {}
+    all_views = {}
     for var in fgraph.variables:
         viewed_by[var] = []
+        all_views[var] = []
     view_of = {}
     pre_allocated = set([])
     allocated = set([])
@@ -93,27 +248,28 @@ def calculate_reallocate_info(order, fgraph, storage_map, compute_map_re,
                 origin = view_of.get(ins, ins)
                 view_of[out] = origin
                 viewed_by[origin].append(out)
+                all_views[origin].append(out)
             idx_o += 1
 
         for ins in node.inputs:
             assert not (ins in view_of and viewed_by[ins])
-            if (getattr(ins, 'ndim', None) == 0 and not storage_map[ins][0] and
-                    ins not in fgraph.outputs and ins.owner and
+            if (ins.owner and reusable(ins) and
+                    storage_map[ins][0] is None and
+                    ins not in fgraph.outputs and
                     all([compute_map_re[v][0]
                          for v in dependencies.get(ins, [])]) and
                     ins not in allocated):
                 # Constant Memory cannot be changed
                 # Constant and shared variables' storage_map value is not empty
                 reuse_out = None
-                if ins not in view_of and not viewed_by.get(ins, []):
+                if (ins not in view_of and not viewed_by.get(ins, []) and
+                        is_dead(ins)):
                     # where gc
                     for i in range(idx + 1, len(order)):
                         if reuse_out is not None:
                             break
                         for out in order[i].outputs:
-                            if (getattr(out, 'ndim', None) == 0 and
-                                    out not in pre_allocated and
-                                    ins.type == out.type):
+                            if can_reuse(ins, out):
                                 reuse_out = out
                                 pre_allocated.add(out)
                                 allocated.add(ins)
@@ -124,15 +280,14 @@ def calculate_reallocate_info(order, fgraph, storage_map, compute_map_re,
                         viewed_by[origin].remove(ins)
                     if (not viewed_by[origin] and
                             origin not in fgraph.inputs and
-                            not isinstance(origin, theano.Constant)):
+                            not isinstance(origin, theano.Constant) and
+                            is_dead(origin)):
                         # where gc
                         for i in range(idx + 1, len(order)):
                             if reuse_out is not None:
                                 break
                             for out in order[i].outputs:
-                                if (getattr(out, 'ndim', None) == 0 and
-                                        out not in pre_allocated and
-                                        ins.type == out.type):
+                                if can_reuse(ins, out):
                                     reuse_out = out
                                     pre_allocated.add(out)
                                     allocated.add(ins)
@@ -143,6 +298,18 @@ def calculate_reallocate_info(order, fgraph, storage_map, compute_map_re,
     return reallocated_info
 
 
+def may_make_lazy_thunk(node):
+    """
+    Return True if the thunk of `node` may be lazy, i.e. its Op does not use
+    the default `make_thunk`.
+
+    """
+    make_thunk = getattr(type(node.op), 'make_thunk', None)
+    return make_thunk is None or get_unbound_function(make_thunk) not in (
+        get_unbound_function(theano.gof.op.Op.make_thunk),
+        get_unbound_function(theano.gof.op.OpenMPOp.make_thunk))
+
+
 class VM(object):
     """
     A VM object's __call__ method evaluates a Theano program.
@@ -180,9 +347,21 @@ class VM(object):
         True indicates that Function.__call__ must implement the feedback from
         output storage to input storage. False means it *must not* repeat that
         feedback.
+    partial_eval : bool
+        True if __call__ accepts an `output_subset` argument, the list of the
+        indices in fgraph.outputs of the outputs to compute, and only runs
+        the nodes they depend on.
+    trace
+        None, or a deque where an event in the Chrome trace format is
+        appended for each thunk call timed (see
+        config.profiling.trace_size).
 
     """
 
+    trace = None
+    _trace_names = None
+    partial_eval = False
+
     def __init__(self, nodes, thunks, pre_call_clear):
 
         if len(nodes) != len(thunks):
@@ -220,6 +399,29 @@ class VM(object):
         """
         raise NotImplementedError('override me')
 
+    def trace_thunk(self, idx, t0, t1):
+        """
+        Append to self.trace the event of the call to thunks[idx] that ran
+        from `t0` to `t1`.
+
+        """
+        if self._trace_names is None:
+            self._trace_names = [str(node) for node in self.nodes]
+        thunk = self.thunks[idx]
+        shapes = [list(getattr(s[0], 'shape', ()))
+                  for s in getattr(thunk, 'inputs', [])]
+        nbytes = sum(getattr(s[0], 'nbytes', 0)
+                     for s in getattr(thunk, 'outputs', []))
+        self.trace.append({
+            'name': self._trace_names[idx],
+            'cat': 'thunk',
+            'ph': 'X',
+            'ts': t0 * 1e6,
+            'dur': (t1 - t0) * 1e6,
+            'pid': os.getpid(),
+            'tid': threading.current_thread().ident,
+            'args': {'input_shapes': shapes, 'output_bytes': int(nbytes)}})
+
     def update_profile(self, profile):
         # accumulate into the profile object
         for node, thunk, t, c in zip(self.nodes, self.thunks,
@@ -232,6 +434,9 @@ class VM(object):
 
             profile.apply_cimpl[node] = hasattr(thunk, 'cthunk')
 
+        if hasattr(self, 'background_compiler'):
+            profile.apply_swap.update(self.background_compiler.status)
+
         if hasattr(self, 'variable_shape'):
             profile.variable_shape = self.variable_shape.copy()
             profile.variable_strides = self.variable_strides.copy()
@@ -272,6 +477,8 @@ class Loop(VM):
                     t1 = time.time()
                     self.call_counts[i] += 1
                     self.call_times[i] += t1 - t0
+                    if self.trace is not None:
+                        self.trace_thunk(i, t0, t1)
             except:
                 link.raise_with_op(node, thunk)
         else:
@@ -313,6 +520,8 @@ class LoopGC(VM):
                     t1 = time.time()
                     self.call_counts[i] += 1
                     self.call_times[i] += t1 - t0
+                    if self.trace is not None:
+                        self.trace_thunk(i, t0, t1)
                     for old_s in old_storage:
                         old_s[0] = None
                     i += 1
@@ -331,6 +540,146 @@ class LoopGC(VM):
                 link.raise_with_op(node, thunk)
 
 
+class BufferPool(object):
+    """
+    Free ndarrays, by dtype and shape, that can be given to the thunks.
+
+    Parameters
+    ----------
+    max_buffers
+        Maximum number of ndarrays kept. When it is exceeded, the ndarrays
+        of the least recently released (dtype, shape) are dropped.
+
+    Attributes
+    ----------
+    hits
+        Number of `get` calls that returned an ndarray.
+    misses
+        Number of `get` calls that found none.
+
+    """
+
+    def __init__(self, max_buffers):
+        self.max_buffers = max_buffers
+        self.buffers = OrderedDict()  # (dtype, shape) -> list of ndarrays
+        self.n_buffers = 0
+        self.hits = 0
+        self.misses = 0
+
+    def release(self, cell):
+        """
+        Empty the storage `cell`, keeping its ndarray if nothing else uses it.
+
+        """
+        value = cell[0]
+        cell[0] = None
+        # Views have a base, and an ndarray returned to the user, used by
+        # another storage cell or viewed by another ndarray has other
+        # references than `value` and the argument of getrefcount.
+        if (type(value) is not numpy.ndarray or
+                not value.flags.owndata or
+                sys.getrefcount(value) > 2):
+            return
+        key = (str(value.dtype), value.shape)
+        buffers = self.buffers.pop(key, [])
+        buffers.append(value)
+        self.buffers[key] = buffers
+        self.n_buffers += 1
+        while self.n_buffers > self.max_buffers:
+            _, dropped = self.buffers.popitem(last=False)
+            self.n_buffers -= len(dropped)
+
+    def get(self, dtype, shape):
+        """
+        Return a free ndarray of this dtype and shape, or None.
+
+        """
+        buffers = self.buffers.get((dtype, shape))
+        if buffers:
+            self.hits += 1
+            self.n_buffers -= 1
+            return buffers.pop()
+        self.misses += 1
+        return None
+
+
+class LoopPool(VM):
+    """
+    Unconditional start-to-finish program execution in Python, that
+    recycles the ndarrays of the intermediate results.
+
+    The ndarrays freed after each thunk go to a `BufferPool`. Before a node
+    runs, each empty output storage cell listed in `pre_thunk_fill` gets an
+    ndarray from the pool with the dtype of the output and the shape it had
+    at the previous call. C thunks compute their output in the ndarray
+    they find in its storage when it has the right shape, so once the
+    shapes are stable no ndarray is allocated.
+
+    Parameters
+    ----------
+    post_thunk_clear
+        For each thunk, the storage cells to release after it ran.
+    pre_thunk_fill
+        For each thunk, a list of [storage cell, dtype] of the outputs that
+        can receive an ndarray from the pool.
+    pool
+        The `BufferPool`.
+
+    """
+
+    def __init__(self, nodes, thunks, pre_call_clear, post_thunk_clear,
+                 pre_thunk_fill, pool):
+        super(LoopPool, self).__init__(nodes, thunks, pre_call_clear)
+        self.post_thunk_clear = post_thunk_clear
+        # The shape of each output at the last call is appended to its entry
+        self.pre_thunk_fill = [[fill + [None] for fill in node_fill]
+                               for node_fill in pre_thunk_fill]
+        self.pool = pool
+        # Some other part of Theano query that information
+        self.allow_gc = True
+        if not (len(nodes) == len(thunks) == len(post_thunk_clear) ==
+                len(pre_thunk_fill)):
+            raise ValueError()
+
+    def __call__(self):
+        pool = self.pool
+        for cont in self.pre_call_clear:
+            pool.release(cont)
+        try:
+            i = 0
+            for thunk, node, fill, old_storage in zip(self.thunks,
+                                                      self.nodes,
+                                                      self.pre_thunk_fill,
+                                                      self.post_thunk_clear):
+                for out in fill:
+                    if out[0][0] is None and out[2] is not None:
+                        out[0][0] = pool.get(out[1], out[2])
+                if self.time_thunks:
+                    t0 = time.time()
+                    thunk()
+                    t1 = time.time()
+                    self.call_counts[i] += 1
+                    self.call_times[i] += t1 - t0
+                    if self.trace is not None:
+                        self.trace_thunk(i, t0, t1)
+                else:
+                    thunk()
+                for out in fill:
+                    out[2] = getattr(out[0][0], 'shape', None)
+                for old_s in old_storage:
+                    pool.release(old_s)
+                i += 1
+        except:
+            link.raise_with_op(node, thunk)
+
+    def update_profile(self, profile):
+        super(LoopPool, self).update_profile(profile)
+        profile.buffer_pool_hits += self.pool.hits
+        profile.buffer_pool_misses += self.pool.misses
+        self.pool.hits = 0
+        self.pool.misses = 0
+
+
 class Stack(VM):
     """
     Finish-to-start evalution order of thunks.
@@ -355,8 +704,14 @@ class Stack(VM):
     The actual logic is more complex to support intermediate
     garbage collection, lazily-evaluated nodes, and better speed.
 
+    When called with `output_subset`, only the outputs of that list are
+    recursively evaluated, so the nodes that only the other outputs depend
+    on are not run.
+
     """
 
+    partial_eval = True
+
     def __init__(self, nodes, thunks, pre_call_clear,
                  storage_map, compute_map, fgraph, allow_gc,
                  dependencies=None, callback=None):
@@ -419,6 +774,8 @@ class Stack(VM):
         # Profile output looks buggy if a node has run but takes 0 time.
         # (and profile code might hide real bugs if it rounds up 0)
         dt = max(time.time() - t0, 1e-10)
+        if self.trace is not None:
+            self.trace_thunk(idx, t0, t0 + dt)
         if self.callback is not None:
             self.callback(
                 node=node,
@@ -428,7 +785,7 @@ class Stack(VM):
             )
         return rval, dt
 
-    def __call__(self):
+    def __call__(self, output_subset=None):
         storage_map = self.storage_map
         compute_map = self.compute_map
         thunks = self.thunks
@@ -440,7 +797,11 @@ class Stack(VM):
             compute_map[k][0] = (k.owner is None)
 
         # apply_stack contains nodes
-        apply_stack = list(self.base_apply_stack)
+        if output_subset is None:
+            apply_stack = list(self.base_apply_stack)
+        else:
+            apply_stack = [self.outputs[i].owner for i in output_subset
+                           if self.outputs[i].owner]
         last_apply_stack_len = -1
 
         # This record all function inputs/shared varibles and constants
@@ -668,6 +1029,157 @@ class Stack(VM):
         self.node_cleared_order.append(final_index)
 
 
+# The thread pools of the Parallel VM, by number of threads.
+_thread_pools = {}
+_thread_pools_lock = threading.Lock()
+_worker_state = threading.local()
+
+
+def _get_thread_pool(n_threads):
+    with _thread_pools_lock:
+        if n_threads not in _thread_pools:
+            _thread_pools[n_threads] = ThreadPool(n_threads)
+        return _thread_pools[n_threads]
+
+
+class Parallel(VM):
+    """
+    Run the thunks that do not depend on each other at the same time, in a
+    pool of threads.
+
+    A node is run as soon as the nodes that compute its inputs, and the
+    nodes that must run before it because of destroy_map (see
+    `FunctionGraph.orderings`), are done. The calling thread only schedules
+    the nodes. Python thunks hold the GIL, so only the thunks that release
+    it (e.g. BLAS calls or big numpy operations) really run concurrently.
+
+    Lazy thunks are not supported.
+
+    If the function is called from a thread of the pool (e.g. by the thunk
+    of an Op with an inner function), the nodes are run sequentially in the
+    calling thread, as waiting for the pool could deadlock.
+
+    Parameters
+    ----------
+    nodes
+        A list of nodes in toposort order.
+    thunks
+        A list of thunks to execute those nodes, in toposort order.
+    pre_call_clear
+        A list of containers to empty at the beginning of each call.
+    fgraph
+        The FunctionGraph of the nodes.
+    allow_gc
+        If True, the intermediate results are freed as soon as all the nodes
+        that use them are done.
+    n_threads
+        The number of threads that run the thunks.
+
+    """
+
+    def __init__(self, nodes, thunks, pre_call_clear, fgraph, allow_gc,
+                 n_threads):
+        super(Parallel, self).__init__(nodes, thunks, pre_call_clear)
+        if any(thunk.lazy for thunk in thunks):
+            raise ValueError('The Parallel VM does not support lazy thunks.')
+        self.allow_gc = allow_gc
+        self.n_threads = n_threads
+        node_idx = dict((node, i) for i, node in enumerate(nodes))
+        ords = fgraph.orderings()
+
+        # Dependencies between the nodes.
+        self.successors = [[] for node in nodes]
+        self.n_prereqs = [0] * len(nodes)
+        for i, node in enumerate(nodes):
+            prereqs = set(inp.owner for inp in node.inputs if inp.owner)
+            prereqs.update(ords.get(node, []))
+            for prereq in prereqs:
+                self.successors[node_idx[prereq]].append(i)
+            self.n_prereqs[i] = len(prereqs)
+        self.roots = [i for i, n in enumerate(self.n_prereqs) if n == 0]
+
+        # For the garbage collection: the intermediate results used by each
+        # node, and the number of nodes that use them.
+        self.gc_inputs = [[] for node in nodes]
+        self.n_users = {}
+        if allow_gc:
+            outputs = set(fgraph.outputs)
+            for i, node in enumerate(nodes):
+                for var in set(node.inputs):
+                    if var.owner is None or var in outputs:
+                        continue
+                    self.gc_inputs[i].append(var)
+                    self.n_users[var] = self.n_users.get(var, 0) + 1
+
+    def run_thunk(self, i):
+        """
+        Run thunks[i], and return i and the exception info if it failed.
+
+        """
+        _worker_state.in_pool = True
+        thunk = self.thunks[i]
+        try:
+            if self.time_thunks:
+                t0 = time.time()
+                thunk()
+                t1 = time.time()
+                self.call_counts[i] += 1
+                self.call_times[i] += t1 - t0
+                if self.trace is not None:
+                    self.trace_thunk(i, t0, t1)
+            else:
+                thunk()
+        except BaseException:
+            # Also KeyboardInterrupt and SystemExit: if the pool task died,
+            # __call__ would wait for it forever.
+            return i, sys.exc_info()
+        return i, None
+
+    def __call__(self):
+        for cont in self.pre_call_clear:
+            cont[0] = None
+        storage_map = self.storage_map
+        n_prereqs = list(self.n_prereqs)
+        n_users = dict(self.n_users)
+        done = queue.Queue()
+        if getattr(_worker_state, 'in_pool', False):
+            def submit(i):
+                done.put(self.run_thunk(i))
+        else:
+            pool = _get_thread_pool(self.n_threads)
+
+            def submit(i):
+                pool.apply_async(self.run_thunk, (i,), callback=done.put)
+
+        n_running = 0
+        error = None
+        for i in self.roots:
+            submit(i)
+            n_running += 1
+        while n_running:
+            i, exc_info = done.get()
+            n_running -= 1
+            if error is not None:
+                # Wait for the running thunks before raising the error.
+                continue
+            if exc_info is not None:
+                error = i, exc_info
+                continue
+            for var in self.gc_inputs[i]:
+                n_users[var] -= 1
+                if not n_users[var]:
+                    storage_map[var][0] = None
+            for j in self.successors[i]:
+                n_prereqs[j] -= 1
+                if not n_prereqs[j]:
+                    submit(j)
+                    n_running += 1
+        if error is not None:
+            i, exc_info = error
+            link.raise_with_op(self.nodes[i], self.thunks[i], exc_info,
+                               storage_map=storage_map)
+
+
 try:
     from . import lazylinker_c
 
@@ -688,6 +1200,108 @@ except (OSError, theano.gof.cmodule.MissingGXX) as e:
     pass
 
 
+_compile_queue = None
+_compile_queue_lock = threading.Lock()
+
+
+def _compile_worker(jobs):
+    while True:
+        jobs.get().run()
+
+
+class BackgroundCompiler(object):
+    """
+    Make the C thunks of some nodes of a VM in a background thread.
+
+    The VM starts with the Python thunks of these nodes. Each one is
+    replaced in the list of thunks of the VM as soon as its C thunk is
+    ready, so the following calls use it. All the VMs share the same
+    thread, and their nodes are compiled in order.
+
+    Parameters
+    ----------
+    nodes
+        The nodes of the VM, in toposort order.
+    thunks
+        The thunks of the VM. This list is modified in place.
+    indices
+        Indices in `nodes` of the nodes whose C thunk must be made.
+    storage_map
+        The storage map used to make the Python thunks.
+    compute_map
+    no_recycling
+        As for `Op.make_thunk`.
+
+    Attributes
+    ----------
+    status
+        Dict mapping each of those nodes to 'pending', 'c' once it runs its
+        C thunk, or 'python' if it has no C code or its compilation failed.
+
+    """
+
+    def __init__(self, nodes, thunks, indices, storage_map, compute_map,
+                 no_recycling):
+        self.nodes = nodes
+        self.thunks = thunks
+        self.indices = indices
+        self.storage_map = storage_map
+        self.compute_map = compute_map
+        self.no_recycling = no_recycling
+        self.status = dict((nodes[i], 'pending') for i in indices)
+        self.done = threading.Event()
+
+    def start(self):
+        global _compile_queue
+        with _compile_queue_lock:
+            if _compile_queue is None:
+                _compile_queue = queue.Queue()
+                worker = threading.Thread(target=_compile_worker,
+                                          args=(_compile_queue,),
+                                          name='theano_background_compile')
+                worker.daemon = True
+                worker.start()
+        _compile_queue.put(self)
+
+    def run(self):
+        for i in self.indices:
+            node = self.nodes[i]
+            try:
+                thunk = node.op.make_thunk(node, self.storage_map,
+                                           self.compute_map,
+                                           self.no_recycling)
+            except Exception:
+                logger.warning('Background compilation of %s failed, it '
+                               'will keep its Python implementation.', node,
+                               exc_info=True)
+                self.status[node] = 'python'
+                continue
+            if not hasattr(thunk, 'cthunk'):
+                self.status[node] = 'python'
+                continue
+            thunk.inputs = self.thunks[i].inputs
+            thunk.outputs = self.thunks[i].outputs
+            thunk.lazy = False
+            # Replacing a list element is atomic, so a VM running at the
+            # same time calls either the old or the new thunk.
+            self.thunks[i] = thunk
+            self.status[node] = 'c'
+        self.done.set()
+
+    def wait(self, timeout=None):
+        """
+        Wait until all the C thunks are made.
+
+        Returns
+        -------
+        bool
+            False if `timeout` (in seconds) expired before.
+
+        """
+        self.done.wait(timeout)
+        return self.done.is_set()
+
+
 class VM_Linker(link.LocalLinker):
     """
     Class that satisfies the Linker interface by acting as a VM factory.
@@ -711,28 +1325,75 @@ class VM_Linker(link.LocalLinker):
         detect if lazy evaluation is needed and use the apropriate
         version. If lazy is True or False, we force the version used
         between Loop/LoopGC and Stack.
+    schedule
+        A function that takes a FunctionGraph and returns its Apply nodes in
+        the order to run them, e.g. `theano.gof.sched.memory_schedule`. If
+        None, the order depends on the Theano flag vm.schedule.
     c_thunks
         If None or True, don't change the default. If False,
         don't compile c code for the thunks.
+    background_compile
+        If True, don't wait for the compilation of the C code of the
+        nodes: they run their Python implementation until it is ready (see
+        `BackgroundCompiler`). If None use as default the value of the
+        Theano flag vm.background_compile.
+    n_threads
+        If bigger than 1, graphs without lazy evaluation are run by the
+        `Parallel` VM with this number of threads, instead of the CVM or the
+        Loop VMs. If None use as default the value of the Theano flag
+        vm.threads.
+    allow_partial_eval
+        If True, always use the Stack VM, so that a call of the function
+        can compute only some of its outputs (see the `output_subset`
+        argument of `Function.__call__`). The other VMs compute all the
+        outputs. If None use as default the value of the Theano flag
+        vm.partial_eval.
+    buffer_pool
+        If True, graphs without lazy evaluation are run by the `LoopPool`
+        VM instead of the CVM or the Loop VMs: the freed ndarrays are reused
+        for the outputs of the same dtype and shape of the next nodes and
+        calls. The functions then return their outputs without copying
+        them, as if they were all ``Out(variable, borrow=True)``, so the
+        next call can overwrite them. If None use as default the value of
+        the Theano flag vm.buffer_pool.
 
     """
 
     def __init__(self, allow_gc=None, use_cloop=False, callback=None,
-                 lazy=None, schedule=None, c_thunks=None):
+                 lazy=None, schedule=None, c_thunks=None,
+                 background_compile=None, n_threads=None,
+                 allow_partial_eval=None, buffer_pool=None):
         # Note: if more parameters are added to __init__, make sure to forward
         # them in the "type(self)(...)" call in the "accept" method below.
         if allow_gc is None:
             allow_gc = config.allow_gc
+        if background_compile is None:
+            background_compile = config.vm.background_compile
+        if n_threads is None:
+            n_threads = config.vm.threads
+        if allow_partial_eval is None:
+            allow_partial_eval = config.vm.partial_eval
+        if buffer_pool is None:
+            buffer_pool = config.vm.buffer_pool
         self.fgraph = None
         self.allow_gc = allow_gc
         self.use_cloop = use_cloop
         self.callback = callback
         self.lazy = lazy
         self.c_thunks = c_thunks
+        self.background_compile = background_compile
+        self.n_threads = n_threads
+        self.allow_partial_eval = allow_partial_eval
+        self.buffer_pool = buffer_pool
         self.updated_vars = {}
         if schedule:
             self.schedule = schedule
 
+    def schedule(self, fgraph):
+        if config.vm.schedule == 'memory':
+            return sched.memory_schedule(fgraph)
+        return fgraph.toposort()
+
     def accept(self, fgraph, no_recycling=None):
         """
 
@@ -776,6 +1437,10 @@ class VM_Linker(link.LocalLinker):
                 lazy=self.lazy,
                 schedule=self.schedule,
                 c_thunks=self.c_thunks,
+                background_compile=self.background_compile,
+                n_threads=self.n_threads,
+                allow_partial_eval=self.allow_partial_eval,
+                buffer_pool=self.buffer_pool,
             ).accept(fgraph, no_recycling)
         self.fgraph = fgraph
         self.no_recycling = no_recycling
@@ -842,14 +1507,25 @@ class VM_Linker(link.LocalLinker):
 
         pre_call_clear = [storage_map[v] for v in self.no_recycling]
 
+        lazy = self.lazy
+        if lazy is None:
+            lazy = config.vm.lazy
+        if lazy is None:
+            lazy = not all([(not th.lazy) for th in thunks])
+        trace = getattr(self.fgraph.profile, 'trace_events', None)
         if (self.callback is not None or
-                (config.profile and config.profile_memory)):
+                (config.profile and config.profile_memory) or
+                trace is not None or self.allow_partial_eval):
 
             if self.use_cloop and self.callback is not None:
                 logger.warn('CVM does not support callback, using Stack VM.')
             if self.use_cloop and config.profile_memory:
                 warnings.warn(
                     'CVM does not support memory profile, using Stack VM.')
+            elif self.use_cloop and trace is not None:
+                warnings.warn(
+                    'CVM does not support the profiling trace, using Stack '
+                    'VM.')
             # Needed for allow_gc=True, profiling and storage_map reuse
             deps = self.compute_gc_dependencies(storage_map)
             vm = Stack(
@@ -858,6 +1534,27 @@ class VM_Linker(link.LocalLinker):
                 self.fgraph, self.allow_gc,
                 dependencies=deps,
                 callback=self.callback)
+        elif (self.buffer_pool and not lazy and
+              not any(th.lazy for th in thunks)):
+            pre_thunk_fill = []
+            for node in nodes:
+                # The outputs that are views or destroy an input do not
+                # need an ndarray, nor do the ones that must be allocated
+                # at each call.
+                aliased = set(getattr(node.op, 'view_map', {}))
+                aliased.update(getattr(node.op, 'destroy_map', {}))
+                pre_thunk_fill.append([
+                    [storage_map[o], o.type.dtype]
+                    for i, o in enumerate(node.outputs)
+                    if (i not in aliased and
+                        isinstance(o.type, theano.tensor.TensorType) and
+                        o not in self.no_recycling)])
+            vm = LoopPool(nodes, thunks, pre_call_clear, post_thunk_clear,
+                          pre_thunk_fill, BufferPool(len(storage_map)))
+        elif (self.n_threads > 1 and not lazy and
+              not any(th.lazy for th in thunks)):
+            vm = Parallel(nodes, thunks, pre_call_clear, self.fgraph,
+                          self.allow_gc, self.n_threads)
         elif self.use_cloop:
             # create a map from nodes to ints and vars to ints
             nodes_idx = {}
@@ -968,11 +1665,6 @@ class VM_Linker(link.LocalLinker):
             )
             assert c0 == sys.getrefcount(node_n_inputs)
         else:
-            lazy = self.lazy
-            if lazy is None:
-                lazy = config.vm.lazy
-            if lazy is None:
-                lazy = not all([(not th.lazy) for th in thunks])
             if not lazy:
                 # there is no conditional in the graph
                 if self.allow_gc:
@@ -999,6 +1691,29 @@ class VM_Linker(link.LocalLinker):
                 )
         return vm
 
+    def compile_in_background(self, node, no_recycling):
+        """
+        Return True if the C thunk of `node` should be made in background.
+
+        This is the case if its Op has a Python implementation and its C
+        module is not in the cache yet. Return None if the key of its C
+        module can not be computed: the Python implementation is then used,
+        without trying to compile the C code.
+
+        """
+        if not theano.gof.cc.uses_default_c_thunk(node):
+            return False
+        if (get_unbound_function(type(node.op).perform) is
+                get_unbound_function(theano.gof.op.PureOp.perform)):
+            return False
+        try:
+            key = node.op.c_linker(node, no_recycling).cmodule_key()
+        except Exception as e:
+            logger.debug('Using the Python implementation of %s, the key '
+                         'of its C module can not be computed: %s', node, e)
+            return None
+        return key not in theano.gof.cc.get_module_cache().entry_from_key
+
     def make_all(self, profiler=None, input_storage=None,
                  output_storage=None, storage_map=None,
                  ):
@@ -1024,17 +1739,61 @@ class VM_Linker(link.LocalLinker):
         else:
             dependencies = self.compute_gc_dependencies(storage_map)
 
+        shape_feature = getattr(fgraph, 'shape_feature', None)
+        shape_of = shape_feature.shape_of if shape_feature else {}
         reallocated_info = calculate_reallocate_info(
-            order, fgraph, storage_map, compute_map_re, dependencies)
+            order, fgraph, storage_map, compute_map_re, dependencies,
+            shape_of=shape_of)
+
+        lazy = self.lazy
+        if lazy is None:
+            lazy = config.vm.lazy
+        # The Parallel VM does not run the nodes in order, nor does the Stack
+        # VM when it computes a subset of the outputs, so the storage of a
+        # variable can not be reused by another one. The thunks must be made
+        # with the shared storage, so whether they are lazy is guessed from
+        # their Op.
+        if (lazy or (lazy is None and any(may_make_lazy_thunk(node)
+                                          for node in order)) or
+                (config.profile and config.profile_memory) or
+                self.use_cloop or self.callback or self.n_threads > 1 or
+                self.allow_partial_eval):
+            reallocated_info = {}
+        for ins, out in itervalues(reallocated_info):
+            storage_map[out] = storage_map[ins]
+        if reallocated_info and fgraph.profile:
+            fgraph.profile.reallocated_buffers += len(reallocated_info)
+            fgraph.profile.reallocated_bytes += sum(
+                static_nbytes(out, shape_of) or 0
+                for ins, out in itervalues(reallocated_info))
+
+        background = (self.background_compile and
+                      self.c_thunks is not False and config.cxx)
+        background_indices = []
+        if self.c_thunks is not False and not background:
+            # Compile the missing C modules in parallel, if enabled.
+            theano.gof.cc.precompile_nodes(order, no_recycling)
 
         for node in order:
             try:
                 if self.c_thunks is False:
                     node.op._op_use_c_code = False
-                thunks.append(node.op.make_thunk(node,
-                                                 storage_map,
-                                                 compute_map,
-                                                 no_recycling))
+                in_background = False
+                if background:
+                    in_background = self.compile_in_background(node,
+                                                               no_recycling)
+                if in_background is not False:
+                    if in_background:
+                        background_indices.append(len(thunks))
+                    thunks.append(node.op.make_py_thunk(node,
+                                                        storage_map,
+                                                        compute_map,
+                                                        no_recycling))
+                else:
+                    thunks.append(node.op.make_thunk(node,
+                                                     storage_map,
+                                                     compute_map,
+                                                     no_recycling))
                 if not hasattr(thunks[-1], 'lazy'):
                     # We don't want all ops maker to think about lazy Ops.
                     # So if they didn't specify that its lazy or not, it isn't.
@@ -1047,28 +1806,31 @@ class VM_Linker(link.LocalLinker):
         for node, thunk in zip(order, thunks):
             thunk.inputs = [storage_map[v] for v in node.inputs]
             thunk.outputs = [storage_map[v] for v in node.outputs]
+        if background_indices:
+            # The C thunks use the same storage as the Python ones.
+            background_compiler = BackgroundCompiler(
+                order, thunks, background_indices, dict(storage_map),
+                compute_map, no_recycling)
+        else:
+            background_compiler = None
 
-        lazy = self.lazy
-        if lazy is None:
-            lazy = config.vm.lazy
         if lazy is None:
             lazy = not all([(not th.lazy) for th in thunks])
-        if not (lazy or (config.profile and config.profile_memory) or
-                self.use_cloop or self.callback):
-            for pair in itervalues(reallocated_info):
-                storage_map[pair[1]] = storage_map[pair[0]]
+        assert not (lazy and reallocated_info)
 
         computed, last_user = link.gc_helper(order)
-        if self.allow_gc:
+        if self.allow_gc or self.buffer_pool:
             post_thunk_clear = []
-            for node in order:
+            for node, thunk in zip(order, thunks):
                 clear_after_this_thunk = []
-                for input in node.inputs:
+                # The storage of a reused variable is cleared after the last
+                # use of the variable that reuses it.
+                for input, cell in zip(node.inputs, thunk.inputs):
                     if (input in computed and
                             input not in fgraph.outputs and
                             node == last_user[input] and
                             input not in reallocated_info):
-                        clear_after_this_thunk.append(storage_map[input])
+                        clear_after_this_thunk.append(cell)
                 post_thunk_clear.append(clear_after_this_thunk)
         else:
             post_thunk_clear = None
@@ -1082,6 +1844,9 @@ class VM_Linker(link.LocalLinker):
                           )
 
         vm.storage_map = storage_map
+        if background_compiler is not None:
+            vm.background_compiler = background_compiler
+            background_compiler.start()
 
         return (vm,
                 [link.Container(input, storage)
@@ -1095,3 +1860,11 @@ class VM_Linker(link.LocalLinker):
         self.__dict__.update(d)
         if not hasattr(self, 'c_thunks'):
             self.c_thunks = True
+        if not hasattr(self, 'background_compile'):
+            self.background_compile = False
+        if not hasattr(self, 'n_threads'):
+            self.n_threads = 1
+        if not hasattr(self, 'allow_partial_eval'):
+            self.allow_partial_eval = False
+        if not hasattr(self, 'buffer_pool'):
+            self.buffer_pool = False
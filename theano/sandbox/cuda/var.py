@@ -148,6 +148,7 @@ class CudaNdarraySharedVariable(_operators, SharedVariable):
                 # in case this is a cuda_ndarray, we copy it
                 value = copy.deepcopy(value)
         self.container.value = value  # this will copy a numpy ndarray
+        theano.compile.sharedvalue.shared_values_changed()
 
     def __getitem__(self, *args):
         # Defined to explicitly use the implementation from `_operators`, since
@@ -371,6 +371,7 @@ class GpuArraySharedVariable(_operators, SharedVariable):
         if isinstance(value, pygpu.gpuarray.GpuArray):
             value = pygpu.gpuarray.array(value, copy=(not borrow))
         self.container.value = value
+        theano.compile.sharedvalue.shared_values_changed()
 
     def __getitem__(self, *args):
         return _operators.__getitem__(self, *args)
@@ -929,6 +929,18 @@ class ScalarOp(Op):
     def c_code_cache_version(self):
         return (4,)
 
+    def c_nogil(self, node):
+        """
+        Return True if the C code of this op does not use the Python C-API
+        (including 'fail'). Elemwise and CAReduce release the GIL around
+        their loops only when this is True.
+
+        This is the case for the classes of `nogil_scalar_ops`, but not for
+        their subclasses: other ops must override this method to declare it.
+
+        """
+        return type(self) in nogil_scalar_ops
+
     def c_code_contiguous(self, node, name, inp, out, sub):
         """
         This function is called by Elemwise when all inputs and outputs are
@@ -3581,6 +3593,10 @@ class Composite(ScalarOp):
 
         return self._c_code % d
 
+    def c_nogil(self, node):
+        return all(subnode.op.c_nogil(subnode)
+                   for subnode in self.fgraph.toposort())
+
     def c_code_cache_version(self):
         rval = [3]
         for x in self.fgraph.toposort():
@@ -3657,3 +3673,11 @@ class Composite(ScalarOp):
         self.init_fgraph()
         self.init_py_impls()
         assert self._c_code
+
+
+# The scalar ops of this module whose C code does not use the Python C-API
+# (see ScalarOp.c_nogil). Composite declares it from its inner ops.
+nogil_scalar_ops = set(
+    cls for cls in list(globals().values())
+    if (isinstance(cls, type) and issubclass(cls, ScalarOp) and
+        cls.__module__ == __name__ and cls is not Composite))
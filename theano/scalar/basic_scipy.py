@@ -5,7 +5,7 @@ import numpy
 import theano
 from theano.scalar.basic import (UnaryScalarOp, BinaryScalarOp,
                                  exp, upgrade_to_float,
-                                 float_types)
+                                 float_types, nogil_scalar_ops)
 from theano.scalar.basic import (upgrade_to_float_no_complex,
                                  complex_types, discrete_types,
                                  upcast)
@@ -394,3 +394,6 @@ class Chi2SF(BinaryScalarOp):
         return hash(type(self))
 
 chi2sf = Chi2SF(upgrade_to_float, name='chi2sf')
+
+# The C code of Chi2SF comes from another package.
+nogil_scalar_ops.update([Erf, Erfc, Gamma, GammaLn, Psi])
@@ -380,6 +380,22 @@ class test_div(unittest.TestCase):
         assert isinstance((a/c).owner.op, TrueDiv)
 
 
+def test_c_nogil():
+    x, y, z = inputs()
+    # The GIL is released only for the scalar ops that declare it.
+    assert exp.c_nogil(exp.make_node(x))
+
+    class MyExp(theano.scalar.basic.Exp):
+        pass
+    my_exp = MyExp(theano.scalar.basic.upgrade_to_float, name='my_exp')
+    assert not my_exp.c_nogil(my_exp.make_node(x))
+
+    C = Composite([x, y], [add(exp(x), y)])
+    assert C.c_nogil(C.make_node(x, y))
+    C = Composite([x, y], [add(my_exp(x), y)])
+    assert not C.c_nogil(C.make_node(x, y))
+
+
 def test_grad_gt():
     x = float32(name='x')
     y = float32(name='y')
@@ -836,6 +836,8 @@ class GemmRelated(Op):
                 int Nz0 = Nz[0], Nz1 = Nz[1], Nx1 = Nx[1];
                 //std::cerr << (unit/256) MOD 16 << (unit / 16) MOD 16 << unit MOD 16<< '\\n';
                 //double t0 = time_time();
+                int unit_ok = 1;
+                %(begin_nogil)s
                 switch(unit)
                 {
                     case 0x000: sgemm_(&N, &N, &Nz1, &Nz0, &Nx1, &a, y, &sy_0, x, &sx_0, &b, z, &sz_0); break;
@@ -846,8 +848,14 @@ class GemmRelated(Op):
                     case 0x101: sgemm_(&N, &T, &Nz0, &Nz1, &Nx1, &a, x, &sx_1, y, &sy_0, &b, z, &sz_1); break;
                     case 0x011: sgemm_(&T, &N, &Nz0, &Nz1, &Nx1, &a, x, &sx_0, y, &sy_1, &b, z, &sz_1); break;
                     case 0x111: sgemm_(&N, &N, &Nz0, &Nz1, &Nx1, &a, x, &sx_1, y, &sy_1, &b, z, &sz_1); break;
-                    default: PyErr_SetString(PyExc_ValueError, "some matrix has no unit stride"); %(fail)s;
+                    default: unit_ok = 0;
                 };
+                %(end_nogil)s
+                if (!unit_ok)
+                {
+                    PyErr_SetString(PyExc_ValueError, "some matrix has no unit stride");
+                    %(fail)s;
+                }
                 //fprintf(stderr, "Calling sgemm %%i %%i %%i %%i took %%f\\n", unit, Nz1, Nz0, Nx1, time_time() - t0);
         """
 
@@ -875,6 +883,8 @@ class GemmRelated(Op):
                 //sx_0, sx_1,
                 //sz_0, sz_1
                 //);
+                int unit_ok = 1;
+                %(begin_nogil)s
                 switch(unit)
                 {
                     case 0x000: dgemm_(&N, &N, &Nz1, &Nz0, &Nx1, &a, y,
@@ -893,10 +903,15 @@ class GemmRelated(Op):
                                        &sx_0, y, &sy_1, &b, z, &sz_1); break;
                     case 0x111: dgemm_(&N, &N, &Nz0, &Nz1, &Nx1, &a, x,
                                        &sx_1, y, &sy_1, &b, z, &sz_1); break;
-                    default: PyErr_SetString(PyExc_ValueError,
-                                             "some matrix has no unit stride");
-                             %(fail)s;
+                    default: unit_ok = 0;
                 };
+                %(end_nogil)s
+                if (!unit_ok)
+                {
+                    PyErr_SetString(PyExc_ValueError,
+                                    "some matrix has no unit stride");
+                    %(fail)s;
+                }
                 //fprintf(stderr, "Calling dgemm %%i %%i %%i %%i took %%f\\n",
                 //        unit, Nz1, Nz0, Nx1, time_time()- t0);
         """
@@ -929,7 +944,11 @@ class GemmRelated(Op):
             self.end_switch_typenum), '')
 
     def build_gemm_version(self):
-        return (13, blas_header_version())
+        return (14, blas_header_version())
+
+    def c_nogil(self, node):
+        # Only the call to the BLAS function is done without the GIL.
+        return True
 
 
 class Gemm(GemmRelated):
@@ -1182,6 +1201,8 @@ class Gemm(GemmRelated):
             return super(Gemm, self).c_code(node, name,
                                             (_z, _a, _x, _y, _b), (_zout, ),
                                             sub)
+        begin_nogil = sub.get('begin_nogil', '')
+        end_nogil = sub.get('end_nogil', '')
         full_code = self.build_gemm_call() % dict(locals(), **sub)
         return full_code
 
@@ -1551,6 +1572,7 @@ class GemmOptimizer(Optimizer):
 
     def add_requirements(self, fgraph):
         fgraph.attach_feature(toolbox.ReplaceValidate())
+        fgraph.attach_feature(toolbox.TopoOrder())
 
     def apply(self, fgraph):
         did_something = True
@@ -1577,7 +1599,7 @@ class GemmOptimizer(Optimizer):
         while did_something:
             nb_iter += 1
             t0 = time.time()
-            nodelist = theano.gof.graph.io_toposort(fgraph.inputs, fgraph.outputs)
+            nodelist = fgraph.topo_order.nodes()
             time_toposort += time.time() - t0
             did_something = False
             nodelist.reverse()
@@ -1737,6 +1759,8 @@ class Dot22(GemmRelated):
         if len(self.c_libraries()) <= 0:
             return super(Dot22, self).c_code(node, name, (_x, _y),
                                              (_zout, ), sub)
+        begin_nogil = sub.get('begin_nogil', '')
+        end_nogil = sub.get('end_nogil', '')
         full_code = self.build_gemm_call() % dict(locals(), **sub)
         return full_code
 
@@ -2003,6 +2027,8 @@ class Dot22Scalar(GemmRelated):
         if len(self.c_libraries()) <= 0:
             return super(Dot22Scalar, self).c_code(node, name, (_x, _y),
                                                    (_zout, ), sub)
+        begin_nogil = sub.get('begin_nogil', '')
+        end_nogil = sub.get('end_nogil', '')
         full_code = self.build_gemm_call() % dict(locals(), **sub)
         return full_code
 
@@ -27,12 +27,17 @@ class BaseBLAS(object):
     def c_support_code(self):
         return blas_header_text()
 
+    def c_nogil(self, node):
+        # Only the calls to the BLAS functions are done without the GIL.
+        return True
+
 
 # ##### ####### #######
 # GER
 # ##### ####### #######
 
-def ger_c_code(A, a, x, y, Z, destructive, fail):
+def ger_c_code(A, a, x, y, Z, destructive, fail,
+               begin_nogil='', end_nogil=''):
     return """
 
     int elemsize ;
@@ -255,18 +260,22 @@ def ger_c_code(A, a, x, y, Z, destructive, fail):
                 {
                     //fprintf(stderr, "A\\n");
                     float alpha = ((dtype_%(a)s*)PyArray_DATA(%(a)s))[0];
+                    %(begin_nogil)s
                     sger_(&Nz0, &Nz1, &alpha,
                         (float*)x_data, &Sx,
                         (float*)y_data, &Sy,
                         (float*)(PyArray_DATA(%(Z)s)), &Sz1);
+                    %(end_nogil)s
                 }
                 else if (PyArray_DESCR(%(Z)s)->type_num == NPY_DOUBLE)
                 {
                     double alpha = ((dtype_%(a)s*)PyArray_DATA(%(a)s))[0];
+                    %(begin_nogil)s
                     dger_(&Nz0, &Nz1, &alpha,
                         (double*)x_data, &Sx,
                         (double*)y_data, &Sy,
                         (double*)(PyArray_DATA(%(Z)s)), &Sz1);
+                    %(end_nogil)s
 
 
                 }
@@ -281,18 +290,22 @@ def ger_c_code(A, a, x, y, Z, destructive, fail):
                 if (PyArray_DESCR(%(Z)s)->type_num == NPY_FLOAT)
                 {
                     float alpha = ((dtype_%(a)s*)(PyArray_DATA(%(a)s)))[0];
+                    %(begin_nogil)s
                     sger_(&Nz1, &Nz0, &alpha,
                         (float*)y_data, &Sy,
                         (float*)x_data, &Sx,
                         (float*)(PyArray_DATA(%(Z)s)), &Sz0);
+                    %(end_nogil)s
                 }
                 else if (PyArray_DESCR(%(Z)s)->type_num == NPY_DOUBLE)
                 {
                     double alpha = ((dtype_%(a)s*)PyArray_DATA(%(a)s))[0];
+                    %(begin_nogil)s
                     dger_(&Nz1, &Nz0, &alpha,
                         (double*)y_data, &Sy,
                         (double*)x_data, &Sx,
                         (double*)(PyArray_DATA(%(Z)s)), &Sz0);
+                    %(end_nogil)s
                 }
                 else
                 {
@@ -320,11 +333,13 @@ class CGer(BaseBLAS, Ger):
         Z, = out
         code = ger_c_code(A, a, x, y, Z,
                           destructive=int(self.destructive),
-                          fail=sub['fail'])
+                          fail=sub['fail'],
+                          begin_nogil=sub.get('begin_nogil', ''),
+                          end_nogil=sub.get('end_nogil', ''))
         return code
 
     def c_code_cache_version(self):
-        return (10, blas_header_version())
+        return (11, blas_header_version())
 cger_inplace = CGer(True)
 cger_no_inplace = CGer(False)
 
@@ -354,7 +369,7 @@ def make_c_ger_destructive(node):
 
 
 def gemv_c_code(aa, xx, yy, zz, alpha, beta, destructive, fail,
-                force_init_beta=False):
+                force_init_beta=False, begin_nogil='', end_nogil=''):
     """
     zz <- beta * aa + alpha * dot(xx, yy)
 
@@ -574,22 +589,26 @@ def gemv_c_code(aa, xx, yy, zz, alpha, beta, destructive, fail,
                 {
                     //fprintf(stderr, "A\\n");
                     float alpha = ((dtype_%(alpha)s*)PyArray_DATA(%(alpha)s))[0];
+                    %(begin_nogil)s
                     sgemv_(&NOTRANS, &Nx0, &Nx1,
                         &alpha,
                         (float*)(PyArray_DATA(%(xx)s)), &Sx1,
                         (float*)yy_data, &Sy,
                         &fbeta,
                         (float*)zz_data, &Sz);
+                    %(end_nogil)s
                 }
                 else if (PyArray_DESCR(%(xx)s)->type_num == NPY_DOUBLE)
                 {
                     double alpha = ((dtype_%(alpha)s*)PyArray_DATA(%(alpha)s))[0];
+                    %(begin_nogil)s
                     dgemv_(&NOTRANS, &Nx0, &Nx1,
                         &alpha,
                         (double*)(PyArray_DATA(%(xx)s)), &Sx1,
                         (double*)yy_data, &Sy,
                         &dbeta,
                         (double*)zz_data, &Sz);
+                    %(end_nogil)s
                 }
                 else
                 {
@@ -609,18 +628,22 @@ def gemv_c_code(aa, xx, yy, zz, alpha, beta, destructive, fail,
                     // so Sx1 == 1 is required for safety.
                     if (Nx0 == 1 && Sx1 == 1)
                     {
+                        %(begin_nogil)s
                         zz_data[0] = fbeta*zz_data[0] + alpha*sdot_(&Nx1,
                             (float*)(PyArray_DATA(%(xx)s)), &Sx1,
                             (float*)yy_data, &Sy);
+                        %(end_nogil)s
                     }
                     else
                     {
+                        %(begin_nogil)s
                         sgemv_(&TRANS, &Nx1, &Nx0,
                             &alpha,
                             (float*)(PyArray_DATA(%(xx)s)), &Sx0,
                             (float*)yy_data, &Sy,
                             &fbeta,
                             (float*)zz_data, &Sz);
+                        %(end_nogil)s
                     }
                 }
                 else if (PyArray_DESCR(%(xx)s)->type_num == NPY_DOUBLE)
@@ -632,18 +655,22 @@ def gemv_c_code(aa, xx, yy, zz, alpha, beta, destructive, fail,
                     // so Sx1 == 1 is required for safety.
                     if (Nx0 == 1 && Sx1 == 1)
                     {
+                        %(begin_nogil)s
                         zz_data[0] = dbeta*zz_data[0] + alpha*ddot_(&Nx1,
                               (double*)(PyArray_DATA(%(xx)s)), &Sx1,
                               (double*)yy_data, &Sy);
+                        %(end_nogil)s
                     }
                     else
                     {
+                        %(begin_nogil)s
                         dgemv_(&TRANS, &Nx1, &Nx0,
                             &alpha,
                             (double*)(PyArray_DATA(%(xx)s)), &Sx0,
                             (double*)yy_data, &Sy,
                             &dbeta,
                             (double*)zz_data, &Sz);
+                        %(end_nogil)s
                     }
                 }
                 else
@@ -690,12 +717,14 @@ class CGemv(BaseBLAS, Gemv):
             aa, xx, yy, zz, alpha, beta,
             destructive=int(self.inplace),
             fail=sub['fail'],
-            force_init_beta=self.force_init_beta
+            force_init_beta=self.force_init_beta,
+            begin_nogil=sub.get('begin_nogil', ''),
+            end_nogil=sub.get('end_nogil', '')
         )
         return code
 
     def c_code_cache_version(self):
-        return (12, blas_header_version())
+        return (13, blas_header_version())
 cgemv_inplace = CGemv(inplace=True)
 cgemv_no_inplace = CGemv(inplace=False)
 
@@ -995,8 +995,18 @@ class Elemwise(OpenMPOp):
             # references to loop variables lv0, lv1, ...
             sub['lv%i' % i] = iname
 
-        decl = cgen.make_declare(orders, idtypes, sub)
-        checks = cgen.make_checks(orders, idtypes, sub)
+        # Static shapes of the (unique) inputs and of the outputs, if the
+        # CLinker gave them (see c_static_shapes).
+        input_shapes = sub.get('input_shapes')
+        output_shapes = sub.get('output_shapes')
+        if input_shapes is not None:
+            input_shapes = [input_shapes[node.inputs.index(input)]
+                            for input in inputs]
+        if output_shapes is None:
+            output_shapes = [None] * len(node.outputs)
+
+        decl = cgen.make_declare(orders, idtypes, sub, input_shapes)
+        checks = cgen.make_checks(orders, idtypes, sub, input_shapes)
 
         # Check if all inputs (except broadcasted scalar) are fortran.
         # In that case, create an fortran output ndarray.
@@ -1018,12 +1028,13 @@ class Elemwise(OpenMPOp):
             i += 1  # before this loop, i = number of inputs
             sub['lv%i' % i] = oname
             sub['olv'] = oname
+            oshapes = [output_shapes[node.outputs.index(output)]]
             alloc += cgen.make_declare([list(range(nnested))], [odtype],
-                                       dict(sub, lv0=oname))
+                                       dict(sub, lv0=oname), oshapes)
             alloc += cgen.make_alloc(orders, odtype, sub,
                                      fortran=alloc_fortran)
             alloc += cgen.make_checks([list(range(nnested))], [odtype],
-                                      dict(sub, lv0=oname))
+                                      dict(sub, lv0=oname), oshapes)
         olv_index = i  # index of the last output
 
         # We loop over the "aliased" outputs, i.e., those that are
@@ -1129,6 +1140,7 @@ class Elemwise(OpenMPOp):
             # Don't use the contig code for broadcasted scalar.
                 not all(node.outputs[0].broadcastable)):
             contig = None
+            size_cond = ""
             try:
                 contig = self.scalar_op.c_code_contiguous(
                     node,
@@ -1144,7 +1156,18 @@ class Elemwise(OpenMPOp):
                         all(io.broadcastable)
                         for io in node.inputs + node.outputs]):
                     z = onames[0]
-                    contig = """
+                    if output_shapes[0] is not None:
+                        # A constant number of iterations lets the compiler
+                        # unroll and vectorize the loop. The generic loop
+                        # handles the other sizes.
+                        size = int(numpy.prod(output_shapes[0]))
+                        size_cond = " && PyArray_SIZE(%s) == %d" % (z, size)
+                        contig = """
+                    // All output have the same size
+                    const npy_intp n = %(size)s;
+                    """ % locals()
+                    else:
+                        contig = """
                     // All output have the same size
                     npy_intp n = PyArray_SIZE(%(z)s);
                     """ % locals()
@@ -1179,12 +1202,17 @@ class Elemwise(OpenMPOp):
                                     for arr, var in z
                                     if not all(var.broadcastable)])
                 loop = """
-            if((%(cond1)s) || (%(cond2)s)){
+            if(((%(cond1)s) || (%(cond2)s))%(size_cond)s){
                 %(contig)s
             }else{
                 %(loop)s
             }
             """ % locals()
+        loop = """
+        %s
+        %s
+        %s
+        """ % (sub.get('begin_nogil', ''), loop, sub.get('end_nogil', ''))
         return decl, checks, alloc, loop
 
     def c_code(self, node, nodename, inames, onames, sub):
@@ -1208,8 +1236,20 @@ class Elemwise(OpenMPOp):
                                                            '_scalar_')
         return support_code
 
+    def c_nogil(self, node):
+        scalar_node = Apply(
+            self.scalar_op,
+            [get_scalar_type(dtype=input.type.dtype).make_variable()
+             for input in node.inputs],
+            [get_scalar_type(dtype=output.type.dtype).make_variable()
+             for output in node.outputs])
+        return self.scalar_op.c_nogil(scalar_node)
+
+    def c_static_shapes(self, node):
+        return True
+
     def c_code_cache_version_apply(self, node):
-        version = [12]  # the version corresponding to the c code in this Op
+        version = [14]  # the version corresponding to the c code in this Op
 
         # now we insert versions for the ops on which we depend...
         scalar_node = Apply(
@@ -1518,8 +1558,11 @@ class CAReduce(Op):
             # the output is the accumulator variable
             aname = oname
 
-        decl += cgen.make_declare([order], [idtype], sub)
-        checks = cgen.make_checks([order], [idtype], sub)
+        input_shapes = sub.get('input_shapes')
+        if input_shapes is not None:
+            input_shapes = input_shapes[:1]
+        decl += cgen.make_declare([order], [idtype], sub, input_shapes)
+        checks = cgen.make_checks([order], [idtype], sub, input_shapes)
 
         alloc = ""
         i += 1
@@ -1625,6 +1668,11 @@ for(int i=0;i<PyArray_NDIM(%(iname)s);i++){
         loop = cgen.make_loop_careduce(
             [order, list(range(nnested)) + ['x'] * len(axis)],
             [idtype, adtype], all_code, sub)
+        loop = """
+        %s
+        %s
+        %s
+        """ % (sub.get('begin_nogil', ''), loop, sub.get('end_nogil', ''))
 
         end = ""
         if adtype != odtype:
@@ -1643,8 +1691,20 @@ for(int i=0;i<PyArray_NDIM(%(iname)s);i++){
         # Sometimes, Elemwise's c_code is returned, so we need its headers
         return ['<vector>', '<algorithm>']
 
+    def c_nogil(self, node):
+        scalar_node = Apply(
+            self.scalar_op,
+            [get_scalar_type(dtype=input.type.dtype).make_variable()
+             for input in (node.inputs * 2)],
+            [get_scalar_type(dtype=output.type.dtype).make_variable()
+             for output in node.outputs])
+        return self.scalar_op.c_nogil(scalar_node)
+
+    def c_static_shapes(self, node):
+        return True
+
     def c_code_cache_version_apply(self, node):
-        version = (6,)  # the version corresponding to the c code in this Op
+        version = [8]  # the version corresponding to the c code in this Op
 
         # now we insert versions for the ops on which we depend...
         scalar_node = Apply(
@@ -2,10 +2,29 @@ from six.moves import xrange
 import theano
 
 
-def make_declare(loop_orders, dtypes, sub):
+def static_dim(shapes, i, index):
+    """
+    Return the static size of dimension `index` of the ith loop variable.
+
+    Returns None when `shapes` does not give it.
+
+    """
+    if shapes is None or shapes[i] is None:
+        return None
+    return shapes[i][index]
+
+
+def make_declare(loop_orders, dtypes, sub, shapes=None):
     """
     Produce code to declare all necessary variables.
 
+    Parameters
+    ----------
+    shapes : None or list
+        Optionally, the static shape (or None) of each loop variable. The
+        number of elements of the dimensions with a static size are
+        declared as constants. `make_checks` must get the same `shapes`.
+
     """
     decl = ""
     for i, (loop_order, dtype) in enumerate(zip(loop_orders, dtypes)):
@@ -21,8 +40,16 @@ def make_declare(loop_orders, dtypes, sub):
                 # the number of elements in that dimension,
                 # the stride in that dimension,
                 # and the jump from an iteration to the next
-                decl += """
+                size = static_dim(shapes, i, value)
+                if size is not None:
+                    decl += """
+                const npy_intp %(var)s_n%(value)i = %(size)i;
+                """ % locals()
+                else:
+                    decl += """
                 npy_intp %(var)s_n%(value)i;
+                """ % locals()
+                decl += """
                 ssize_t %(var)s_stride%(value)i;
                 int %(var)s_jump%(value)i_%(j)i;
                 """ % locals()
@@ -36,7 +63,7 @@ def make_declare(loop_orders, dtypes, sub):
     return decl
 
 
-def make_checks(loop_orders, dtypes, sub):
+def make_checks(loop_orders, dtypes, sub, shapes=None):
     init = ""
     for i, (loop_order, dtype) in enumerate(zip(loop_orders, dtypes)):
         var = "%%(lv%i)s" % i
@@ -67,8 +94,21 @@ def make_checks(loop_orders, dtypes, sub):
                 # Initialize the variables associated to the jth loop
                 # jump = stride - adjust
                 jump = "(%s) - (%s)" % ("%(var)s_stride%(index)s" % locals(), adjust)
-                init += """
+                size = static_dim(shapes, i, index)
+                if size is not None:
+                    # The size was declared as a constant by make_declare
+                    init += """
+                if (PyArray_DIMS(%(var)s)[%(index)s] != %(size)s) {
+                    PyErr_SetString(PyExc_ValueError,
+                        "Input shape differs from the static shape.");
+                    %%(fail)s
+                }
+                """ % locals()
+                else:
+                    init += """
                 %(var)s_n%(index)s = PyArray_DIMS(%(var)s)[%(index)s];
+                """ % locals()
+                init += """
                 %(var)s_stride%(index)s = PyArray_STRIDES(%(var)s)[%(index)s] / sizeof(%(dtype)s);
                 %(var)s_jump%(index)s_%(j)s = %(jump)s;
                 //printf("%(var)s_jump%(index)s_%(j)s is:");
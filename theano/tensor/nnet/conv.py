@@ -1011,8 +1011,12 @@ class ConvOp(OpenMPOp):
     def c_headers(self):
         return ['<numpy/noprefix.h>', '<iostream>', '<sstream>']
 
+    def c_nogil(self, node):
+        # The convolution loops only use the data pointers of the arrays.
+        return True
+
     def c_code_cache_version(self):
-        return (15, self.openmp, blas.blas_header_version())
+        return (16, self.openmp, blas.blas_header_version())
 
     def c_support_code(self):
         return """
@@ -1084,6 +1088,8 @@ using namespace std;
         assert node.inputs[0].type.dtype == node.inputs[1].type.dtype
         d = locals()
         d.update(sub)
+        d.setdefault('begin_nogil', '')
+        d.setdefault('end_nogil', '')
 
         all_shape = (self.has_all_shape(self.imshp, self.kshp,
                                         self.nkern, self.bsize) and
@@ -1338,6 +1344,55 @@ if(kerns_dim[1] != img2d_dim[1]){
             return _conv_op_code_a % d
 
 
+@theano.gof.local_optimizer([ConvOp])
+def local_conv_static_shapes(node):
+    """
+    Give to a ConvOp the shapes of its inputs when they are constant.
+
+    This is what conv2d does when image_shape and filter_shape are given,
+    so the C code gets unrolled for these shapes.
+
+    """
+    op = node.op
+    if (not isinstance(op, ConvOp) or
+            op.has_all_shape(op.imshp, op.kshp, op.nkern, op.bsize) or
+            op.imshp_logical != op.imshp or op.kshp_logical != op.kshp):
+        return
+    try:
+        shape_of = node.fgraph.shape_feature.shape_of
+    except AttributeError:
+        return
+    try:
+        image_shape = [int(get_scalar_constant_value(s))
+                       for s in shape_of[node.inputs[0]]]
+        filter_shape = [int(get_scalar_constant_value(s))
+                        for s in shape_of[node.inputs[1]]]
+    except NotScalarConstantError:
+        return
+    given = list(op.imshp) + list(op.kshp) + [op.bsize, op.nkern]
+    static = image_shape[1:] + filter_shape[2:] + [image_shape[0],
+                                                   filter_shape[0]]
+    if any(g is not None and g != s for g, s in zip(given, static)):
+        # The shape will not match at run time, keep the error there.
+        return
+    new_op = ConvOp(imshp=image_shape[1:], kshp=filter_shape[2:],
+                    nkern=filter_shape[0], bsize=image_shape[0],
+                    dx=op.dx, dy=op.dy, output_mode=op.out_mode,
+                    version=(op.version if getattr(op, "fft_opt", True)
+                             else "no_fft"),
+                    direction_hint=op.direction_hint, openmp=op.openmp)
+    out = new_op(*node.inputs)
+    # The output can get more broadcastable dimensions.
+    return [patternbroadcast(out, node.outputs[0].broadcastable)]
+
+# Disabled by default, see the specialize_shapes parameter of
+# theano.function.
+theano.compile.optdb['specialize'].register('local_conv_static_shapes',
+                                            local_conv_static_shapes,
+                                            'specialize_shapes',
+                                            use_db_name_as_tag=False)
+
+
 _conv_op_code_a = """
 const int mode=%(mode)s;
 int typenum=0, typenum_f=0;
@@ -1487,6 +1542,7 @@ if (!PyArray_ISCONTIGUOUS(%(z)s))
     %(fail)s;
 }
 
+%(begin_nogil)s
 for(int b=0;b< %(self_bsize)s;b++){
   for(int n_kern=0;n_kern<%(self_nkern)s;n_kern++){
 
@@ -1606,6 +1662,7 @@ for(int b=0;b< %(self_bsize)s;b++){
     }
   }//for n_kern
 }//for b
+%(end_nogil)s
 Py_XDECREF(img2d);
 Py_XDECREF(filtersflipped);
 """
@@ -1756,6 +1813,7 @@ for(int i=0;i < kerns_dim[0];++i){
     }
 }
 
+%(begin_nogil)s
 //std::cerr << "-----new loop ----\\n";
 for(int b=0;b< %(self_bsize)s;b++){
     for (int img_col = 0; img_col < Os[1]; ++img_col){
@@ -1819,19 +1877,13 @@ for(int b=0;b< %(self_bsize)s;b++){
             for (int img_row = 0; img_row < Os[0]; ++img_row) {
                 for (int kernel_idx = 0; kernel_idx < NKERN; ++kernel_idx) {
                     %(type)s * z_p =  (%(type)s *)PyArray_GETPTR4(%(z)s, b, kernel_idx, img_row, img_col);
-                    if (0)
-                    {
-                        if (b >= PyArray_DIMS(%(z)s)[0]) %(fail)s;
-                        if (kernel_idx >= PyArray_DIMS(%(z)s)[1]) %(fail)s;
-                        if (img_row >= PyArray_DIMS(%(z)s)[2]) %(fail)s;
-                        if (img_col >= PyArray_DIMS(%(z)s)[3]) %(fail)s;
-                    }
                     z_p[0] += kbuf[img_row * kbufstride + kernel_idx];
                 }
             }
         }
     }
 }
+%(end_nogil)s
 free(kbuf);
 }
 Py_XDECREF(img2d);
@@ -2010,6 +2062,7 @@ if (!PyArray_ISCONTIGUOUS(%(z)s))
     %(fail)s;
 }
 
+%(begin_nogil)s
 for(int b=0;b< %(self_bsize)s ;b+=%(unroll_bsize)s){
   for(int n_kern=0;n_kern<%(self_nkern)s;n_kern+=%(unroll_ksize)s){
 
@@ -2109,9 +2162,10 @@ for(int b=0;b< %(self_bsize)s ;b+=%(unroll_bsize)s){
     }//for stack_size
   }//for n_kern
 }//for b
+%(end_nogil)s
 Py_XDECREF(img2d);
 Py_XDECREF(filtersflipped);
-"""
+""" % d
     return ret
 
 _conv_op_code_unroll_patch = """
@@ -2251,6 +2305,7 @@ if (!PyArray_ISCONTIGUOUS(%(z)s))
     %(fail)s;
 }
 
+%(begin_nogil)s
 //The if on the number of loop make a speed up for small array.
 //with g++ 4.5.1. The compiler should be smart enough to do this himself!
 #pragma omp parallel for schedule(static) if(%(self_bsize)s * %(self_nkern)s > 1)
@@ -2388,6 +2443,7 @@ for(int batch_kern_idx=0;
       }//for iter_m
     }//for stack_size
 }//for b and n_kern
+%(end_nogil)s
 
 Py_XDECREF(img2d);
 Py_XDECREF(filtersflipped);
@@ -22,7 +22,7 @@ from theano import gof
 from theano.compat import izip
 from six import integer_types, iteritems
 from six.moves import reduce
-from theano.gof import opt, InconsistencyError, TopoOptimizer, graph
+from theano.gof import opt, InconsistencyError, TopoOptimizer
 from theano.gof import Variable, Constant
 from theano.gof.utils import MethodNotDefined
 from theano.gradient import DisconnectedType
@@ -296,7 +296,8 @@ def inplace_elemwise_optimizer_op(OP):
         else:
             update_outs = []
 
-        for node in list(graph.io_toposort(fgraph.inputs, fgraph.outputs)):
+        fgraph.attach_feature(toolbox.TopoOrder())
+        for node in fgraph.topo_order.nodes():
             op = node.op
             # gpuarray GpuElemwise inherit from Elemwise
             if not type(op) == OP:
@@ -1412,6 +1413,42 @@ theano.compile.mode.optdb.register('ShapeOpt', ShapeOptimizer(),
                                    0.1, 'fast_run', 'fast_compile')
 
 
+class StaticShapeOptimizer(Optimizer):
+    """
+    Optimizer that records the constant shapes known to the ShapeFeature.
+
+    The shape of each variable whose dimensions are all constant is stored
+    in its `tag.static_shape`. The C code of the Ops that implement
+    `c_static_shapes` is then specialized for these shapes.
+
+    It must run after the optimizations that replace nodes, as the new
+    variables do not inherit the tag.
+
+    """
+    def add_requirements(self, fgraph):
+        # ShapeOpt already attached it in the modes that include fast_run.
+        if not hasattr(fgraph, 'shape_feature'):
+            fgraph.attach_feature(ShapeFeature())
+
+    def apply(self, fgraph):
+        shape_of = fgraph.shape_feature.shape_of
+        for var in fgraph.variables:
+            shape = shape_of.get(var)
+            if shape is None:
+                continue
+            try:
+                static_shape = tuple(int(get_scalar_constant_value(s))
+                                     for s in shape)
+            except NotScalarConstantError:
+                continue
+            var.tag.static_shape = static_shape
+
+# Disabled by default, the shapes are only constant when the inputs have a
+# specified shape, see the specialize_shapes parameter of theano.function.
+theano.compile.mode.optdb.register('static_shapes', StaticShapeOptimizer(),
+                                   99.5, 'specialize_shapes')
+
+
 @gof.local_optimizer([T.Elemwise])
 def local_fill_sink(node):
     """
@@ -6330,6 +6367,7 @@ class FusionOptimizer(Optimizer):
 
     def add_requirements(self, fgraph):
         fgraph.attach_feature(toolbox.ReplaceValidate())
+        fgraph.attach_feature(toolbox.TopoOrder())
 
     def apply(self, fgraph):
         did_something = True
@@ -6343,7 +6381,7 @@ class FusionOptimizer(Optimizer):
             callback_before = fgraph.execute_callbacks_time
         while did_something:
             t0 = time.time()
-            nodelist = list(fgraph.toposort())
+            nodelist = fgraph.topo_order.nodes()
             time_toposort += time.time() - t0
             nodelist.reverse()
             did_something = False